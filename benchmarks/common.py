@@ -0,0 +1,109 @@
+import json
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, List, Dict, Optional
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    seconds: float  # best of the repeats
+    records: int
+    bytes: int
+    peak_rss: Optional[int] = None  # bytes, for benchmarks run in a separate process
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds > 0 else float('inf')
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / self.seconds / 1e6 if self.seconds > 0 else float('inf')
+
+    def to_dict(self) -> Dict:
+        return dict(asdict(self), records_per_second=self.records_per_second, mb_per_second=self.mb_per_second)
+
+
+def measure(name: str, func: Callable[[], None], records: int, size: int, repeat: int = 3) -> BenchmarkResult:
+    """
+    Best wall time of repeated calls of func, processing given number of records and bytes each time
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return BenchmarkResult(name, best, records, size)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(**params) -> Dict:
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'params': params,
+    }
+
+
+def save_results(file: Path, meta: Dict, results: List[BenchmarkResult]):
+    with open(file, 'wt', encoding='utf-8') as f:
+        json.dump({'metadata': meta, 'results': [r.to_dict() for r in results]}, f, indent=2)
+
+
+def load_results(file: Path) -> Dict[str, Dict]:
+    with open(file, 'rt', encoding='utf-8') as f:
+        return {r['name']: r for r in json.load(f)['results']}
+
+
+def print_results(results: List[BenchmarkResult], header: bool = True):
+    if header:
+        print(f'{"benchmark":<24}{"seconds":>10}{"records/s":>14}{"MB/s":>10}{"peak RSS MB":>14}')
+    for r in results:
+        peak_rss = f'{r.peak_rss / 1e6:.1f}' if r.peak_rss is not None else '-'
+        print(f'{r.name:<24}{r.seconds:>10.4f}{r.records_per_second:>14.0f}{r.mb_per_second:>10.1f}{peak_rss:>14}')
+
+
+def print_comparison(baseline: Dict[str, Dict], current: Dict[str, Dict]):
+    """
+    Speedup of the current results over the baseline, >1 is faster
+    """
+    def rss_ratio(b, r):
+        if b.get('peak_rss') and r.get('peak_rss'):
+            return f'{r["peak_rss"] / b["peak_rss"]:.2f}x'
+        return '-'
+
+    print(f'{"benchmark":<24}{"baseline s":>12}{"current s":>12}{"speedup":>10}{"RSS ratio":>12}')
+    for name, r in current.items():
+        if name in baseline:
+            b = baseline[name]
+            speedup = b['seconds'] / r['seconds'] if r['seconds'] > 0 else float('inf')
+            print(f'{name:<24}{b["seconds"]:>12.4f}{r["seconds"]:>12.4f}{speedup:>9.2f}x{rss_ratio(b, r):>12}')
+        else:
+            print(f'{name:<24}{"-":>12}{r["seconds"]:>12.4f}{"-":>10}{"-":>12}')
+
+
+def compare_main():
+    """
+    python -m benchmarks.common BASELINE CURRENT
+    """
+    if len(sys.argv) != 3:
+        print(compare_main.__doc__.strip(), file=sys.stderr)
+        sys.exit(2)
+    print_comparison(load_results(Path(sys.argv[1])), load_results(Path(sys.argv[2])))
+
+
+if __name__ == '__main__':
+    compare_main()
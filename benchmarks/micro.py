@@ -0,0 +1,131 @@
+import argparse
+import dataclasses
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Callable, Dict
+
+from benchmarks.common import BenchmarkResult, measure, metadata, save_results, load_results, print_results, \
+    print_comparison
+from benchmarks.synthetic import synthetic_records, modified_records, write_tree
+from hashdiff.fileio import FileOutputSink, InputSource, CompressionType
+from hashdiff.hcmp.compare import changes
+from hashdiff.hsnap.hash import file_sha512, READ_BUFFERS
+from hashdiff.hsnap.walk import scan_paths_for_files
+from hashdiff.humanizer import parse_size
+from hashdiff.normalize import NormalizePaths, PathNormalizer
+from hashdiff.serialize import serialize, deserialize
+
+
+def benchmarks(tmp: Path, n_records: int, n_files: int,
+               hash_size: int) -> Dict[str, Callable[[int], BenchmarkResult]]:
+    """
+    Benchmark name -> function preparing the data and measuring, given the repeat count
+    """
+
+    def walk(repeat):
+        root = tmp / 'tree'
+        write_tree(root, n_files)
+        return measure('walk', lambda: list(scan_paths_for_files([root])), n_files, 0, repeat)
+
+    def sha512(name, buffers):
+        def benchmark(repeat):
+            file = tmp / 'hashed'
+            if not file.exists():
+                with open(file, 'wb') as f:
+                    f.write(os.urandom(hash_size))
+            return measure(name, lambda: file_sha512(file, buffers=buffers), 1, hash_size, repeat)
+        return benchmark
+
+    def serialize_(repeat):
+        records = list(synthetic_records(n_records))
+        size = sum(len(serialize(r)) + 1 for r in records)
+        return measure('serialize', lambda: [serialize(r) for r in records], n_records, size, repeat)
+
+    def deserialize_(repeat):
+        lines = [serialize(r) + '\n' for r in synthetic_records(n_records)]
+        size = sum(len(line) for line in lines)
+        return measure('deserialize', lambda: [deserialize(line) for line in lines], n_records, size, repeat)
+
+    def input_source(name, file_name, compression):
+        def benchmark(repeat):
+            file = tmp / file_name
+            with FileOutputSink(file, compression=compression) as sink:
+                for r in synthetic_records(n_records):
+                    sink.write(r)
+
+            def read():
+                with InputSource(file) as records:
+                    for _ in records:
+                        pass
+            return measure(name, read, n_records, file.stat().st_size, repeat)
+        return benchmark
+
+    def normalize(name, windows):
+        def benchmark(repeat):
+            records = list(synthetic_records(n_records))
+            if windows:
+                records = [dataclasses.replace(r, path='C:\\' + r.path.replace('/', '\\')) for r in records]
+
+            def run():
+                normalizer = PathNormalizer(NormalizePaths.POSIX)  # cache of directories included
+                for r in records:
+                    normalizer.record(r)
+            return measure(name, run, n_records, 0, repeat)
+        return benchmark
+
+    def compare(repeat):
+        previous = list(synthetic_records(n_records))
+        current = list(modified_records(previous))
+        return measure('changes', lambda: changes(previous, current), n_records, 0, repeat)
+
+    return {
+        'walk': walk,
+        'sha512': sha512('sha512', buffers=0),
+        'sha512_pipelined': sha512('sha512_pipelined', buffers=READ_BUFFERS),
+        'serialize': serialize_,
+        'deserialize': deserialize_,
+        'input_source_text': input_source('input_source_text', 'records.hsn', CompressionType.none),
+        'input_source_gzip': input_source('input_source_gzip', 'records.hsn.gz', CompressionType.GZIP),
+        'normalize_posix': normalize('normalize_posix', windows=False),
+        'normalize_windows': normalize('normalize_windows', windows=True),
+        'changes': compare,
+    }
+
+
+def run(n_records: int = 100000, n_files: int = 2000, hash_size: int = 64 * 2 ** 20, repeat: int = 3,
+        only: List[str] = ()) -> List[BenchmarkResult]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix='hashdiff-bench-') as tmp:
+        for name, benchmark in benchmarks(Path(tmp), n_records, n_files, hash_size).items():
+            if not only or name in only:
+                results.append(benchmark(repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.micro', description='Micro-benchmarks of hashdiff stages')
+    parser.add_argument('--records', help='number of records, default: %(default)s', type=int, default=100000)
+    parser.add_argument('--files', help='number of files for the walk, default: %(default)s', type=int, default=2000)
+    parser.add_argument('--hash-size', help='size of the hashed file, default: %(default)s', type=parse_size,
+                        default='64M')
+    parser.add_argument('--repeat', help='repeats of each benchmark, best is taken, default: %(default)s', type=int,
+                        default=3)
+    parser.add_argument('--only', help='run just the given benchmark, can be repeated', action='append', default=[])
+    parser.add_argument('--output', '-o', help='save results into a JSON file', type=Path)
+    parser.add_argument('--baseline', help='compare with results saved before', type=Path)
+    args = parser.parse_args()
+
+    results = run(args.records, args.files, args.hash_size, args.repeat, args.only)
+    print_results(results)
+
+    if args.output:
+        save_results(args.output, metadata(records=args.records, files=args.files, hash_size=args.hash_size,
+                                           repeat=args.repeat), results)
+    if args.baseline:
+        print()
+        print_comparison(load_results(args.baseline), {r.name: r.to_dict() for r in results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from benchmarks.common import BenchmarkResult, metadata, save_results, load_results, print_results, \
+    print_comparison
+from benchmarks.synthetic import write_snapshot_pair, write_tree
+
+DEFAULT_SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+DEFAULT_MAX_TREE_FILES = 10 ** 5  # real files on disk for hsnap
+
+
+def _wait(process: subprocess.Popen) -> Optional[int]:
+    """
+    Waits for the process to finish, sets its returncode
+    :return: peak RSS of the process in bytes, None where os.wait4 is not available (Windows)
+    """
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    return rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+
+
+def run_process(name: str, args: List[str], records: int, size: int) -> BenchmarkResult:
+    """
+    Wall time and peak RSS of a python -m <args> process
+    """
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-m'] + args, stdout=subprocess.DEVNULL, stderr=stderr)
+        peak_rss = _wait(process)
+        seconds = time.perf_counter() - start
+        if process.returncode not in (0, 1):
+            stderr.seek(0)
+            raise RuntimeError(f'{" ".join(args)} failed with {process.returncode}: '
+                               f'{stderr.read().decode(errors="replace")}')
+    return BenchmarkResult(name, seconds, records, size, peak_rss)
+
+
+def commands(tmp: Path, n: int, max_tree_files: int) -> Dict[str, List[str]]:
+    """
+    Name -> python -m arguments of the benchmarked commands, their input data is generated first
+    """
+    previous, current = tmp / 'previous.hsn', tmp / 'current.hsn'
+    write_snapshot_pair(previous, current, n)
+    result = {
+        'hcmp': ['hashdiff.hcmp', str(previous), str(current)],
+        'hstool_du': ['hashdiff.hstool', 'du', '-i', str(previous), '-d', '1'],
+        'hstool_dedup': ['hashdiff.hstool', 'dedup', '-i', str(previous), '-n', '10'],
+    }
+    if n <= max_tree_files:
+        write_tree(tmp / 'tree', n)
+        result['hsnap'] = ['hashdiff.hsnap', '-f', str(tmp / 'snapshot.hsn'), str(tmp / 'tree')]
+    return result
+
+
+def run(sizes: List[int], max_tree_files: int = DEFAULT_MAX_TREE_FILES, only: List[str] = (),
+        tmp_dir: Path = None) -> List[BenchmarkResult]:
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory(dir=tmp_dir, prefix='hashdiff-scaling-') as tmp:
+            tmp = Path(tmp)
+            for name, args in commands(tmp, n, max_tree_files).items():
+                if not only or name in only:
+                    input_size = (tmp / 'previous.hsn').stat().st_size if name != 'hsnap' else 0
+                    results.append(run_process(f'{name}@{n}', args, n, input_size))
+                    print_results(results[-1:], header=len(results) == 1)
+            shutil.rmtree(tmp / 'tree', ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.scaling',
+                                     description='End-to-end scaling benchmarks of hsnap, hcmp and hstool on synthetic '
+                                                 'data, reporting wall time and peak RSS of each run')
+    parser.add_argument('--sizes', help='comma separated numbers of records, default: %(default)s',
+                        default=','.join(map(str, DEFAULT_SIZES)))
+    parser.add_argument('--max-tree-files', help='largest number of real files created for hsnap, '
+                                                 'default: %(default)s', type=int, default=DEFAULT_MAX_TREE_FILES)
+    parser.add_argument('--only', help='run just the given command (hsnap, hcmp, hstool_du, hstool_dedup), can be '
+                                       'repeated', action='append', default=[])
+    parser.add_argument('--tmp-dir', help='directory for the generated data', type=Path)
+    parser.add_argument('--output', '-o', help='save results into a JSON file', type=Path)
+    parser.add_argument('--baseline', help='compare with results saved before', type=Path)
+    args = parser.parse_args()
+
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+    results = run(sizes, args.max_tree_files, args.only, args.tmp_dir)
+    print()
+    print_results(results)
+
+    if args.output:
+        save_results(args.output, metadata(sizes=sizes, max_tree_files=args.max_tree_files), results)
+    if args.baseline:
+        print()
+        print_comparison(load_results(args.baseline), {r.name: r.to_dict() for r in results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+from benchmarks.common import BenchmarkResult, metadata, save_results, load_results, print_results, \
+    print_comparison
+from benchmarks.synthetic import synthetic_records, write_snapshot
+
+TOOL_MODULES = ['hashdiff.hsnap.hsnap', 'hashdiff.hcmp.hcmp', 'hashdiff.hstool.hstool']
+
+
+def commands(tmp: Path, n: int) -> Dict[str, List[str]]:
+    """
+    Name -> python arguments of small invocations, dominated by interpreter startup and imports
+    """
+    snapshot = tmp / 'small.hsn'
+    write_snapshot(snapshot, synthetic_records(n))
+    return {
+        'python': ['-c', 'pass'],  # baseline, interpreter startup only
+        'hstool_ls': ['-m', 'hashdiff.hstool', 'ls', '-i', str(snapshot)],
+        'hstool_filter': ['-m', 'hashdiff.hstool', 'filter', '-i', str(snapshot), '-p', 'nothing-matches'],
+        'hcmp': ['-m', 'hashdiff.hcmp', str(snapshot), str(snapshot)],
+    }
+
+
+def run_command(name: str, args: List[str], repeat: int) -> BenchmarkResult:
+    """
+    Median wall time of the python process, median rather than best as startup is noisy
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return BenchmarkResult(name, statistics.median(times), 0, 0)
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self us, cumulative us) of all modules imported by importing the module, as reported by -X importtime
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    result = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        result.append((name.strip(), int(self_us), int(cumulative_us)))
+    return result
+
+
+def run_imports(repeat: int, top: int = 0) -> List[BenchmarkResult]:
+    """
+    Median cumulative import time of the tool modules, optionally printing their slowest imports
+    """
+    results = []
+    for module in TOOL_MODULES:
+        runs = [import_times(module) for _ in range(repeat)]
+        cumulative = statistics.median(next(c for name, _, c in times if name == module) for times in runs)
+        results.append(BenchmarkResult(f'import {module.rsplit(".", 1)[-1]}', cumulative / 1e6, 0, 0))
+        if top:
+            print(f'Slowest imports of {module} (cumulative us):')
+            for name, _, cumulative_us in sorted(runs[-1], key=lambda t: -t[2])[1:top + 1]:
+                print(f'{cumulative_us:>10}  {name.strip()}')
+    return results
+
+
+def run(repeat: int = 10, records: int = 100, only: List[str] = (), top: int = 0) -> List[BenchmarkResult]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix='hashdiff-startup-') as tmp:
+        for name, args in commands(Path(tmp), records).items():
+            if not only or name in only:
+                results.append(run_command(name, args, repeat))
+    if not only or 'imports' in only:
+        results.extend(run_imports(repeat, top))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.startup',
+                                     description='Startup time of small hstool and hcmp invocations and import time '
+                                                 'of the tools (python -X importtime), median of the repeats')
+    parser.add_argument('--repeat', help='runs of each command, default: %(default)s', type=int, default=10)
+    parser.add_argument('--records', help='records of the snapshot used, default: %(default)s', type=int, default=100)
+    parser.add_argument('--only', help='run just the given benchmark (python, hstool_ls, hstool_filter, hcmp, '
+                                       'imports), can be repeated', action='append', default=[])
+    parser.add_argument('--top', help='print the N slowest imports of each tool', type=int, default=0, metavar='N')
+    parser.add_argument('--output', '-o', help='save results into a JSON file', type=Path)
+    parser.add_argument('--baseline', help='compare with results saved before', type=Path)
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.records, args.only, args.top)
+    print_results(results)
+
+    if args.output:
+        save_results(args.output, metadata(repeat=args.repeat, records=args.records), results)
+    if args.baseline:
+        print()
+        print_comparison(load_results(args.baseline), {r.name: r.to_dict() for r in results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import os
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Iterable
+
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import FileOutputSink, input_file_type_heuristic
+
+
+def _digest(seed: int, content: int) -> bytes:
+    return hashlib.sha512(f'{seed}:{content}'.encode('ascii')).digest()
+
+
+def _path(i: int, files_per_dir: int, dirs_per_dir: int) -> str:
+    """
+    Path of i-th file, directories numbered in base dirs_per_dir, so that depth grows with the number of files
+    """
+    directory = i // files_per_dir
+    parts = []
+    while True:
+        parts.append(f'd{directory % dirs_per_dir}')
+        directory = directory // dirs_per_dir
+        if directory == 0:
+            break
+    return os.path.join(*reversed(parts), f'f{i}.dat')
+
+
+def synthetic_records(n: int, seed: int = 0, files_per_dir: int = 20, dirs_per_dir: int = 10,
+                      duplicate_rate: float = 0.05, max_size: int = 1 << 24) -> Iterator[HsnapRecord]:
+    """
+    Deterministic stream of n records, constant memory. Sizes are log-uniform up to max_size, a fraction of the files
+    are copies of earlier ones.
+    """
+    rng = random.Random(seed)
+    originals = []  # (content, size) of files that may be copied, a bounded sample
+    for i in range(n):
+        if originals and rng.random() < duplicate_rate:
+            content, size = rng.choice(originals)
+        else:
+            content = i
+            size = int(2 ** (rng.random() * max_size.bit_length())) - 1
+            if len(originals) < 1024:
+                originals.append((content, size))
+        yield HsnapRecord(path=_path(i, files_per_dir, dirs_per_dir), size=size, mtime=1500000000.0 + i,
+                          digest=_digest(seed, content))
+
+
+@dataclass
+class ChangeRates:
+    """
+    Fractions of the previous records changed in the current snapshot
+    """
+    add: float = 0.01  # new files
+    delete: float = 0.01
+    move: float = 0.01  # same file, different path
+    copy: float = 0.01  # the file kept and a copy added
+    change: float = 0.01  # same path, different content
+
+
+def modified_records(records: Iterable[HsnapRecord], rates: ChangeRates = ChangeRates(),
+                     seed: int = 1) -> Iterator[HsnapRecord]:
+    """
+    The records with random changes applied, streaming
+    """
+    rng = random.Random(seed)
+    thresholds = []
+    for rate in (rates.delete, rates.move, rates.copy, rates.change, rates.add):
+        thresholds.append((thresholds[-1] if thresholds else 0) + rate)
+    delete, move, copy, change, add = thresholds
+
+    for i, r in enumerate(records):
+        x = rng.random()
+        if x < delete:
+            continue
+        elif x < move:
+            yield HsnapRecord(r.path + '.moved', r.size, r.mtime, r.digest)
+        elif x < copy:
+            yield r
+            yield HsnapRecord(r.path + '.copy', r.size, r.mtime + 1, r.digest)
+        elif x < change:
+            yield HsnapRecord(r.path, r.size, r.mtime + 1, _digest(seed, -i - 1))
+        elif x < add:
+            yield r
+            yield HsnapRecord(r.path + '.new', r.size, r.mtime + 1, _digest(seed, -i - 1))
+        else:
+            yield r
+
+
+def write_snapshot(file: Path, records: Iterable[HsnapRecord]):
+    binary_pickle, compression = input_file_type_heuristic(file)
+    with FileOutputSink(file, binary_pickle=binary_pickle, compression=compression) as sink:
+        for r in records:
+            sink.write(r)
+
+
+def write_snapshot_pair(previous: Path, current: Path, n: int, seed: int = 0, rates: ChangeRates = ChangeRates()):
+    """
+    Previous snapshot of n records and current one derived from it with the given rates of changes
+    """
+    write_snapshot(previous, synthetic_records(n, seed))
+    write_snapshot(current, modified_records(synthetic_records(n, seed), rates, seed + 1))
+
+
+def write_tree(root: Path, n: int, seed: int = 0, max_size: int = 1 << 12):
+    """
+    Directory tree of n files, with contents of the given sizes, copies having the same contents
+    """
+    for r in synthetic_records(n, seed, max_size=max_size):
+        file = root / r.path
+        file.parent.mkdir(parents=True, exist_ok=True)
+        block = r.digest * (r.size // len(r.digest) + 1)
+        file.write_bytes(block[:r.size])
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.synthetic', description='Synthetic hashdiff test data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    tree = commands.add_parser('tree', help='directory tree of files')
+    tree.add_argument('ROOT', type=Path)
+    tree.add_argument('--max-size', help='maximal file size, default: %(default)s', type=int, default=1 << 12)
+
+    pair = commands.add_parser('pair', help='previous and current snapshot')
+    pair.add_argument('PREVIOUS', type=Path)
+    pair.add_argument('CURRENT', type=Path)
+    for name, default in vars(ChangeRates()).items():
+        pair.add_argument(f'--{name}-rate', help=f'default: {default}', type=float, default=default, dest=name)
+
+    for command in (tree, pair):
+        command.add_argument('-n', help='number of files, default: %(default)s', type=int, default=10000)
+        command.add_argument('--seed', help='default: %(default)s', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'tree':
+        write_tree(args.ROOT, args.n, args.seed, args.max_size)
+    else:
+        rates = ChangeRates(**{name: getattr(args, name) for name in vars(ChangeRates())})
+        write_snapshot_pair(args.PREVIOUS, args.CURRENT, args.n, args.seed, rates)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,41 @@
-import bz2
-import gzip
 import logging
-import lzma
-import pickle
 import sys
 from abc import ABC, abstractmethod
 from contextlib import ExitStack
 from enum import Enum
 from io import TextIOWrapper
 from pathlib import Path
-from typing import Optional, List
+from typing import Callable, Optional, List, Iterable
 
 from hashdiff.common import HsnapRecord
 from hashdiff.serialize import serialize, deserialize
-from hashdiff.normalize import NormalizePaths, normalize_hsnap_record
+from hashdiff.normalize import NormalizePaths, PathNormalizer
+from hashdiff.merkle import is_directory_record, normalize_directory_record, DIRECTORY_MARKER
+from hashdiff.profiling import profiler, stage, timed_iter, timed_call
+from hashdiff.memory import budget
+from hashdiff.pathstore import PathStore
 
 log = logging.getLogger(__name__)
 
+# codecs and pickle are imported only when needed, most runs use just one of them and short runs (e.g. hstool ls on
+# a plain text file) would spend a large part of their time importing them
+
+
+def _codec_open(compression: 'CompressionType'):
+    """
+    The open() function of the compression module
+    """
+    if compression == CompressionType.XZ:
+        import lzma
+        return lzma.open
+    elif compression == CompressionType.BZIP2:
+        import bz2
+        return bz2.open
+    elif compression == CompressionType.GZIP:
+        import gzip
+        return gzip.open
+    return open
+
 
 class CompressionType(Enum):
     XZ = 1
@@ -27,15 +46,8 @@ class CompressionType(Enum):
 
 def opener_based_on_compression_flag(compress):
     if compress is None:
-        opener = open
-    else:
-        opener = {
-            CompressionType.XZ: lzma.open,
-            CompressionType.BZIP2: bz2.open,
-            CompressionType.GZIP: gzip.open,
-            CompressionType.none: open
-        }[compress]
-    return opener
+        return open
+    return _codec_open(CompressionType(compress))
 
 
 def input_file_type_heuristic(path: Path):
@@ -58,23 +70,45 @@ def input_file_type_heuristic(path: Path):
     return binary_pickle, compression
 
 
-def read_input_file(file: Path, **kwargs) -> List[HsnapRecord]:
+def read_input_file(file: Path, path_store: Optional[PathStore] = None,
+                    skip: Optional[Callable[[str], bool]] = None, **kwargs) -> List[HsnapRecord]:
+    """
+    :param path_store: store the records into the path store, returning compact StoredRecords
+    :param skip: records with paths it is true for are dropped while reading, never held in memory
+    """
     with InputSource(file, **kwargs) as source:
-        records = list(source)
+        records = budget.checked_iter(f'reading {file}', source)
+        if skip is not None:
+            records = (r for r in records if not skip(r.path))
+        if path_store is None:
+            records = list(records)
+        else:
+            records = path_store.store_all(records)
     return records
 
 
+def read_directory_records(file: Path, normalize_paths: NormalizePaths = NormalizePaths.NONE) -> List[HsnapRecord]:
+    """
+    Only the directory records of the file (see hashdiff.merkle), the file records are not deserialized
+    """
+    with InputSource(file, directories=True) as source:
+        return [normalize_directory_record(normalize_paths, deserialize(line)) for line in source.text_lines()
+                if line.rstrip().endswith(DIRECTORY_MARKER)]
+
+
 class InputSource:
 
     def __init__(self,
                  file: Optional[Path] = None,
                  binary_pickle: Optional[bool] = None,
                  compression: Optional[CompressionType] = None,
-                 normalize_paths: NormalizePaths = NormalizePaths.NONE):
+                 normalize_paths: NormalizePaths = NormalizePaths.NONE,
+                 directories: bool = False):
         """
         :param file: Read file at specified path, None for stdin
         :param binary_pickle: force binary pickle mode (true/false), None for heuristic
         :param compression: forc compression mode, None for heuristic
+        :param directories: yield also directory digest records (see hashdiff.merkle), skipped by default
         """
 
         if file:
@@ -104,6 +138,8 @@ class InputSource:
         else:
             raise ValueError()
 
+        self.directories = bool(directories)
+
         self._is_open = False
 
     # file signatures used to detect compression type
@@ -148,19 +184,17 @@ class InputSource:
             if self._compression is None:
                 self._compression = self.identify_compression_type(starting_bytes=binary_stream.peek(6))
 
-            if self._compression == CompressionType.XZ:
-                binary_stream = self._exit_stack.enter_context(lzma.open(binary_stream))
-            elif self._compression == CompressionType.BZIP2:
-                binary_stream = self._exit_stack.enter_context(bz2.open(binary_stream))
-            elif self._compression == CompressionType.GZIP:
-                binary_stream = self._exit_stack.enter_context(gzip.open(binary_stream))
+            if self._compression != CompressionType.none:
+                binary_stream = self._exit_stack.enter_context(_codec_open(self._compression)(binary_stream))
 
             # 3) unpickle or prepare for deserialization
             if self._binary_pickle is None:
                 self._binary_pickle = self.identify_binary_pickle(starting_bytes=binary_stream.peek(6))
 
             if self._binary_pickle:
-                self._records = pickle.load(binary_stream)
+                import pickle
+                with stage('read'):
+                    self._records = pickle.load(binary_stream)
             else:
                 self._text_stream = self._exit_stack.enter_context(TextIOWrapper(binary_stream, encoding='utf8'))
 
@@ -181,26 +215,74 @@ class InputSource:
             raise RuntimeError("Not open yet")
 
     def __iter__(self):
+        normalizer = PathNormalizer(self.normalize_paths)
 
         def normalize(h_record):
             if self.normalize_paths == NormalizePaths.NONE:
                 return h_record
+            elif is_directory_record(h_record):
+                return normalize_directory_record(self.normalize_paths, h_record)
             else:
-                return normalize_hsnap_record(self.normalize_paths, h_record)
+                return normalizer.record(h_record)
 
-        if self._is_open:
+        def records():
             if self._binary_pickle:
-                for h_record in self._records:
-                    normalized = normalize(h_record)
-                    yield normalized
+                yield from self._records
             else:
-                for line in self._text_stream:
-                    deserialized = deserialize(line)
-                    normalized = normalize(deserialized)
+                for line in timed_iter('read', self._text_stream):
+                    yield deserialize(line)
+
+        def normalized_records():
+            for h_record in records():
+                if self.directories or not is_directory_record(h_record):
+                    normalized = normalize(h_record)
                     yield normalized
+
+        if self._is_open:
+            return timed_iter('parse', normalized_records())  # parse includes normalization, read is the I/O part
         else:
             raise RuntimeError("Not open yet")
 
+    @property
+    def binary_pickle(self) -> bool:
+        """
+        Whether the input is pickled, known once open
+        """
+        if not self._is_open:
+            raise RuntimeError("Not open yet")
+        return self._binary_pickle
+
+    @property
+    def compression(self) -> CompressionType:
+        if not self._is_open:
+            raise RuntimeError("Not open yet")
+        return self._compression
+
+    def text_buffer(self):
+        """
+        Decompressed binary stream of a text input, for bulk copying. Nothing is filtered or normalized.
+        """
+        if not self._is_open:
+            raise RuntimeError("Not open yet")
+        if self._binary_pickle:
+            raise ValueError("Pickled input")
+        return self._text_stream.buffer
+
+    def text_lines(self):
+        """
+        Records as serialized text lines, without deserializing text input. Paths are not normalized.
+        """
+        if not self._is_open:
+            raise RuntimeError("Not open yet")
+        if self._binary_pickle:
+            for h_record in self._records:
+                if self.directories or not is_directory_record(h_record):
+                    yield serialize(h_record) + '\n'
+        else:
+            for line in timed_iter('read', self._text_stream):
+                if self.directories or not line.rstrip().endswith(DIRECTORY_MARKER):
+                    yield line
+
 
 class OutputSink(ABC):
 
@@ -208,6 +290,12 @@ class OutputSink(ABC):
     def write(self, hsnap_record: HsnapRecord):
         pass
 
+    def write_line(self, line: str):
+        """
+        Writes a record given as a serialized text line
+        """
+        self.write(deserialize(line))
+
     def __enter__(self):
         return self
 
@@ -248,6 +336,9 @@ class FileOutputSink(OutputSink):
                 self._output_stream = opener(self._file, 'wb')
             else:
                 self._output_stream = opener(self._file, 'wt', encoding='utf-8')
+        if profiler.enabled:
+            self.write = timed_call('write', self.write)
+            self.write_line = timed_call('write', self.write_line)
         return self
 
     def write(self, hsnap_record: HsnapRecord):
@@ -258,14 +349,54 @@ class FileOutputSink(OutputSink):
             self._output_stream.write(serialized)
             self._output_stream.write('\n')
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    def write_line(self, line: str):
         if self._binary:
-            pickle.dump(self._buffer, self._output_stream)
-        if self._file:
-            self._output_stream.close()
+            self._buffer.append(deserialize(line))
+        else:
+            self._output_stream.write(line)
+            if not line.endswith('\n'):  # last line of input
+                self._output_stream.write('\n')
+
+    def write_lines(self, lines: Iterable[str]):
+        """
+        Writes records given as serialized text lines, each ending with a newline, in bulk
+        """
+        if self._binary:
+            self._buffer.extend(map(deserialize, lines))
+        else:
+            self._output_stream.writelines(lines)
+
+    def write_records(self, records: Iterable[HsnapRecord]):
+        """
+        Writes records in bulk
+        """
+        if self._binary:
+            self._buffer.extend(records)
+        else:
+            self._output_stream.writelines(serialize(h_record) + '\n' for h_record in records)
+
+    def text_buffer(self):
+        """
+        Binary stream under the text output, for bulk copying of serialized records, compressed on the way if needed
+        """
+        if self._binary:
+            raise ValueError("Pickled output")
+        self._output_stream.flush()
+        return self._output_stream.buffer
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with stage('write'):
+            if self._binary:
+                import pickle
+                pickle.dump(self._buffer, self._output_stream)
+            if self._file:
+                self._output_stream.close()
 
 
 class NullOutputSink(OutputSink):
 
     def write(self, hsnap_record: HsnapRecord):
         pass
+
+    def write_line(self, line: str):
+        pass
@@ -1,18 +1,36 @@
 import logging
+import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List
 from argparse import ArgumentParser
 
 from hashdiff.hcmp import SCRIPT_NAME
 from hashdiff.normalize import NormalizePaths
+from hashdiff.memory import add_memory_args
+from hashdiff.profiling import add_profiling_args
 
 log = logging.getLogger(__package__)
 
+RESULT_FORMATS = ['pickle', 'jsonl', 'tsv']
+SUMMARY_MODES = ['list', 'totals', 'largest']
+
+
+def _result_format_heuristic(path: Path) -> str:
+    if path.suffix in ['.jsonl', '.json']:
+        return 'jsonl'
+    elif path.suffix in ['.tsv', '.txt']:
+        return 'tsv'
+    else:
+        return 'pickle'
+
 
 def construct_parser(parser: ArgumentParser):
     parser.add_argument('PREV', help='hsnap file with previous/original state ')
     parser.add_argument('CURR', help='hsnap file with current/new state')
+    parser.add_argument('MORE', nargs='*',
+                        help='further hsnap files in chronological order, switches to reporting per file history '
+                             '(first seen, last changed, moved, deleted) across all the snapshots')
 
     parser.add_argument('--normalize-paths',
                         help='Normalize path to POSIX/Windows style before comparing, default: posix',
@@ -21,10 +39,27 @@ def construct_parser(parser: ArgumentParser):
                         default=NormalizePaths.POSIX.name.lower()
                         )
 
+    parser.add_argument('--exclude', '-e', help='path regexp in Python re module format, matching records are '
+                                                'excluded from comparison, can be specified multiple times',
+                        action='append', default=[])
+
     parser.add_argument('-n', '--lines', help='number of lines to print into console, 0 -> unlimited',
                         type=int, default=10)
-    parser.add_argument('--store-result', help='pickles result into a binary file for further analysis in python')
+    parser.add_argument('--summary', help='console output: list (first lines of each category, default), '
+                                          'totals (file count and size per category) or largest (totals and the '
+                                          'largest changes per category), totals and largest do not keep the '
+                                          'complete result in memory',
+                        choices=SUMMARY_MODES, default='list')
+    parser.add_argument('--store-result', help='stores result into a file for further analysis, see --result-format')
+    parser.add_argument('--result-format',
+                        help='format of the --store-result file: pickle (whole result written at the end), '
+                             'jsonl or tsv (written line by line as the comparison classifies changes, '
+                             'without keeping the result lists), '
+                             'default: guessed from file suffix, pickle otherwise',
+                        choices=RESULT_FORMATS)
     parser.add_argument('-o', '--overwrite', help='overwrite out files if they exists', action='store_true')
+    add_profiling_args(parser)
+    add_memory_args(parser)
 
 
 def parse_args():
@@ -37,6 +72,7 @@ def extract_args(args):
     try:
         prev = Path(args.PREV).resolve(strict=True)
         curr = Path(args.CURR).resolve(strict=True)
+        more = [Path(x).resolve(strict=True) for x in args.MORE]
     except FileNotFoundError as e:
         log.exception('Unable to resolve source file %s', e.filename)
         raise SystemExit(2)
@@ -45,20 +81,36 @@ def extract_args(args):
 
     max_lines: int = int(args.lines)
 
+    for p in args.exclude:
+        try:
+            re.compile(p)
+        except re.error:
+            log.exception("Invalid pattern %s", p)
+            raise SystemExit(2)
+
     if not args.store_result:
         store_result = None
+        result_format = None
     else:
         store_result = Path(args.store_result).resolve()
         if store_result.exists() and not args.overwrite:
             log.error(f'File {store_result} already exists and -o/--overwrite argument not specified')
             raise SystemExit(2)
+        result_format = args.result_format or _result_format_heuristic(store_result)
+        if more:
+            log.error('--store-result is not supported when comparing more than two files')
+            raise SystemExit(2)
 
     return CliArgs(
         prev=prev,
         curr=curr,
+        more=more,
         normalize_paths=normalize_paths,
+        exclude_paths=args.exclude,
         max_lines=max_lines,
-        store_result=store_result
+        summary=args.summary,
+        store_result=store_result,
+        result_format=result_format
     )
 
 
@@ -66,6 +118,10 @@ def extract_args(args):
 class CliArgs:
     prev: Path
     curr: Path
+    more: List[Path]
     normalize_paths: NormalizePaths
+    exclude_paths: List[str]
     max_lines: int
+    summary: str
     store_result: Optional[Path]
+    result_format: Optional[str]
@@ -1,52 +1,91 @@
 from collections import namedtuple
-from itertools import groupby
-from typing import Iterable
+from itertools import chain
+from operator import attrgetter
+from typing import Iterable, Optional
 
 from hashdiff.common import HsnapRecord, find_duplicate_in_sorted
+from hashdiff.hcmp.result import ResultSink, NullResultSink
+from hashdiff.pathstore import PathStore, to_hsnap_records
+from hashdiff.profiling import stage, timed_call
 
 OutputCategory = namedtuple('OutputCategory', 'name, description, files')
 OutputCategoryFormatter = namedtuple('OutputCategoryFormatter', 'name, title_format, line_format')
 
+# (name, description) of output categories, in order of output
+CATEGORIES = [
+    ('deleted', 'Deleted (no copy left)'),
+    ('deleted_duplicates', 'Deleted duplicates (some copies left)'),
+    ('changed', 'Changed (same path, different file)'),
+    ('moved', 'Moved (same file, different path)'),
+    ('added', 'Added (new files)'),
+    ('added_duplicates', 'Added duplicates (of previously existing)')
+]
 
-def changes(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord]):
+
+def changes(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord],
+            result_sink: Optional[ResultSink] = None, known_unchanged: Iterable[HsnapRecord] = (), collect=True,
+            path_store: Optional[PathStore] = None):
     """
     Path based comparison of changes - primarily for reporting changes of the same data set in time
     :param previous:
     :param current:
-    :param max_lines:
-    :return:
+    :param result_sink: receives every change as a pass classifies it; the inputs and the added/missing lists are
+                        still held in memory, only the result lists are not (see collect)
+    :param known_unchanged: records known to be the same in both previous and current (e.g. from unchanged subtrees),
+                            these are not compared, only looked up as copies of added/deleted files
+    :param collect: keep lists of changes in the output, otherwise they are only written into the result_sink
+    :param path_store: the records are StoredRecords of the store, output as HsnapRecords; the whole snapshots are
+                       matched by (directory, name) rather than by path strings, only the differences found are then
+                       sorted by path, so that changes come in the same order as without the store
+    :return: list of OutputCategory
     """
 
+    if result_sink is None:
+        result_sink = NullResultSink()
+
+    collected = dict((name, []) for name, _ in CATEGORIES)
+    write_result = timed_call('result', result_sink.write)
+
+    path_key = attrgetter('path')
+    # the order of (directory, name) differs from the order of paths ('a/b/c' > 'a/b.c' while ('a/b/', 'c') <
+    # ('a/', 'b.c')), but it needs no path strings for sorting the whole snapshots
+    match_key = path_key if path_store is None else attrgetter('directory', 'name')
+
+    def emit(category: str, item):
+        if path_store is not None:
+            item = to_hsnap_records(item)
+        if collect:
+            collected[category].append(item)
+        write_result(category, item)
+
     def sort_by_path(xs):
-        return sorted(xs, key=lambda f: f.path, reverse=True)
+        return sorted(xs, key=match_key, reverse=True)
 
-    prev = sort_by_path(previous)
-    curr = sort_by_path(current)
+    with stage('compare.sort'):
+        prev = sort_by_path(previous)
+        curr = sort_by_path(current)
 
-    for xs in [prev, curr]:
-        paths = [x.path for x in xs]
-        dup = find_duplicate_in_sorted(paths)
-        if dup is not None:
-            raise RuntimeError(f'Duplicate path found {dup}, use simple diff instead of changes.')
+        for xs in [prev, curr]:
+            paths = [match_key(x) for x in xs]
+            dup = find_duplicate_in_sorted(paths)
+            if dup is not None:
+                dup = dup if path_store is None else ''.join(dup)
+                raise RuntimeError(f'Duplicate path found {dup}, use simple diff instead of changes.')
 
     # 1st pass - find differences by path
     missing = list()
     added = list()
-    unchanged = list()
     while len(prev) and len(curr):
-        if prev[-1].path == curr[-1].path:  # from end, on reverse sorted
+        if match_key(prev[-1]) == match_key(curr[-1]):  # from end, on reverse sorted
             p: HsnapRecord = prev.pop()
             c: HsnapRecord = curr.pop()
-            if p.digest == c.digest:
-                unchanged.append(p)
-                pass
-            else:
+            if p.digest != c.digest:
                 # either changed or moved and replaced
                 missing.append(p)
                 added.append(c)
-        elif prev[-1].path < curr[-1].path:
+        elif match_key(prev[-1]) < match_key(curr[-1]):
             missing.append(prev.pop())
-        elif prev[-1].path > curr[-1].path:
+        elif match_key(prev[-1]) > match_key(curr[-1]):
             added.append(curr.pop())
         else:
             raise RuntimeError(f'Unable to compare {prev[-1]} and {curr[-1]}')
@@ -56,9 +95,11 @@ def changes(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord]):
     while curr:
         added.append(curr.pop())
     del prev, curr
+    if path_store is not None:  # in path order as they would be found by paths
+        missing.sort(key=path_key)
+        added.sort(key=path_key)
 
     # 2nd pass - in missing/added list try to find moved files
-    moved = []
     missing_buf = []
     added_buf = []
     for xs in [missing, added]:
@@ -67,7 +108,7 @@ def changes(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord]):
         m = missing[-1]
         a = added[-1]
         if m.digest == a.digest:
-            moved.append((missing.pop(), added.pop()))
+            emit('moved', (missing.pop(), added.pop()))
         elif m.digest < a.digest:
             missing_buf.append(missing.pop())
         elif m.digest > a.digest:
@@ -80,19 +121,18 @@ def changes(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord]):
     del missing_buf, added_buf
 
     # 3rd pass - changed files
-    changed = []
     missing_buf = []
     added_buf = []
     for xs in [missing, added]:
-        xs.sort(key=lambda f: f.path, reverse=True)
+        xs.sort(key=path_key, reverse=True)
     while len(missing) and len(added):
         m = missing[-1]
         a = added[-1]
-        if m.path == a.path:
-            changed.append((missing.pop(), added.pop()))
-        elif m.path < a.path:
+        if path_key(m) == path_key(a):
+            emit('changed', (missing.pop(), added.pop()))
+        elif path_key(m) < path_key(a):
             missing_buf.append(missing.pop())
-        elif m.path > a.path:
+        elif path_key(m) > path_key(a):
             added_buf.append(added.pop())
         else:
             raise RuntimeError(f'Unable to compare {m} and {a}')
@@ -103,40 +143,35 @@ def changes(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord]):
 
     # 4th pass for added find out if it is a copy, for delete if it had been the last copy
     # for both find out if it is empty
-    added_new = []
-    added_copy = []
-    deleted_last = []
-    deleted_copy = []
 
-    def group_by_digest(xs: Iterable[HsnapRecord]) -> dict:
-        def key_func(f: HsnapRecord): return f.digest
-
-        return dict([(k, list(v)) for k, v in groupby(sorted(xs, key=key_func), key=key_func)])
+    # only digests of added/deleted files are looked up, no need to group the rest
+    needed_digests = set(f.digest for f in chain(added, missing))
 
-    current_by_digest = group_by_digest(current)
-    previous_by_digest = group_by_digest(previous)
+    def group_by_digest(xs: Iterable[HsnapRecord]) -> dict:
+        groups = {}
+        for f in xs:
+            if f.digest in needed_digests:
+                groups.setdefault(f.digest, []).append(f)
+        return groups
+
+    known_unchanged = list(known_unchanged)
+    current_by_digest = group_by_digest(chain(current, known_unchanged))
+    previous_by_digest = group_by_digest(chain(previous, known_unchanged))
+    del needed_digests, known_unchanged
     for a in added:
-        try:
-            added_copy.append((a, previous_by_digest[a.digest]))
-        except KeyError:
-            added_new.append(a)
+        if a.digest in previous_by_digest:
+            emit('added_duplicates', (a, previous_by_digest[a.digest]))
+        else:
+            emit('added', a)
     del added
     for d in missing:
-        try:
-            deleted_copy.append((d, current_by_digest[d.digest]))
-        except KeyError:
-            deleted_last.append(d)
+        if d.digest in current_by_digest:
+            emit('deleted_duplicates', (d, current_by_digest[d.digest]))
+        else:
+            emit('deleted', d)
     del missing
 
-    output = [
-        OutputCategory(name='deleted', files=deleted_last, description='Deleted (no copy left)'),
-        OutputCategory(name='deleted_duplicates', files=deleted_copy,
-                       description='Deleted duplicates (some copies left)'),
-        OutputCategory(name='changed', files=changed, description='Changed (same path, different file)'),
-        OutputCategory(name='moved', files=moved, description='Moved (same file, different path)'),
-        OutputCategory(name='added', files=added_new, description='Added (new files)'),
-        OutputCategory(name='added_duplicates', files=added_copy,
-                       description='Added duplicates (of previously existing)')
-    ]
+    output = [OutputCategory(name=name, files=collected[name], description=description)
+              for name, description in CATEGORIES]
 
     return output
@@ -1,12 +1,14 @@
-import re
 from typing import Iterable
 
 from hashdiff.common import HsnapRecord
+from hashdiff.matcher import PathMatcher
 
 
 def filter_by_path(exclude_patterns: Iterable[str], hsnap_records: Iterable[HsnapRecord]) -> Iterable[HsnapRecord]:
-    matchers = [re.compile(pat) for pat in exclude_patterns]
+    matcher = PathMatcher(exclude_patterns)
+    if not matcher.patterns:
+        yield from hsnap_records
+        return
     for h_record in hsnap_records:
-        matches = [m.match(h_record.path) for m in matchers]
-        if not any(matches):
+        if not matcher.match(h_record.path):
             yield h_record
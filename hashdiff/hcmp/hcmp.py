@@ -1,15 +1,27 @@
+import logging
 import pickle
 import sys
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Optional, List, Tuple
 
 import hashdiff.hcmp.filter as filter
 import hashdiff.logger
-from hashdiff.fileio import read_input_file
+import hashdiff.memory
+import hashdiff.profiling
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import read_input_file, read_directory_records, InputSource
 from hashdiff.hcmp.args import parse_args, extract_args
 from hashdiff.hcmp.compare import changes
-from hashdiff.hcmp.summary import print_output
+from hashdiff.hcmp.history import history, print_history
+from hashdiff.hcmp.result import ResultSink, NullResultSink, JsonLinesResultSink, TsvResultSink, TeeResultSink
+from hashdiff.hcmp.summary import print_output, print_summary, SummaryResultSink
+from hashdiff.memory import budget, estimate_records_memory
+from hashdiff.merkle import is_directory_record, unchanged_subtrees, SubtreeMatcher, split_subtrees
 from hashdiff.normalize import NormalizePaths
+from hashdiff.pathstore import PathStore
+from hashdiff.profiling import stage
+
+log = logging.getLogger(__package__)
 
 
 def cli_main():
@@ -19,25 +31,107 @@ def cli_main():
     # initialize logger
     hashdiff.logger.initialize_stderr_logger_from_args(args_raw)
 
-    output = main(cli_args.prev, cli_args.curr, cli_args.normalize_paths)
+    with hashdiff.profiling.profile_from_args(args_raw), hashdiff.memory.budget_from_args(args_raw):
+        cli_run(cli_args)
 
-    print_output(output, cli_args.max_lines)
+    sys.exit(0)
 
-    if cli_args.store_result:
-        with cli_args.store_result.open('wb') as f:
-            pickle.dump(output, f)
 
-    sys.exit(0)
+def cli_run(cli_args):
+    if cli_args.more:
+        snapshots = [cli_args.prev, cli_args.curr] + cli_args.more
+        histories = main_history(snapshots, cli_args.normalize_paths, cli_args.exclude_paths)
+        print_history(histories, _snapshot_names(snapshots), cli_args.max_lines)
+        sys.exit(0)
+
+    # complete result lists needed only for the list summary or pickling, otherwise just summary counters and heaps
+    collect = cli_args.summary == 'list' or (cli_args.store_result is not None and cli_args.result_format == 'pickle')
+    largest = (cli_args.max_lines if cli_args.max_lines > 0 else -1) if cli_args.summary == 'largest' else 0
+    summary = SummaryResultSink(largest)
+
+    with _result_sink(cli_args.store_result, cli_args.result_format) as result_sink:
+        output = main(cli_args.prev, cli_args.curr, cli_args.normalize_paths, cli_args.exclude_paths,
+                      result_sink=TeeResultSink(summary, result_sink), collect=collect)
+
+    with stage('output'):
+        if cli_args.summary == 'list':
+            print_output(output, cli_args.max_lines)
+        else:
+            print_summary(summary, cli_args.summary)
+
+        if cli_args.store_result and cli_args.result_format == 'pickle':
+            with cli_args.store_result.open('wb') as f:
+                pickle.dump(output, f)
+
+
+def _split_directory_records(records: List[HsnapRecord]) -> Tuple[List[HsnapRecord], List[HsnapRecord]]:
+    files = [r for r in records if not is_directory_record(r)]
+    if len(files) == len(records):
+        return records, []
+    return files, [r for r in records if is_directory_record(r)]
+
+
+def _result_sink(store_result: Optional[Path], result_format: Optional[str]) -> ResultSink:
+    if store_result is None or result_format == 'pickle':
+        return NullResultSink()  # pickle needs the complete result, stored after comparison
+    elif result_format == 'jsonl':
+        return JsonLinesResultSink(store_result)
+    elif result_format == 'tsv':
+        return TsvResultSink(store_result)
+    raise ValueError(f'Unknown result format {result_format}')
 
 
-def main(prev: Path, curr: Path, normalize_paths: NormalizePaths, exclude_paths: Iterable[str] = []):
-    prev_records = read_input_file(prev, normalize_paths=normalize_paths)
-    curr_records = read_input_file(curr, normalize_paths=normalize_paths)
+def main(prev: Path, curr: Path, normalize_paths: NormalizePaths, exclude_paths: Iterable[str] = [],
+         result_sink: Optional[ResultSink] = None, collect=True):
+    # both snapshots are held in memory, fail before reading them if they cannot fit
+    budget.require(estimate_records_memory(prev) + estimate_records_memory(curr), 'Comparison',
+                   ', compare parts of the snapshots split by hstool filter --route instead')
+
+    # records of both snapshots share one path store, paths common to them are stored once
+    path_store = PathStore()
+    prev_records = read_input_file(prev, path_store, normalize_paths=normalize_paths, directories=True)
+    prev_records, prev_dirs = _split_directory_records(prev_records)
+
+    # skip comparing subtrees with matching directory digests, if both files have them; directory records are at the
+    # end of the files, the current one is scanned for them first, so that records of unchanged subtrees in it are
+    # dropped while reading. The previous ones are still needed as known copies of added/deleted files.
+    with stage('merkle'):
+        subtrees = unchanged_subtrees(prev_dirs, read_directory_records(curr, normalize_paths)) if prev_dirs else set()
+    in_unchanged = SubtreeMatcher(subtrees, normalize_paths)
+    if in_unchanged:
+        log.info('Skipping %d unchanged directories', len(subtrees))
+    curr_records = read_input_file(curr, path_store, skip=in_unchanged if in_unchanged else None,
+                                   normalize_paths=normalize_paths)
 
     exclude_paths = list(exclude_paths)
-    prev_records = list(filter.filter_by_path(exclude_paths, prev_records))
-    curr_records = list(filter.filter_by_path(exclude_paths, curr_records))
+    with stage('filter'):
+        prev_records = list(filter.filter_by_path(exclude_paths, prev_records))
+        curr_records = list(filter.filter_by_path(exclude_paths, curr_records))
+
+    unchanged = []
+    if in_unchanged:
+        with stage('merkle'):
+            unchanged, prev_records = split_subtrees(prev_records, in_unchanged)
 
-    output = changes(prev_records, curr_records)
+    with stage('compare'):
+        output = changes(prev_records, curr_records, result_sink, unchanged, collect, path_store)
 
     return output
+
+
+def _snapshot_names(snapshots: List[Path]) -> List[str]:
+    names = [p.name for p in snapshots]
+    if len(set(names)) < len(names):
+        names = [str(p) for p in snapshots]
+    return names
+
+
+def _iter_records(file: Path, normalize_paths: NormalizePaths) -> Iterable[HsnapRecord]:
+    with InputSource(file, normalize_paths=normalize_paths) as source:
+        yield from budget.checked_iter(f'history of {file}', source)
+
+
+def main_history(snapshots: List[Path], normalize_paths: NormalizePaths, exclude_paths: Iterable[str] = []):
+    exclude_paths = list(exclude_paths)
+    records = (filter.filter_by_path(exclude_paths, _iter_records(file, normalize_paths)) for file in snapshots)
+    return history(records)
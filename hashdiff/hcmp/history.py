@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from typing import Iterable, Dict, Any, Optional, List
+
+from hashdiff.common import HsnapRecord
+
+
+@dataclass
+class FileHistory:
+    path: str
+    digest: Any
+    first_seen: int  # snapshot indices
+    last_seen: int
+    last_changed: int
+    deleted: Optional[int] = None
+    moved_from: Optional[str] = None
+    moved_to: Optional[str] = None
+
+    def has_events(self) -> bool:
+        """
+        False for files present and unchanged in all the snapshots
+        """
+        return self.first_seen > 0 or self.last_changed > self.first_seen or self.deleted is not None
+
+
+def history(snapshots: Iterable[Iterable[HsnapRecord]]) -> Dict[str, FileHistory]:
+    """
+    Per file change history across a series of snapshots, reading each of them just once
+    :param snapshots: snapshots in chronological order, each consumed lazily in turn
+    :return: dict of path -> FileHistory, for every path seen in any of the snapshots
+    """
+
+    files: Dict[str, FileHistory] = {}
+    digests: Dict[Any, Any] = {}  # shared digest index - one object per distinct content across all snapshots
+    present: List[FileHistory] = []  # entries of the previous snapshot, only these can disappear in the next one
+
+    for i, records in enumerate(snapshots):
+        appeared: List[FileHistory] = []
+        previous, present = present, []
+
+        for h_record in records:
+            digest = digests.setdefault(h_record.digest, h_record.digest)
+            entry = files.get(h_record.path)
+            if entry is None:
+                entry = FileHistory(path=h_record.path, digest=digest, first_seen=i, last_seen=i, last_changed=i)
+                files[h_record.path] = entry
+                appeared.append(entry)
+                present.append(entry)
+                continue
+
+            if entry.last_seen == i:
+                raise RuntimeError(f'Duplicate path found {h_record.path} in snapshot {i}')
+            if entry.deleted is not None:  # re-appeared after deletion
+                entry.deleted = None
+                entry.moved_to = None
+                entry.moved_from = None
+                entry.digest = digest
+                entry.last_changed = i
+                appeared.append(entry)
+            elif entry.digest != digest:
+                entry.digest = digest
+                entry.last_changed = i
+                entry.moved_from = None  # the content moved here is gone
+            entry.last_seen = i
+            present.append(entry)
+
+        # files of the previous snapshot not seen in this one have been deleted, unless we find them again under
+        # another path - indexed by digest for the lookup of appeared files
+        disappeared: Dict[Any, List[FileHistory]] = {}
+        for entry in previous:
+            if entry.last_seen < i:
+                entry.deleted = i
+                disappeared.setdefault(entry.digest, []).append(entry)
+
+        for entry in appeared:
+            try:
+                source = disappeared[entry.digest].pop()
+            except (KeyError, IndexError):
+                continue
+            source.moved_to = entry.path
+            entry.moved_from = source.path
+
+    return files
+
+
+def print_history(histories: Dict[str, FileHistory], names: List[str], max_lines: int):
+
+    def line_format(h: FileHistory):
+        items = [h.path, f'first seen: {names[h.first_seen]}']
+        if h.moved_from is not None:
+            items.append(f'moved from: {h.moved_from}')
+        if h.last_changed > h.first_seen:
+            items.append(f'last changed: {names[h.last_changed]}')
+        if h.deleted is not None:
+            if h.moved_to is not None:
+                items.append(f'moved to: {h.moved_to} in {names[h.deleted]}')
+            else:
+                items.append(f'deleted: {names[h.deleted]}')
+        return '\t'.join(items)
+
+    events = [h for h in histories.values() if h.has_events()]
+    events.sort(key=lambda h: h.path)
+    print(f'Files with changes across {len(names)} snapshots: {len(events)}')
+    for h in events[0:max_lines] if max_lines > 0 else events:
+        print(line_format(h))
+    if 0 < max_lines < len(events):
+        print(f'[...{len(events) - max_lines} more...]')
@@ -0,0 +1,144 @@
+import json
+import logging
+import sys
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+from hashdiff.common import HsnapRecord
+from hashdiff.serialize import bin2hex
+
+log = logging.getLogger(__name__)
+
+
+def split_item(category: str, item) -> Tuple[Optional[HsnapRecord], Optional[HsnapRecord], List[HsnapRecord]]:
+    """
+    Unifies the category specific shape of a change into (previous record, current record, copies)
+    """
+    if category == 'deleted':
+        return item, None, []
+    elif category == 'added':
+        return None, item, []
+    elif category in ('changed', 'moved'):
+        return item[0], item[1], []
+    elif category == 'deleted_duplicates':
+        return item[0], None, item[1]
+    elif category == 'added_duplicates':
+        return None, item[0], item[1]
+    raise ValueError(f'Unknown category {category}')
+
+
+class ResultSink(ABC):
+    """
+    Receives changes one by one, as compare.changes classifies them in its passes over the sorted inputs
+    """
+
+    @abstractmethod
+    def write(self, category: str, item):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _StreamResultSink(ResultSink):
+
+    def __init__(self, file: Optional[Path] = None):
+        """
+        :param file: Output file, stdout used if None
+        """
+        self._file = file
+
+    def __enter__(self):
+        if self._file is None:
+            log.debug("Result output to stdout")
+            self._output_stream = sys.stdout
+        else:
+            log.debug("Opening result file %s", self._file)
+            self._output_stream = open(self._file, 'wt', encoding='utf-8')
+        self.write_header()
+        return self
+
+    def write_header(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._file:
+            self._output_stream.close()
+
+
+class JsonLinesResultSink(_StreamResultSink):
+    """
+    One JSON object per change: {"category": ..., "prev": record|null, "curr": record|null, "copies": [record...]}
+    """
+
+    @staticmethod
+    def _record_to_dict(h_record: Optional[HsnapRecord]):
+        if h_record is None:
+            return None
+        return {'path': h_record.path, 'size': h_record.size, 'mtime': h_record.mtime,
+                'digest': bin2hex(h_record.digest)}
+
+    def write(self, category: str, item):
+        prev, curr, copies = split_item(category, item)
+        line = json.dumps({
+            'category': category,
+            'prev': self._record_to_dict(prev),
+            'curr': self._record_to_dict(curr),
+            'copies': [self._record_to_dict(c) for c in copies]
+        }, ensure_ascii=False)
+        self._output_stream.write(line)
+        self._output_stream.write('\n')
+
+
+_TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def tsv_escape(path: str) -> str:
+    """
+    Backslash escapes of backslash, tab, newline and carriage return, so that any path fits into one TSV field
+    """
+    return path.translate(_TSV_ESCAPES)
+
+
+class TsvResultSink(_StreamResultSink):
+    """
+    One tab separated line per change, paths last: category, size, digest, number of copies, prev path, curr path.
+    Backslashes, tabs and line breaks in paths are escaped as \\\\, \\t, \\n and \\r.
+    """
+
+    COLUMNS = ['category', 'size', 'digest', 'copies', 'prev_path', 'curr_path']
+
+    def write_header(self):
+        self._output_stream.write('\t'.join(self.COLUMNS))
+        self._output_stream.write('\n')
+
+    def write(self, category: str, item):
+        prev, curr, copies = split_item(category, item)
+        primary = curr if curr is not None else prev
+        self._output_stream.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+            category, primary.size, bin2hex(primary.digest), len(copies),
+            tsv_escape(prev.path) if prev is not None else '',
+            tsv_escape(curr.path) if curr is not None else ''))
+
+
+class TeeResultSink(ResultSink):
+    """
+    Passes every change to all of the given sinks
+    """
+
+    def __init__(self, *sinks: ResultSink):
+        self._sinks = sinks
+
+    def write(self, category: str, item):
+        for sink in self._sinks:
+            sink.write(category, item)
+
+
+class NullResultSink(ResultSink):
+
+    def write(self, category: str, item):
+        pass
@@ -1,38 +1,44 @@
-from typing import Iterable
+import heapq
+from itertools import count
+from typing import Iterable, Dict, List, Tuple
 
 from hashdiff.common import HsnapRecord
-from hashdiff.hcmp.compare import OutputCategoryFormatter
+from hashdiff.hcmp.compare import OutputCategoryFormatter, CATEGORIES
+from hashdiff.hcmp.result import ResultSink, split_item
+from hashdiff.humanizer import humanize_size, humanize_size_dual
 
 
-def print_output(output, max_lines: int):
+def _file_list_formatter(fs: Iterable[HsnapRecord]):
+    h: HsnapRecord
+    t: Iterable[HsnapRecord]
+    h, *t = fs
+    return h.path + (f'\tand {len(t)} more' if t else '')
+
+
+_output_formatters = [
+    OutputCategoryFormatter(name='deleted',
+                            title_format=lambda c: f'{c.description}: {len(c.files)}',
+                            line_format=lambda f: f.path),
+    OutputCategoryFormatter(name='deleted_duplicates',
+                            title_format=lambda c: f'{c.description}: {len(c.files)}',
+                            line_format=lambda t: f'{t[0].path}\tduplicate of\t{_file_list_formatter(t[1])}'),
+    OutputCategoryFormatter(name='changed',
+                            title_format=lambda c: f'{c.description}: {len(c.files)}',
+                            line_format=lambda f: f[0].path),  # same paths
+    OutputCategoryFormatter(name='moved',
+                            title_format=lambda c: f'{c.description}: {len(c.files)}',
+                            line_format=lambda t: f'{t[0].path}\t→\t{t[1].path}'),
+    OutputCategoryFormatter(name='added',
+                            title_format=lambda c: f'{c.description}: {len(c.files)}',
+                            line_format=lambda f: f.path),
+    OutputCategoryFormatter(name='added_duplicates',
+                            title_format=lambda c: f'{c.description}: {len(c.files)}',
+                            line_format=lambda t: f'{t[0].path}\tduplicate of\t{_file_list_formatter(t[1])}')
+]
+_output_formatters = dict((ocf.name, ocf) for ocf in _output_formatters)
 
-    def file_list_formatter(fs: Iterable[HsnapRecord]):
-        h: HsnapRecord
-        t: Iterable[HsnapRecord]
-        h, *t = fs
-        return h.path + (f'\tand {len(t)} more' if t else '')
-
-    output_formatters = [
-        OutputCategoryFormatter(name='deleted',
-                       title_format=lambda c: f'{c.description}: {len(c.files)}',
-                       line_format=lambda f: f.path),
-        OutputCategoryFormatter(name='deleted_duplicates',
-                       title_format=lambda c: f'{c.description}: {len(c.files)}',
-                       line_format=lambda t: f'{t[0].path}\tduplicate of\t{file_list_formatter(t[1])}'),
-        OutputCategoryFormatter(name='changed',
-                       title_format=lambda c: f'{c.description}: {len(c.files)}',
-                       line_format=lambda f: f[0].path),  #same paths
-        OutputCategoryFormatter(name='moved',
-                       title_format=lambda c: f'{c.description}: {len(c.files)}',
-                       line_format=lambda t: f'{t[0].path}\t→\t{t[1].path}'),
-        OutputCategoryFormatter(name='added',
-                       title_format=lambda c: f'{c.description}: {len(c.files)}',
-                       line_format=lambda f: f.path),
-        OutputCategoryFormatter(name='added_duplicates',
-                       title_format=lambda c: f'{c.description}: {len(c.files)}',
-                       line_format=lambda t: f'{t[0].path}\tduplicate of\t{file_list_formatter(t[1])}')
-    ]
-    output_formatters = dict((ocf.name, ocf) for ocf in output_formatters)
+
+def print_output(output, max_lines: int):
 
     first_category = True
     for cat in output:
@@ -40,9 +46,67 @@ def print_output(output, max_lines: int):
             first_category = False
         else:
             print()
-        formatter = output_formatters[cat.name]
+        formatter = _output_formatters[cat.name]
         print(formatter.title_format(cat))
         for f in cat.files[0:max_lines] if max_lines > 0 else cat.files:
             print(formatter.line_format(f))
         if 0 < max_lines < len(cat.files):
-            print(f'[...{len(cat.files) - max_lines} more...]')
\ No newline at end of file
+            print(f'[...{len(cat.files) - max_lines} more...]')
+
+
+def item_size(category: str, item) -> int:
+    prev, curr, _ = split_item(category, item)
+    return curr.size if curr is not None else prev.size
+
+
+class SummaryResultSink(ResultSink):
+    """
+    Counts changes and their total size per category, keeping only the largest ones in bounded heaps
+    """
+
+    def __init__(self, largest: int = 0):
+        """
+        :param largest: number of largest changes kept per category, 0 for none, negative for all
+        """
+        self._largest = largest
+        self._sequence = count()  # tie breaker, items themselves are not comparable
+        self.counts: Dict[str, int] = dict((name, 0) for name, _ in CATEGORIES)
+        self.sizes: Dict[str, int] = dict((name, 0) for name, _ in CATEGORIES)
+        self._heaps: Dict[str, List[Tuple[int, int, object]]] = dict((name, []) for name, _ in CATEGORIES)
+
+    def write(self, category: str, item):
+        size = item_size(category, item)
+        self.counts[category] = self.counts[category] + 1
+        self.sizes[category] = self.sizes[category] + size
+        if self._largest == 0:
+            return
+        heap = self._heaps[category]
+        entry = (size, next(self._sequence), item)
+        if self._largest < 0 or len(heap) < self._largest:
+            heapq.heappush(heap, entry)
+        elif size > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    def largest(self, category: str) -> List[Tuple[int, object]]:
+        """
+        Largest changes kept, as (size, item) sorted by size descending
+        """
+        return [(size, item) for size, _, item in sorted(self._heaps[category], key=lambda e: e[0], reverse=True)]
+
+
+def print_summary(summary: SummaryResultSink, mode: str):
+
+    first_category = True
+    for name, description in CATEGORIES:
+        if first_category:
+            first_category = False
+        else:
+            print()
+        print(f'{description}: {summary.counts[name]} files, {humanize_size_dual(summary.sizes[name])}')
+        if mode == 'largest':
+            line_format = _output_formatters[name].line_format
+            largest = summary.largest(name)
+            for size, item in largest:
+                print(f'{humanize_size(size)}\t{line_format(item)}')
+            if len(largest) < summary.counts[name]:
+                print(f'[...{summary.counts[name] - len(largest)} more...]')
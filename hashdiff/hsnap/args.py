@@ -1,11 +1,14 @@
 import logging
-import os.path
+import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 from hashdiff.fileio import CompressionType
 from hashdiff.hsnap import SCRIPT_NAME
+from hashdiff.hsnap.hash import READ_AHEAD_FILES, READ_BUFFERS
+from hashdiff.memory import add_memory_args
+from hashdiff.profiling import add_profiling_args
 
 log = logging.getLogger(__package__)
 
@@ -29,6 +32,9 @@ def parse_args():
     parser_group_path.add_argument('--path-common', help='output paths relative to common prefix (default)',
                                    action='store_true')
 
+    parser.add_argument('--dir-digests', help='store also aggregate digests of directories, allowing hcmp to skip '
+                                              'unchanged subtrees', action='store_true')
+
     parser.add_argument('--pickle', help='output in pickled binary format rather than text (experimental)',
                         action='store_true')
 
@@ -40,6 +46,28 @@ def parse_args():
     group_compression.add_argument('--gzip', help='use gzip compression for the output file', action='store_const',
                                    const=CompressionType.GZIP)
 
+    parser.add_argument('--metrics', help='write run metrics (throughput, incremental ratios, walk/hash time, '
+                                          'per device statistics, peak memory) into a JSON FILE at exit',
+                        metavar='FILE')
+    parser.add_argument('--status-file', help='periodically rewrite FILE with the current metrics, for monitoring',
+                        metavar='FILE')
+    parser.add_argument('--status-interval', help='seconds between status file updates, default: %(default)s',
+                        type=float, default=10.)
+
+    parser.add_argument('--read-ahead', help='files prefetched ahead of the one being hashed, 0 disables, '
+                                             'default: %(default)s', type=int, default=READ_AHEAD_FILES, metavar='N')
+    parser.add_argument('--read-buffers', help='buffers of the reader thread overlapping reads of large files with '
+                                               'hashing, 0 reads and hashes in turns, default: %(default)s',
+                        type=int, default=READ_BUFFERS, metavar='N')
+    parser.add_argument('--workers', help='files hashed at the same time on every device (st_dev), devices are '
+                                          'hashed in parallel, default: %(default)s', type=int, default=1, metavar='N')
+    parser.add_argument('--device-workers', help='files hashed at the same time on the device of PATH, e.g. 1 for a '
+                                                 'spinning disk and more for SSD or NFS, can be repeated',
+                        action='append', default=[], metavar='PATH=N')
+
+    add_profiling_args(parser)
+    add_memory_args(parser)
+
     return parser.parse_args()
 
 
@@ -115,6 +143,23 @@ def _extract_compression(args, output_file):
         return None
 
 
+def _extract_device_workers(args) -> Dict[int, int]:
+    """
+    device (st_dev) -> workers, from PATH=N
+    """
+    device_workers = {}
+    for value in args.device_workers:
+        path, separator, workers = value.rpartition('=')
+        if not separator or not workers.isdigit() or int(workers) < 1:
+            raise SystemExit(f'Invalid --device-workers {value}, expected PATH=N')
+        try:
+            device_workers[os.stat(path).st_dev] = int(workers)
+        except OSError as e:
+            log.error('Unable to find device of %s: %s', path, e)
+            raise SystemExit(2)
+    return device_workers
+
+
 def extract_args(args):
     sources = _extract_sources(args)
     base_path = _extract_base_path(args, sources)
@@ -123,6 +168,9 @@ def extract_args(args):
     verbose = bool(args.verbose)
     pickle = bool(args.pickle)
     compress = _extract_compression(args, output_file)
+    dir_digests = bool(args.dir_digests)
+    metrics_file = Path(args.metrics) if args.metrics else None
+    status_file = Path(args.status_file) if args.status_file else None
 
     return CliArgs(
         sources=sources,
@@ -131,7 +179,15 @@ def extract_args(args):
         incremental_file=incremental_file,
         verbose=verbose,
         pickle=pickle,
-        compress=compress
+        compress=compress,
+        dir_digests=dir_digests,
+        metrics_file=metrics_file,
+        status_file=status_file,
+        status_interval=args.status_interval,
+        read_ahead_files=args.read_ahead,
+        read_buffers=args.read_buffers,
+        workers=args.workers,
+        device_workers=_extract_device_workers(args)
     )
 
 
@@ -144,3 +200,11 @@ class CliArgs:
     verbose: bool
     pickle: bool
     compress: CompressionType
+    dir_digests: bool
+    metrics_file: Optional[Path]
+    status_file: Optional[Path]
+    status_interval: float
+    read_ahead_files: int
+    read_buffers: int
+    workers: int
+    device_workers: Dict[int, int]
@@ -1,13 +1,161 @@
 import hashlib
+import os
+import queue
+import threading
+from collections import deque
+from contextlib import suppress
+from pathlib import Path
+from typing import Callable, Optional, Iterable, Iterator, TypeVar
 
+from hashdiff.profiling import stage
 
-def file_sha512(file):
-    HASH_CHUNK_SIZE = 2 ** 17  # 128KiB - empirical value
+T = TypeVar('T')
+
+HASH_CHUNK_SIZE = 2 ** 17  # 128KiB - empirical value
+READ_BUFFER_SIZE = 2 ** 20  # 1MiB - chunks of the pipelined reader
+READ_BUFFERS = 4
+PIPELINE_MIN_SIZE = 4 * READ_BUFFER_SIZE  # below that the reader thread costs more than the overlap saves
+READ_AHEAD_FILES = 4
+READ_AHEAD_SIZE = 2 ** 24  # 16MiB - hinted from the start of every upcoming file
+
+
+def _fadvise(fd: int, advice_name: str, length: int = 0):
+    """
+    Best effort posix_fadvise, no-op where not available
+    """
+    advice = getattr(os, advice_name, None)
+    if advice is not None:
+        with suppress(OSError):
+            os.posix_fadvise(fd, 0, length, advice)
+
+
+def file_sha512(file, on_chunk: Optional[Callable[[int], None]] = None, buffers: int = READ_BUFFERS):
+    """
+    :param on_chunk: called with size of every chunk read, e.g. for throttling
+    :param buffers: buffers of the pipelined reader used for large files, reading the next chunks in a separate thread
+                    while the current one is hashed; 0 reads and hashes in turns
+    """
     h_sha512 = hashlib.sha512()
-    with file.open('rb') as fo:
-        chunk = fo.read(HASH_CHUNK_SIZE)
-        while chunk:
-            h_sha512.update(chunk)
+    with stage('hash'), open(file, 'rb', buffering=0) as fo:
+        _fadvise(fo.fileno(), 'POSIX_FADV_SEQUENTIAL')
+        if buffers > 0 and os.fstat(fo.fileno()).st_size >= PIPELINE_MIN_SIZE:
+            _pipelined_update(h_sha512, fo, on_chunk, buffers)
+        else:
             chunk = fo.read(HASH_CHUNK_SIZE)
-    fo.close()
-    return h_sha512.digest()
\ No newline at end of file
+            while chunk:
+                if on_chunk is not None:
+                    on_chunk(len(chunk))
+                h_sha512.update(chunk)
+                chunk = fo.read(HASH_CHUNK_SIZE)
+    return h_sha512.digest()
+
+
+def _pipelined_update(h, fo, on_chunk: Optional[Callable[[int], None]], buffers: int):
+    """
+    Updates the hash with contents of the file, read by a reader thread into a bounded pool of buffers. Both the read
+    and sha512 of a large chunk release the GIL, so reading the next chunks overlaps with hashing the current one.
+    """
+    free = queue.Queue()
+    for _ in range(buffers):
+        free.put(bytearray(READ_BUFFER_SIZE))
+    full = queue.Queue()
+    stop = threading.Event()
+
+    def reader():
+        try:
+            while True:
+                buffer = free.get()
+                if stop.is_set():
+                    return
+                n = fo.readinto(buffer)
+                full.put((buffer, n))
+                if not n:
+                    return
+        except BaseException as e:
+            full.put((e, 0))
+
+    thread = threading.Thread(target=reader, name='hsnap-reader', daemon=True)
+    thread.start()
+    try:
+        while True:
+            buffer, n = full.get()
+            if isinstance(buffer, BaseException):
+                raise buffer
+            if not n:
+                break
+            if on_chunk is not None:
+                on_chunk(n)
+            with memoryview(buffer) as view:
+                h.update(view[:n])
+            free.put(buffer)
+    finally:
+        stop.set()
+        free.put(None)  # wake up the reader waiting for a buffer
+        thread.join()
+
+
+class Prefetcher:
+    """
+    Hints the kernel to read the upcoming files (POSIX_FADV_WILLNEED) from a background thread, so that their
+    first READ_AHEAD_SIZE bytes are read while the current file is being hashed. No-op without posix_fadvise.
+    """
+
+    def __init__(self, size: int = READ_AHEAD_SIZE):
+        self.size = size
+        self._paths = queue.Queue()
+        self._thread = None
+
+    def prefetch(self, path: Path):
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        if self._thread is None:  # started with the first file
+            self._thread = threading.Thread(target=self._run, name='hsnap-prefetch', daemon=True)
+            self._thread.start()
+        self._paths.put(path)
+
+    def _run(self):
+        while True:
+            path = self._paths.get()
+            if path is None:
+                return
+            with suppress(OSError):
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    _fadvise(fd, 'POSIX_FADV_WILLNEED', self.size)
+                finally:
+                    os.close(fd)
+
+    def close(self):
+        if self._thread is not None:
+            self._paths.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_ahead(items: Iterable[T], path: Callable[[T], Optional[Path]], prefetcher: Prefetcher,
+               depth: int = READ_AHEAD_FILES, max_items: int = 1024) -> Iterator[T]:
+    """
+    Yields the items, prefetching paths of the next depth items to be read ahead of them
+    :param path: path of the item to be read, None if it will not be read (e.g. digest reused)
+    :param max_items: items kept ahead at most, when only few of them are to be read
+    """
+    window = deque()
+    pending = 0  # prefetched items in the window
+    for item in items:
+        item_path = path(item)
+        if item_path is not None:
+            prefetcher.prefetch(item_path)
+            pending += 1
+        window.append((item, item_path is not None))
+        while pending > depth or len(window) > max_items:
+            item, prefetched = window.popleft()
+            pending -= prefetched
+            yield item
+    for item, _ in window:
+        yield item
@@ -1,25 +1,36 @@
 import dataclasses
+import json
 import logging
 import os.path
 import sys
+import threading
+import time
 from pathlib import Path
 from time import perf_counter
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Mapping
 
 from hashdiff.common import HsnapRecord
-from hashdiff.fileio import OutputSink, read_input_file, FileOutputSink
+from hashdiff.fileio import OutputSink, InputSource, FileOutputSink
 from hashdiff.hsnap.args import parse_args, extract_args
-from hashdiff.hsnap.hash import file_sha512
+from hashdiff.hsnap.hash import file_sha512, Prefetcher, read_ahead, READ_AHEAD_FILES, READ_BUFFERS
+from hashdiff.hsnap.scheduler import DeviceScheduler
 from hashdiff.hsnap.walk import scan_paths_for_files, FileStat
+from hashdiff.merkle import DirectoryDigests
+from hashdiff.pathstore import RecordCatalog
 from hashdiff.humanizer import humanize_time, humanize_size, humanize_size_dual
+from hashdiff.memory import peak_rss, budget, estimate_records_memory
 import hashdiff.logger
+import hashdiff.memory
+import hashdiff.profiling
+from hashdiff.profiling import stage
 
 log = logging.getLogger(__package__)
 
 
 class ProcessingStats:
 
-    def __init__(self, total_size, total_files, incremental_enabled, start_time):
+    def __init__(self, total_size, total_files, incremental_enabled, start_time, walk_time=0.,
+                 status_file: Optional[Path] = None, status_interval: float = 10.):
 
         self.total_size = total_size
         self.total_files = total_files
@@ -34,13 +45,47 @@ class ProcessingStats:
         self._incremental_new = 0
 
         self.start_time = start_time
+        self.walk_time = walk_time
+
+        self.hash_time = 0.
+        self.size_hashed = 0
+        self.files_hashed = 0
+        self._devices: Dict[int, List] = {}  # device -> [files, size, hash time]
+
+        self.status_file = status_file
+        self.status_interval = status_interval
+        self.last_status_time = perf_counter()
+        self._size_hashing = 0  # read so far from files being hashed, not processed yet
+        self._lock = threading.Lock()  # files are hashed in worker threads with more workers
 
     LOGGING_INTERVAL = 1  # second
 
-    def increment(self, size, files=1):
+    def increment(self, size, files=1, device=0, hash_time=None):
+        """
+        :param hash_time: time of hashing the files, None if their digests were reused
+        """
         self.size_processed = self.size_processed + size
         self.files_processed = self.files_processed + files
 
+        device_stats = self._devices.setdefault(device, [0, 0, 0.])
+        device_stats[0] += files
+        device_stats[1] += size
+        if hash_time is not None:
+            self.hash_time = self.hash_time + hash_time
+            self.size_hashed = self.size_hashed + size
+            self.files_hashed = self.files_hashed + files
+            device_stats[2] += hash_time
+
+    def hashing(self, size: int):
+        """
+        Bytes of the files being hashed read (or with negative size, done), the status is updated also while large
+        files are hashed
+        """
+        with self._lock:
+            self._size_hashing = self._size_hashing + size
+        if size > 0:
+            self.write_status()
+
     def incremental_reused(self):
         self._incremental_reused = self._incremental_reused + 1
 
@@ -50,6 +95,65 @@ class ProcessingStats:
     def incremental_new(self):
         self._incremental_new = self._incremental_new + 1
 
+    def to_metrics(self, state='running') -> Dict:
+        """
+        Machine readable statistics, sizes in bytes, times in seconds
+        :param state: running, complete or failed
+        """
+        elapsed = perf_counter() - self.start_time
+
+        def rate(amount, seconds):
+            return amount / seconds if seconds > 0 else None
+
+        incremental_total = self._incremental_reused + self._incremental_different + self._incremental_new
+        return {
+            'state': state,
+            'timestamp': time.time(),
+            'elapsed_seconds': elapsed,
+            'total_files': self.total_files,
+            'total_bytes': self.total_size,
+            'files_processed': self.files_processed,
+            'bytes_processed': self.size_processed,
+            'bytes_hashing': self._size_hashing,
+            'progress': (self.size_processed + self._size_hashing) / self.total_size if self.total_size > 0 else 1.,
+            'files_per_second': rate(self.files_processed, elapsed),
+            'bytes_per_second': rate(self.size_processed, elapsed),
+            'walk_seconds': self.walk_time,
+            'hash_seconds': self.hash_time,
+            'files_hashed': self.files_hashed,
+            'bytes_hashed': self.size_hashed,
+            'hash_bytes_per_second': rate(self.size_hashed, self.hash_time),
+            'incremental': {
+                'enabled': self.incremental_enabled,
+                'reused': self._incremental_reused,
+                'different': self._incremental_different,
+                'new': self._incremental_new,
+                'reuse_ratio': self._incremental_reused / incremental_total if incremental_total else None,
+            },
+            'devices': {
+                str(device): {
+                    'files': files,
+                    'bytes': size,
+                    'hash_seconds': hash_time,
+                    'hash_bytes_per_second': rate(size, hash_time),
+                } for device, (files, size, hash_time) in self._devices.items()
+            },
+            'peak_rss_bytes': peak_rss(),
+        }
+
+    def write_status(self, force=False):
+        """
+        Rewrites the status file with current metrics, at most once per status_interval unless forced
+        """
+        if self.status_file is None:
+            return
+        with self._lock:
+            current_time = perf_counter()
+            if not force and current_time - self.last_status_time < self.status_interval:
+                return
+            self.last_status_time = current_time
+            write_metrics(self.status_file, self.to_metrics())
+
     def log_processing_start(self):
         if log.getEffectiveLevel() > logging.INFO:
             return
@@ -106,25 +210,43 @@ def cli_main():
     # initialize logger
     hashdiff.logger.initialize_stderr_logger_from_args(args_raw)
 
-    main(**dataclasses.asdict(cli_args))  # run main
+    with hashdiff.profiling.profile_from_args(args_raw), hashdiff.memory.budget_from_args(args_raw):
+        main(**dataclasses.asdict(cli_args))  # run main
 
     sys.exit(0)
 
 
-def _read_incremental_catalog(incremental_file: Optional[Path]) -> Optional[Dict]:
+def _read_incremental_catalog(incremental_file: Optional[Path]) -> Optional[Mapping]:
     if not incremental_file:
         return None
     log.info("Reading incremental catalog")
-    incremental_records = read_input_file(incremental_file)
-    incremental_dict = dict((h_rec.path, h_rec) for h_rec in incremental_records)
-    return incremental_dict
-
-
-def main(sources, base_path, output_file, incremental_file, pickle, compress, **kwargs):
+    budget.require(estimate_records_memory(incremental_file), 'Incremental catalog',
+                   ', run without -i/--incremental to hash all files instead')
+    with InputSource(incremental_file) as records:
+        return RecordCatalog(budget.checked_iter('incremental catalog', records))
+
+
+def write_metrics(file: Path, metrics: Dict):
+    """
+    Writes metrics as JSON, atomically - readers never see a partially written file
+    """
+    temp_file = file.with_name(file.name + '.tmp')
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2)
+        f.write('\n')
+    os.replace(temp_file, file)
+
+
+def main(sources, base_path, output_file, incremental_file, pickle, compress, dir_digests=False,
+         metrics_file: Optional[Path] = None, status_file: Optional[Path] = None, status_interval=10.,
+         read_ahead_files=READ_AHEAD_FILES, read_buffers=READ_BUFFERS, workers=1,
+         device_workers: Optional[Dict[int, int]] = None, **kwargs):
     start_time = perf_counter()
 
     # scan for files
-    files: List[FileStat] = list(scan_paths_for_files(sources))
+    with stage('walk'):
+        files: List[FileStat] = list(budget.checked_iter('list of files', scan_paths_for_files(sources)))
+    walk_time = perf_counter() - start_time
 
     # calculate total size for progress tracking progress tracking
     total_size = sum(f.size for f in files)
@@ -134,18 +256,39 @@ def main(sources, base_path, output_file, incremental_file, pickle, compress, **
     incremental_dict = _read_incremental_catalog(incremental_file)
 
     # create processing statistics tracker and logger
-    stats = ProcessingStats(total_size, num_files, (incremental_dict is not None), start_time)
+    stats = ProcessingStats(total_size, num_files, (incremental_dict is not None), start_time, walk_time,
+                            status_file, status_interval)
     stats.log_processing_start()
+    stats.write_status(force=True)
 
     # open output file
-    with FileOutputSink(output_file, binary_pickle=pickle, compression=compress) as output_sink:
-        run(files, base_path, output_sink, incremental_dict, stats)
+    directory_digests = DirectoryDigests() if dir_digests else None
+    state = 'failed'  # unless it gets to the end, metrics are written also on errors and interrupts
+    try:
+        with FileOutputSink(output_file, binary_pickle=pickle, compression=compress) as output_sink:
+            run(files, base_path, output_sink, incremental_dict, stats, directory_digests, read_ahead_files,
+                read_buffers, DeviceScheduler(workers, device_workers))
+            if directory_digests:
+                for h_record in directory_digests.records():
+                    output_sink.write(h_record)
+        state = 'complete'
+    finally:
+        if metrics_file:
+            write_metrics(metrics_file, stats.to_metrics(state))
+        if status_file:
+            write_metrics(status_file, stats.to_metrics(state))
 
     stats.log_summary()
 
 
-def run(files: List[FileStat], base_path: Optional[Path], output_sink: OutputSink, incremental_dict: Dict,
-        stats: ProcessingStats):
+def run(files: List[FileStat], base_path: Optional[Path], output_sink: OutputSink, incremental_dict: Mapping,
+        stats: ProcessingStats, directory_digests: Optional[DirectoryDigests] = None,
+        read_ahead_files=READ_AHEAD_FILES, read_buffers=READ_BUFFERS, scheduler: Optional[DeviceScheduler] = None):
+    """
+    :param read_ahead_files: files to be hashed prefetched ahead of the one being hashed, 0 disables prefetching
+    :param read_buffers: buffers of the pipelined reader of large files, 0 reads and hashes in turns
+    :param scheduler: hash files of more devices (or with more workers) in parallel, otherwise one after another
+    """
     def relpath(file_path: Path):
         nonlocal base_path
         if base_path is None:
@@ -168,14 +311,57 @@ def run(files: List[FileStat], base_path: Optional[Path], output_sink: OutputSin
                 stats.incremental_new()
         return None
 
-    for f in files:
-        logical_path = relpath(f.path)
+    def with_cached_digests():
+        for file in files:
+            logical_path = relpath(file.path)
+            # try to use incremental, calculate if not available
+            yield file, logical_path, cached_digest(logical_path, file)
+
+    def hashed(file: FileStat):
+        read = 0
 
-        # try to use incremental, calculate if not available
-        digest = cached_digest(logical_path, f) or file_sha512(f.path)
+        def on_chunk(size: int):
+            nonlocal read
+            read = read + size
+            stats.hashing(size)
+
+        hash_start = perf_counter()
+        try:
+            digest = file_sha512(file.path, on_chunk=on_chunk, buffers=read_buffers)
+        finally:
+            stats.hashing(-read)
+        return digest, perf_counter() - hash_start
 
-        h_record = HsnapRecord(logical_path, f.size, f.mtime, digest)
+    def write(file: FileStat, logical_path: str, digest, hash_time: Optional[float]):
+        h_record = HsnapRecord(logical_path, file.size, file.mtime, digest)
         output_sink.write(h_record)
+        if directory_digests is not None:
+            with stage('dir_digests'):
+                directory_digests.add(Path(logical_path).parts, file.size, digest)
 
-        stats.increment(f.size)
+        stats.increment(file.size, device=file.device, hash_time=hash_time)
         stats.log_progress()
+        stats.write_status()
+
+    if scheduler is not None and not scheduler.is_sequential(f.device for f in files):
+        # reused digests written first, the rest hashed by per device workers, written as they finish
+        to_hash = []
+        for f, logical_path, digest in with_cached_digests():
+            if digest:
+                write(f, logical_path, digest, None)
+            else:
+                to_hash.append((f, logical_path))
+        for (f, logical_path), (digest, hash_time) in scheduler.map(lambda item: hashed(item[0]), to_hash,
+                                                                    lambda item: item[0].device):
+            write(f, logical_path, digest, hash_time)
+        return
+
+    with Prefetcher() as prefetcher:
+        items = with_cached_digests()
+        if read_ahead_files > 0:
+            items = read_ahead(items, lambda item: item[0].path if not item[2] else None, prefetcher, read_ahead_files)
+        for f, logical_path, digest in items:
+            hash_time = None
+            if not digest:
+                digest, hash_time = hashed(f)
+            write(f, logical_path, digest, hash_time)
@@ -0,0 +1,70 @@
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class DeviceScheduler:
+    """
+    Runs jobs on files with a separate pool of worker threads per device (st_dev), so that files on different disks are
+    read at the same time, each disk with its own concurrency - e.g. 1 reader for a spinning disk, more for SSD or NFS.
+    """
+
+    def __init__(self, workers: int = 1, device_workers: Optional[Dict[int, int]] = None):
+        """
+        :param workers: worker threads of a device not in device_workers
+        :param device_workers: device -> worker threads
+        """
+        self.workers = workers
+        self.device_workers = dict(device_workers or {})
+
+    def workers_for(self, device: int) -> int:
+        return max(1, self.device_workers.get(device, self.workers))
+
+    def is_sequential(self, devices: Iterable[int]) -> bool:
+        """
+        True if there is nothing to run in parallel for files of the devices
+        """
+        devices = set(devices)
+        return len(devices) <= 1 and all(self.workers_for(d) == 1 for d in devices)
+
+    def map(self, job: Callable[[T], R], items: Iterable[T], device: Callable[[T], int]) -> Iterator[Tuple[T, R]]:
+        """
+        (item, job(item)) for all items; in order of the items within a device, devices interleaved as the jobs finish.
+        An exception of a job is raised when its result is due, jobs not started yet are cancelled.
+        :param device: device of the item
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        queued: Dict[int, deque] = {}
+        for item in items:
+            queued.setdefault(device(item), deque()).append(item)
+
+        pools = {d: ThreadPoolExecutor(self.workers_for(d), thread_name_prefix=f'hsnap-device-{d}') for d in queued}
+        running: Dict[int, deque] = {d: deque() for d in queued}  # (item, future) in order of submission
+
+        def submit(d: int):
+            # twice the workers, so that a worker finishing a job has the next one ready
+            while queued[d] and len(running[d]) < 2 * self.workers_for(d):
+                item = queued[d].popleft()
+                running[d].append((item, pools[d].submit(job, item)))
+
+        try:
+            for d in queued:
+                submit(d)
+            while any(running.values()):
+                wait([future for r in running.values() for _, future in r], return_when=FIRST_COMPLETED)
+                for d, r in running.items():
+                    while r and r[0][1].done():
+                        item, future = r.popleft()
+                        yield item, future.result()
+                    submit(d)
+        finally:
+            # on an error (or the iteration stopped early), jobs submitted but not started are cancelled by hand,
+            # ThreadPoolExecutor.shutdown cancels them itself only since Python 3.9
+            for r in running.values():
+                for _, future in r:
+                    future.cancel()
+            for pool in pools.values():
+                pool.shutdown(wait=True)
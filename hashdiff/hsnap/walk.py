@@ -11,6 +11,7 @@ class FileStat:
     path: Path
     size: int
     mtime: float
+    device: int = 0
 
 
 def scan_paths_for_files(paths: List[Path]) -> Iterable[FileStat]:
@@ -28,7 +29,7 @@ def _file_path_to_stat(file_path: Path) -> FileStat:
     stat = file_path.stat()
     size = stat.st_size
     mtime = stat.st_mtime
-    return FileStat(file_path, size, mtime)
+    return FileStat(file_path, size, mtime, stat.st_dev)
 
 
 def _scan_path(root_path: Path, visited_inodes: Set = None) -> Iterable[FileStat]:
@@ -2,11 +2,24 @@ import logging
 import argparse
 from argparse import ArgumentParser
 
+from hashdiff.fileio import CompressionType
 from hashdiff.hstool import SCRIPT_NAME
+from hashdiff.hstool.defaults import DEFAULT_MEMORY_BUDGET, SHARD_KEYS, DEFAULT_BATCH_SIZE
+from hashdiff.humanizer import parse_size
+from hashdiff.memory import add_memory_args
+from hashdiff.profiling import add_profiling_args
 
 log = logging.getLogger(__package__)
 
 
+def parse_time(value: str) -> float:
+    """
+    See hashdiff.hstool.find.parse_time, imported only when the find command is used
+    """
+    from hashdiff.hstool.find import parse_time
+    return parse_time(value)
+
+
 def construct_parser(parser: ArgumentParser):
     commands = parser.add_subparsers(help='available commands, use commands -h for usage',
                                      dest='hst_command', required=True,
@@ -23,9 +36,17 @@ def construct_parser(parser: ArgumentParser):
     filter_g.add_argument('--input', '-i', help='input file, "-" for stdin')
     filter_g.add_argument('--pattern', '-p', help='path regexp in Python re module format, can be specified multiple '
                                                   'times with multiple patterns functioning as OR',
-                          action='append', required=True)
+                          action='append')
     filter_g.add_argument('--matched', '-m', help='output file for records matching any of the patterns')
     filter_g.add_argument('--not-matched', '-n', help='output file for records not matching any of the patterns')
+    filter_g.add_argument('--route', '-r', help='output file for records matching the pattern, can be specified '
+                                                'multiple times to split the input into many files in one pass, '
+                                                'each record goes to the first route matching (--pattern first)',
+                          nargs=2, metavar=('FILE', 'PATTERN'), action='append')
+    filter_g.add_argument('--jobs', '-j', help='number of worker processes for parsing and matching, default: 1',
+                          type=int, default=1)
+    filter_g.add_argument('--batch-size', help='number of records processed by a worker at once, default: %(default)s',
+                          type=int, default=DEFAULT_BATCH_SIZE)
 
     ls = commands.add_parser('ls',
                              help='lists hsn file contents as if it was a directory')
@@ -35,10 +56,143 @@ def construct_parser(parser: ArgumentParser):
     ls_g.add_argument('--input', '-i', help='input file, "-" for stdin')
     ls_g.add_argument('FILE', nargs='*', action='extend', help='files to be listed, supporting glob syntax')
     ls_g.add_argument('--normalize-paths', help='Normalize path to native style before listing', action='store_true')
+    ls_g.add_argument('--index', help='use a directory tree index stored next to the input file, building it first '
+                                      'if missing or outdated, makes repeated listing of large files fast; '
+                                      'with --max-memory too low to build the tree, an up to date index is used '
+                                      'even without --index, but never built',
+                      action='store_true')
+
+    du = commands.add_parser('du',
+                             help='summarizes size of directories in hsn file',
+                             description='Prints total size, number of files and size of unique content (counting '
+                                         'files with the same digest just once) of directories, tab separated, '
+                                         'subdirectories first.')
+    parser_extend_workaround(du)  # needed for python < 3.8
+
+    du_g = du.add_argument_group("du command")
+    du_g.add_argument('--input', '-i', help='input file, "-" for stdin')
+    du_g.add_argument('FILE', nargs='*', action='extend', help='files/directories to be summarized, supporting glob '
+                                                               'syntax')
+    du_g.add_argument('--max-depth', '-d', help='print directories only up to N levels below the listed ones',
+                      type=int, metavar='N')
+    du_g.add_argument('--human-readable', '-H', help='print sizes in human readable format', action='store_true')
+    du_g.add_argument('--normalize-paths', help='Normalize path to native style before summarizing',
+                      action='store_true')
+
+    dedup = commands.add_parser('dedup',
+                                help='lists groups of duplicate files in hsn file',
+                                description='Lists groups of files with the same content (digest), sorted by the space '
+                                            'that would be reclaimed by keeping just one copy. Works within a memory '
+                                            'budget, spilling to temporary files for large inputs.')
+
+    dedup_g = dedup.add_argument_group("dedup command")
+    dedup_g.add_argument('--input', '-i', help='input file, "-" for stdin')
+    dedup_g.add_argument('--min-size', help='ignore files smaller than SIZE bytes, default: 1', type=int, default=1,
+                         metavar='SIZE')
+    dedup_g.add_argument('--limit', '-n', help='print only the first N groups', type=int, metavar='N')
+    dedup_g.add_argument('--memory-budget', help='approximate memory used for grouping in MiB, default: %(default)s',
+                         type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024), metavar='MB')
+    dedup_g.add_argument('--temp-dir', help='directory for temporary files, default: system temporary directory')
+
+    merge = commands.add_parser('merge',
+                                help='merges hsn files sorted by path into one',
+                                description='Merges hsn files sorted by path (e.g. snapshots of separate volumes) into '
+                                            'one sorted file, streaming. Records of the same path found in more '
+                                            'inputs are written once, conflicting ones are reported and the first one '
+                                            'is kept.')
+    parser_extend_workaround(merge)  # needed for python < 3.8
+
+    merge_g = merge.add_argument_group("merge command")
+    merge_g.add_argument('INPUT', nargs='+', action='extend', help='input files, "-" for stdin')
+    merge_g.add_argument('--output', '-o', help='output file, compression and format based on its extension, '
+                                                'default: stdout')
+    merge_g.add_argument('--sort-inputs', help='sort the inputs in memory first, for inputs not sorted by path',
+                         action='store_true')
+    merge_g.add_argument('--strict', help='fail on the first conflicting record', action='store_true')
+
+    convert = commands.add_parser('convert',
+                                  help='converts hsn file to another format or compression',
+                                  description='Converts between text and pickled format and between compression '
+                                              'types. Unless specified otherwise, the output format and compression '
+                                              'are based on the output file extension.')
+
+    convert_g = convert.add_argument_group("convert command")
+    convert_g.add_argument('INPUT', help='input file, "-" for stdin')
+    convert_g.add_argument('OUTPUT', help='output file, "-" for stdout')
+    convert_format = convert_g.add_mutually_exclusive_group()
+    convert_format.add_argument('--pickle', help='pickled binary output', action='store_const', const=True,
+                                dest='binary_pickle')
+    convert_format.add_argument('--text', help='text output', action='store_const', const=False,
+                                dest='binary_pickle')
+    convert_compression = convert_g.add_mutually_exclusive_group()
+    convert_compression.add_argument('--xz', help='use xz compression', action='store_const',
+                                     const=CompressionType.XZ, dest='compression')
+    convert_compression.add_argument('--bzip2', help='use bzip2 compression', action='store_const',
+                                     const=CompressionType.BZIP2, dest='compression')
+    convert_compression.add_argument('--gzip', help='use gzip compression', action='store_const',
+                                     const=CompressionType.GZIP, dest='compression')
+    convert_compression.add_argument('--no-compression', help='do not compress', action='store_const',
+                                     const=CompressionType.none, dest='compression')
+
+    verify = commands.add_parser('verify',
+                                 help='verifies files against hsn file',
+                                 description='Checks that files under ROOT still match the records of the hsn file, '
+                                             'e.g. for checking backups. Files of different size are reported '
+                                             'without reading them, the rest is hashed in parallel. Prints status and '
+                                             'path of files not matching, exits with 1 if there are any.')
+
+    verify_g = verify.add_argument_group("verify command")
+    verify_g.add_argument('--input', '-i', help='input file, "-" for stdin')
+    verify_g.add_argument('ROOT', help='directory the paths in the input file are relative to')
+    verify_g.add_argument('--jobs', '-j', help='number of hashing threads, default: %(default)s', type=int,
+                          default=4)
+    verify_g.add_argument('--sample', help='check just a random fraction of the files, 0 to 1', type=float,
+                          default=1.0, metavar='RATE')
+    verify_g.add_argument('--seed', help='seed of the random sampling', type=int)
+    verify_g.add_argument('--bandwidth-limit', help='limit reading to SIZE per second, e.g. 50M', type=parse_size,
+                          metavar='SIZE')
+    verify_g.add_argument('--all', help='print also files that match', action='store_true')
+    verify_g.add_argument('--normalize-paths', help='Normalize path to native style before verification',
+                          action='store_true')
+
+    find = commands.add_parser('find',
+                               help='finds records in hsn file by digest, size or modification time',
+                               description='Prints records matching all of the given conditions. With --index, the '
+                                           'conditions are evaluated using sorted digest, size and modification '
+                                           'time columns stored next to the input file, so that repeated queries '
+                                           'do not need to read the whole file.')
+
+    find_g = find.add_argument_group("find command")
+    find_g.add_argument('--input', '-i', help='input file, "-" for stdin')
+    find_g.add_argument('--digest', help='hex digest or its prefix', metavar='PREFIX')
+    find_g.add_argument('--min-size', help='minimal size, e.g. 10G', type=parse_size, metavar='SIZE')
+    find_g.add_argument('--max-size', help='maximal size', type=parse_size, metavar='SIZE')
+    find_g.add_argument('--newer', help='modified at or after TIME - seconds since epoch, ISO date/time or age '
+                                        'like 7d (s/m/h/d/w)', type=parse_time, metavar='TIME')
+    find_g.add_argument('--older', help='modified before TIME', type=parse_time, metavar='TIME')
+    find_g.add_argument('--index', help='use an index stored next to the input file, building it first if missing '
+                                        'or outdated; uncompressed text input files only', action='store_true')
+
+    shard = commands.add_parser('shard',
+                                help='splits hsn file into N shards by hash of digest or path',
+                                description='Partitions the input into N files in one pass, so that records of the '
+                                            'same digest (or path) always land in the same shard, even across '
+                                            'different input files. Shards can be then processed independently, '
+                                            'e.g. by hstool dedup or hcmp of the corresponding shards.')
+
+    shard_g = shard.add_argument_group("shard command")
+    shard_g.add_argument('--input', '-i', help='input file, "-" for stdin')
+    shard_g.add_argument('--shards', '-n', help='number of shards', type=int, required=True, metavar='N')
+    shard_g.add_argument('--by', help='partitioning key, default: %(default)s', choices=SHARD_KEYS, default='digest')
+    shard_g.add_argument('--output', '-o', help='output file name template containing {shard}, e.g. '
+                                                'part-{shard:03}.hsn.gz, compression and format based on its '
+                                                'extension', required=True, metavar='TEMPLATE')
 
 
 def parse_args():
     parser = ArgumentParser(SCRIPT_NAME)
+    add_profiling_args(parser)
+    add_memory_args(parser)
     construct_parser(parser)
     return parser.parse_args()
 
@@ -0,0 +1,68 @@
+import logging
+import shutil
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+from typing import Optional
+
+from hashdiff.fileio import InputSource, FileOutputSink, CompressionType
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+_QUEUE_DEPTH = 8  # chunks read ahead
+
+
+def pipelined_copy(src, dst, chunk_size: int = CHUNK_SIZE):
+    """
+    Copies between binary streams, reading (and decompressing) in a separate thread, so that decompression and
+    compression, which both release the GIL, run in parallel
+    """
+    chunks = Queue(_QUEUE_DEPTH)
+
+    def reader():
+        try:
+            while True:
+                chunk = src.read(chunk_size)
+                chunks.put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e:
+            chunks.put(e)
+
+    thread = Thread(target=reader, name='convert-reader', daemon=True)
+    thread.start()
+    while True:
+        chunk = chunks.get()
+        if isinstance(chunk, BaseException):
+            raise chunk
+        if not chunk:
+            break
+        dst.write(chunk)
+    thread.join()
+
+
+def convert(input_source: InputSource, output_file: Optional[Path], binary_pickle: bool,
+            compression: CompressionType, input_file: Optional[Path] = None):
+    """
+    Converts records between text/pickle formats and compressions, in bulk rather than record by record where possible.
+    All records are kept, including directory digests, paths are not normalized.
+    :param output_file: None for stdout
+    :param input_file: file of the input source, copied as is if no conversion is needed
+    """
+    input_source.directories = True
+
+    with input_source as source:
+        same_format = source.binary_pickle == binary_pickle and source.compression == compression
+        if same_format and input_file is not None and output_file is not None:
+            log.debug('Same format, copying %s', input_file)
+            shutil.copyfile(input_file, output_file)
+            return
+
+        with FileOutputSink(output_file, binary_pickle=binary_pickle, compression=compression) as output_sink:
+            if source.binary_pickle:
+                output_sink.write_records(source)
+            elif binary_pickle:
+                output_sink.write_lines(source.text_lines())
+            else:
+                pipelined_copy(source.text_buffer(), output_sink.text_buffer())
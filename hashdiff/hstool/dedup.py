@@ -0,0 +1,235 @@
+import heapq
+import json
+import logging
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Iterator, Iterable, Optional, Set, Tuple
+
+from hashdiff.fileio import InputSource
+from hashdiff.hstool.defaults import DEFAULT_MEMORY_BUDGET
+from hashdiff.humanizer import humanize_size
+
+log = logging.getLogger(__name__)
+
+MAX_BUCKETS = 512  # open temporary files at once
+
+_RECORD_OVERHEAD = 320  # estimated memory per candidate record while grouping, bytes
+_SIZE_OVERHEAD = 100  # estimated memory per distinct size while counting them, bytes
+
+
+@dataclass
+class DuplicateGroup:
+    digest: bytes
+    size: int
+    paths: List[str]
+
+    @property
+    def reclaimable(self) -> int:
+        return self.size * (len(self.paths) - 1)
+
+    def sort_key(self):
+        return -self.reclaimable, self.digest
+
+    def to_json(self) -> str:
+        return json.dumps({'digest': self.digest.hex(), 'size': self.size, 'paths': self.paths})
+
+    @classmethod
+    def from_json(cls, line: str) -> 'DuplicateGroup':
+        d = json.loads(line)
+        return cls(bytes.fromhex(d['digest']), d['size'], d['paths'])
+
+
+def _split_line(line: str) -> Tuple[str, str, str]:
+    """
+    (hex digest, size, path) of a serialized record, without parsing it completely
+    """
+    digest_hex, size_s, _, path = line.rstrip('\n').split('\t', 3)
+    return digest_hex, size_s, path
+
+
+def _records(snapshot: Path, min_size: int) -> Iterator[Tuple[str, str, str]]:
+    """
+    (hex digest, size, path) of the records of the snapshot, at least min_size large
+    """
+    with InputSource(snapshot) as input_source:
+        for line in input_source.text_lines():
+            record = _split_line(line)
+            if int(record[1]) >= min_size:
+                yield record
+
+
+def _bucket_records(bucket_file: Path) -> Iterator[Tuple[str, str, str]]:
+    with open(bucket_file, 'rt', encoding='utf-8') as f:
+        for line in f:
+            digest_hex, size_s, path = line.rstrip('\n').split('\t', 2)
+            yield digest_hex, size_s, path
+
+
+def _n_buckets(n_records: int, memory_budget: int, what: str) -> int:
+    """
+    Number of buckets for the records to be grouped within the memory budget, warns if it cannot be met
+    """
+    n_buckets = max(1, min(n_records, -(-n_records * _RECORD_OVERHEAD // max(1, memory_budget))))
+    if n_buckets > MAX_BUCKETS:
+        log.warning('%s: %d records need %d buckets to fit into the memory budget of %s, only %d are used - the budget '
+                    'will be exceeded about %d times', what, n_records, n_buckets, humanize_size(memory_budget),
+                    MAX_BUCKETS, -(-n_buckets // MAX_BUCKETS))
+        n_buckets = MAX_BUCKETS
+    return n_buckets
+
+
+def _partition(records: Iterable[Tuple[str, str, str]], files: List[Path], key: Callable[[str, str], int]):
+    """
+    Writes the records into the bucket files by the key of their (hex digest, size)
+    """
+    with ExitStack() as stack:
+        buckets = [stack.enter_context(open(f, 'wt', encoding='utf-8')) for f in files]
+        for digest_hex, size_s, path in records:
+            buckets[key(digest_hex, size_s) % len(buckets)].write(f'{digest_hex}\t{size_s}\t{path}\n')
+
+
+def _size_key(_, size_s: str) -> int:
+    # Fibonacci hashing, sizes are often multiples of block sizes
+    return (int(size_s) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) >> 32
+
+
+def _digest_key(digest_hex: str, _) -> int:
+    return int(digest_hex[:8], 16)  # digests are uniformly distributed already
+
+
+def _candidate_sizes(records: Iterable[Tuple[str, str, str]]) -> Tuple[Set[int], int]:
+    """
+    Sizes shared by more than one file - only these can be duplicates, and the number of such files
+    """
+    counts = Counter(int(size_s) for _, size_s, _ in records)
+    return _shared_sizes(counts)
+
+
+def _shared_sizes(counts: Counter) -> Tuple[Set[int], int]:
+    sizes = {size for size, n in counts.items() if n > 1}
+    return sizes, sum(counts[size] for size in sizes)
+
+
+def _group(records: Callable[[], Iterable[Tuple[str, str, str]]]) -> List[DuplicateGroup]:
+    """
+    Duplicate groups of (hex digest, size, path) records, sorted by reclaimable size. The first pass over the records
+    only counts the digests, the second one collects paths of the duplicate ones - paths of unique files are never held.
+    :param records: returns the records for each pass
+    """
+    counts = Counter(bytes.fromhex(digest_hex) for digest_hex, _, _ in records())
+    groups = {}
+    for digest_hex, size_s, path in records():
+        digest = bytes.fromhex(digest_hex)
+        if counts[digest] > 1:
+            group = groups.get(digest)
+            if group is None:
+                group = groups[digest] = DuplicateGroup(digest, int(size_s), [])
+            group.paths.append(path)
+    del counts
+    for group in groups.values():
+        group.paths.sort()
+    return sorted(groups.values(), key=DuplicateGroup.sort_key)
+
+
+def _write_groups(groups: Iterable[DuplicateGroup], file: Path):
+    with open(file, 'wt', encoding='utf-8') as f:
+        f.writelines(group.to_json() + '\n' for group in groups)
+
+
+def _merged_groups(group_files: List[Path], stack: ExitStack) -> Iterator[DuplicateGroup]:
+    """
+    Merges the sorted group files, at most MAX_BUCKETS of them open at once
+    """
+    merge_round = 0
+    while len(group_files) > MAX_BUCKETS:  # merge in rounds
+        merged = []
+        for i in range(0, len(group_files), MAX_BUCKETS):
+            merged.append(group_files[i].parent / f'merged{merge_round}-{i}.jsonl')
+            with ExitStack() as round_stack:
+                runs = [map(DuplicateGroup.from_json, round_stack.enter_context(open(f, 'rt', encoding='utf-8')))
+                        for f in group_files[i:i + MAX_BUCKETS]]
+                _write_groups(heapq.merge(*runs, key=DuplicateGroup.sort_key), merged[-1])
+            for f in group_files[i:i + MAX_BUCKETS]:
+                f.unlink()
+        group_files = merged
+        merge_round += 1
+    runs = [map(DuplicateGroup.from_json, stack.enter_context(open(f, 'rt', encoding='utf-8'))) for f in group_files]
+    return heapq.merge(*runs, key=DuplicateGroup.sort_key)
+
+
+def spool(input_source: InputSource, file: Path):
+    """
+    Copies the records into a text file, for inputs that cannot be read twice (stdin)
+    """
+    with input_source as records, open(file, 'wt', encoding='utf-8') as f:
+        f.writelines(records.text_lines())
+
+
+def duplicate_groups(snapshot: Path, min_size: int = 1, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                     temp_dir: Optional[Path] = None) -> Iterator[DuplicateGroup]:
+    """
+    Groups of files with the same digest, largest reclaimable size first.
+
+    Only files of non-unique size can be duplicates. If all records fit into the memory budget, the first pass over
+    the snapshot counts the records and their sizes, and files of non-unique size are grouped by digest in two more
+    passes - counting the digests, then collecting paths of the duplicate ones. Otherwise the records are partitioned
+    by size into temporary bucket files, so that sizes are counted per bucket; files of non-unique size of a bucket
+    are grouped in memory, or partitioned further by digest if they do not fit either. The sorted groups of all the
+    buckets are merged.
+
+    :param min_size: ignore files smaller than this
+    :param memory_budget: approximate memory for grouping in bytes
+    :param temp_dir: directory for the temporary files, system default if None
+    """
+    # the counting pass counts sizes as well, as long as there are not too many distinct ones for the budget
+    n_records = 0
+    size_counts: Optional[Counter] = Counter()
+    for _, size_s, _ in _records(snapshot, min_size):
+        n_records += 1
+        if size_counts is not None:
+            size_counts[int(size_s)] += 1
+            if len(size_counts) * _SIZE_OVERHEAD > memory_budget:
+                size_counts = None
+    n_buckets = _n_buckets(n_records, memory_budget, 'dedup')
+    log.debug('%d files, %d buckets', n_records, n_buckets)
+
+    if n_buckets == 1:
+        if size_counts is None:  # too many distinct sizes, counted in a pass of their own
+            size_counts = Counter(int(size_s) for _, size_s, _ in _records(snapshot, min_size))
+        sizes, _ = _shared_sizes(size_counts)
+        del size_counts
+        yield from _group(lambda: (r for r in _records(snapshot, min_size) if int(r[1]) in sizes))
+        return
+    del size_counts
+
+    import tempfile
+
+    with tempfile.TemporaryDirectory(dir=temp_dir, prefix='hstool-dedup-') as tmp, ExitStack() as stack:
+        tmp = Path(tmp)
+
+        bucket_files = [tmp / f'bucket{i}.txt' for i in range(n_buckets)]
+        _partition(_records(snapshot, min_size), bucket_files, _size_key)
+
+        group_files = []
+        for i, bucket_file in enumerate(bucket_files):
+            sizes, n_candidates = _candidate_sizes(_bucket_records(bucket_file))
+
+            def candidates():
+                return (r for r in _bucket_records(bucket_file) if int(r[1]) in sizes)
+
+            n_parts = _n_buckets(n_candidates, memory_budget, f'dedup bucket {i}') if n_candidates else 0
+            if n_parts == 1:
+                group_files.append(tmp / f'groups{i}.jsonl')
+                _write_groups(_group(candidates), group_files[-1])
+            elif n_parts > 1:  # many files of the same sizes, partition by digest
+                part_files = [tmp / f'bucket{i}-{j}.txt' for j in range(n_parts)]
+                _partition(candidates(), part_files, _digest_key)
+                for j, part_file in enumerate(part_files):
+                    group_files.append(tmp / f'groups{i}-{j}.jsonl')
+                    _write_groups(_group(lambda: _bucket_records(part_file)), group_files[-1])
+                    part_file.unlink()
+            bucket_file.unlink()
+
+        yield from _merged_groups(group_files, stack)
@@ -0,0 +1,6 @@
+# Defaults shared by the commands and their argument parser, kept free of imports so that parsing arguments does not
+# load the modules of all commands
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024  # dedup
+SHARD_KEYS = ['digest', 'path']  # shard
+DEFAULT_BATCH_SIZE = 10000  # filter --route --jobs
@@ -0,0 +1,129 @@
+import sys
+from collections import Counter
+from typing import Iterable, List, Tuple, Optional, Dict
+
+from hashdiff.fileio import InputSource
+from hashdiff.memory import budget
+from hashdiff.hstool.pathtree import PathDir, PathFile, path_parts
+
+
+class DuFile(PathFile):
+    __slots__ = ('size',)
+
+    def __init__(self, name, size=0):
+        super().__init__(name)
+        self.size = size
+
+
+class DuDir(PathDir):
+    """
+    PathDir with aggregates of its subtree: total size, number of files and size of unique contents (by digest)
+    """
+    __slots__ = ('parent', 'size', 'count', 'unique_size')
+
+    def __init__(self, name, contents=None):
+        super().__init__(name, contents)
+        self.parent: Optional[DuDir] = None
+        self.size = 0
+        self.count = 0
+        self.unique_size = 0
+
+    def add_file(self, name: str, h_record=None) -> PathFile:
+        name = sys.intern(name)
+        path_file = self.files[name] = DuFile(name, h_record.size if h_record is not None else 0)
+        return path_file
+
+    def aggregate(self, duplicates: Iterable[Tuple[int, List['DuDir']]] = ()):
+        """
+        Computes the aggregates of the whole subtree
+        :param duplicates: (size, directories containing a file of that content) for every content present more than
+                           once in the tree, subtracted from unique sizes of the common ancestors
+        """
+        preorder = [self]
+        i = 0
+        while i < len(preorder):
+            node = preorder[i]
+            for child in node.dirs.values():
+                child.parent = node
+                preorder.append(child)
+            i = i + 1
+
+        for node in reversed(preorder):  # children first
+            node.size = sum(f.size for f in node.files.values()) + sum(d.size for d in node.dirs.values())
+            node.count = len(node.files) + sum(d.count for d in node.dirs.values())
+            node.unique_size = node.size
+
+        for size, dirs in duplicates:
+            occurrences = Counter()
+            nodes = {}
+            for node in dirs:
+                while node is not None:
+                    occurrences[id(node)] += 1
+                    nodes[id(node)] = node
+                    node = node.parent if node is not self else None
+            for node_id, n in occurrences.items():
+                if n > 1:
+                    nodes[node_id].unique_size -= (n - 1) * size
+
+
+def input_source_to_du_tree(input_source: InputSource) -> DuDir:
+    """
+    Builds the tree in one pass over the records and computes the aggregates
+    """
+    tree = DuDir(".")
+    contents: Dict = {}  # digest -> directory of the first file, or [size, directories...] for duplicates
+
+    last_dir_parts, last_dir = [], tree
+    with input_source as records:
+        for h_record in budget.checked_iter('directory tree', records):
+            *dir_parts, name = path_parts(h_record.path)
+            if dir_parts != last_dir_parts:
+                last_dir_parts, last_dir = dir_parts, tree.get_dir(dir_parts)
+            last_dir.add_file(name, h_record)
+
+            seen = contents.get(h_record.digest)
+            if seen is None:
+                contents[h_record.digest] = last_dir
+            elif isinstance(seen, list):
+                seen.append(last_dir)
+            else:
+                contents[h_record.digest] = [h_record.size, seen, last_dir]
+
+    duplicates = ((seen[0], seen[1:]) for seen in contents.values() if isinstance(seen, list))
+    tree.aggregate(duplicates)
+    return tree
+
+
+def du(tree: DuDir, queries: Iterable[str], max_depth: Optional[int] = None):
+    """
+    :return: list of (node, path_parts) to report, subdirectories (up to max_depth) before their parents, and list of
+             queries not matched
+    """
+    entries = []
+    not_matched = []
+
+    queries = list(queries)
+    if len(queries) == 0:
+        queries.append(".")
+
+    for q in queries:
+        matches = tree.query(q)
+        if not matches:
+            not_matched.append(q)
+        for obj, obj_parts in matches:
+            if isinstance(obj, PathFile):
+                entries.append((obj, obj_parts))
+                continue
+            # post order, iterative
+            stack = [(obj, obj_parts, 0, False)]
+            while stack:
+                node, parts, depth, expanded = stack.pop()
+                if expanded or (max_depth is not None and depth >= max_depth):
+                    entries.append((node, parts))
+                    continue
+                stack.append((node, parts, depth, True))
+                for name in sorted(node.dirs, reverse=True):
+                    child_parts = parts + [name] if parts != ['.'] else [name]
+                    stack.append((node.dirs[name], child_parts, depth + 1, False))
+
+    return entries, not_matched
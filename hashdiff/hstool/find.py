@@ -0,0 +1,69 @@
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional, Iterable, Iterator
+
+_RELATIVE_TIME = re.compile(r'^(\d+(?:\.\d*)?)([smhdw])$')
+_TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_time(value: str) -> float:
+    """
+    Timestamp given as seconds since epoch, ISO date/time (local) or relative to now, e.g. 7d for a week ago
+    """
+    value = value.strip()
+    relative = _RELATIVE_TIME.match(value)
+    if relative:
+        return time.time() - float(relative.group(1)) * _TIME_UNITS[relative.group(2)]
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        from datetime import datetime
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f'Invalid time {value}')
+
+
+@dataclass
+class FindQuery:
+    """
+    Conjunction of the given conditions, None for no condition
+    """
+    digest: Optional[str] = None  # hex prefix
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    newer: Optional[float] = None  # mtime >= newer
+    older: Optional[float] = None  # mtime < older
+
+    def __post_init__(self):
+        if self.digest is not None:
+            self.digest = self.digest.lower()
+            if not re.fullmatch('[0-9a-f]+', self.digest):
+                raise ValueError(f'Invalid digest prefix {self.digest}')
+
+    def match_line(self, line: str) -> bool:
+        """
+        Match of a serialized record, parsed only as far as needed
+        """
+        digest_hex, size_s, mtime_s, _ = line.split('\t', 3)
+        if self.digest is not None and not digest_hex.startswith(self.digest):
+            return False
+        if self.min_size is not None or self.max_size is not None:
+            size = int(size_s)
+            if (self.min_size is not None and size < self.min_size) or \
+                    (self.max_size is not None and size > self.max_size):
+                return False
+        if self.newer is not None or self.older is not None:
+            mtime = float(mtime_s)
+            if (self.newer is not None and mtime < self.newer) or (self.older is not None and mtime >= self.older):
+                return False
+        return True
+
+
+def find(lines: Iterable[str], query: FindQuery) -> Iterator[str]:
+    """
+    Linear scan of serialized records
+    """
+    return (line for line in lines if query.match_line(line))
@@ -0,0 +1,176 @@
+import heapq
+import logging
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from hashdiff.fileio import InputSource, CompressionType
+from hashdiff.hstool.find import FindQuery
+from hashdiff.hstool.sidecar import sidecar_path, snapshot_key, write_atomic
+from hashdiff.merkle import DIRECTORY_MARKER
+
+log = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.fdidx'
+
+# Index file layout, columns are arrays of n native 64bit numbers:
+#   header
+#   digest keys    - first 8 bytes of the digest as unsigned integer, sorted
+#   digest offsets - offset of the record line in the snapshot file, for each of the digest keys
+#   sizes, size offsets     - the same for sizes (signed)
+#   mtimes, mtime offsets   - the same for modification times (double)
+_MAGIC = b'HSFDIDX1'
+_HEADER = struct.Struct('<8sQqcxxxxxxxQ')  # magic, snapshot size, mtime, byte order, number of records
+_COLUMNS = ['Q', 'Q', 'q', 'Q', 'd', 'Q']
+_BYTE_ORDER = sys.byteorder[0].encode('ascii')
+_DIGEST_KEY_DIGITS = 16
+_SORT_CHUNK = 1 << 16  # records sorted at once while building the index
+
+
+def indexable(snapshot: Path) -> bool:
+    """
+    Only uncompressed text snapshots can be read at an offset
+    """
+    with InputSource(snapshot) as input_source:
+        return not input_source.binary_pickle and input_source.compression == CompressionType.none
+
+
+def _index_chunks(snapshot: Path, key: Tuple[int, int]):
+    digests, sizes, mtimes, offsets = array('Q'), array('q'), array('d'), array('Q')
+    offset = 0
+    with open(snapshot, 'rb') as f:
+        for line in f:
+            digest_hex, size_s, mtime_s, path = line.rstrip(b'\r\n').split(b'\t', 3)
+            if not path.endswith(DIRECTORY_MARKER.encode()):
+                digests.append(int(digest_hex[:_DIGEST_KEY_DIGITS].ljust(_DIGEST_KEY_DIGITS, b'0'), 16))
+                sizes.append(int(size_s))
+                mtimes.append(float(mtime_s))
+                offsets.append(offset)
+            offset = offset + len(line)
+
+    yield _HEADER.pack(_MAGIC, key[0], key[1], _BYTE_ORDER, len(offsets))
+    for column in (digests, sizes, mtimes):
+        yield from _sorted_column(column, array('Q', offsets))
+
+
+def _sorted_column(column: array, offsets: array, chunk: int = _SORT_CHUNK) -> Iterator[bytes]:
+    """
+    The column sorted (ties by offset), then the offsets in the same order. Both arrays are sorted in place by chunks,
+    the chunks are then merged, so that only a chunk at a time is held as Python objects.
+    """
+    for start in range(0, len(column), chunk):
+        pairs = sorted(zip(column[start:start + chunk], offsets[start:start + chunk]))
+        column[start:start + chunk] = array(column.typecode, (k for k, _ in pairs))
+        offsets[start:start + chunk] = array('Q', (offset for _, offset in pairs))
+        del pairs
+
+    keys_view, offsets_view = memoryview(column), memoryview(offsets)
+    for part, typecode in enumerate([column.typecode, 'Q']):  # all the keys, then all the offsets
+        runs = [zip(keys_view[start:start + chunk], offsets_view[start:start + chunk])
+                for start in range(0, len(column), chunk)]
+        output = array(typecode)
+        for pair in heapq.merge(*runs):
+            output.append(pair[part])
+            if len(output) >= chunk:
+                yield output.tobytes()
+                del output[:]
+        yield output.tobytes()
+
+
+class FindIndex:
+    """
+    Memory mapped index file
+    """
+
+    def __init__(self, index_file: Path):
+        with open(index_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        self.magic, size, mtime_ns, self.byte_order, n = _HEADER.unpack_from(buffer)
+        self.key = (size, mtime_ns)
+        offset = _HEADER.size
+        columns = []
+        for typecode in _COLUMNS:
+            columns.append(buffer[offset:offset + n * 8].cast(typecode))
+            offset = offset + n * 8
+        self.digests, self.digest_offsets, self.sizes, self.size_offsets, self.mtimes, self.mtime_offsets = columns
+
+    def candidates(self, query: FindQuery) -> Optional[Iterator[int]]:
+        """
+        Offsets of the records possibly matching the query, from the most selective indexed condition, sorted.
+        None if there is no indexed condition.
+        """
+        ranges = []
+        if query.digest is not None:
+            prefix = query.digest[:_DIGEST_KEY_DIGITS]
+            lo = int(prefix.ljust(_DIGEST_KEY_DIGITS, '0'), 16)
+            hi = int(prefix.ljust(_DIGEST_KEY_DIGITS, 'f'), 16)
+            ranges.append((bisect_left(self.digests, lo), bisect_right(self.digests, hi), self.digest_offsets))
+        if query.min_size is not None or query.max_size is not None:
+            lo = bisect_left(self.sizes, query.min_size) if query.min_size is not None else 0
+            hi = bisect_right(self.sizes, query.max_size) if query.max_size is not None else len(self.sizes)
+            ranges.append((lo, hi, self.size_offsets))
+        if query.newer is not None or query.older is not None:
+            lo = bisect_left(self.mtimes, query.newer) if query.newer is not None else 0
+            hi = bisect_left(self.mtimes, query.older) if query.older is not None else len(self.mtimes)
+            ranges.append((lo, hi, self.mtime_offsets))
+        if not ranges:
+            return None
+        lo, hi, offsets = min(ranges, key=lambda r: r[1] - r[0])
+        return iter(sorted(offsets[lo:max(lo, hi)]))
+
+
+def open_index(index_file: Path, key: Tuple[int, int]) -> Optional[FindIndex]:
+    """
+    The index, None if there is no index or it is stale
+    """
+    try:
+        index = FindIndex(index_file)
+    except (OSError, ValueError, struct.error):
+        return None
+    if index.magic != _MAGIC or index.byte_order != _BYTE_ORDER or index.key != key:
+        log.info('Index %s is stale', index_file)
+        return None
+    return index
+
+
+def cached_index(snapshot: Path) -> Optional[FindIndex]:
+    """
+    Index stored next to the snapshot, (re)built first if needed. None if the snapshot can not be indexed or the index
+    can not be written.
+    """
+    if not indexable(snapshot):
+        log.warning('Index available only for uncompressed text files, see hstool convert')
+        return None
+
+    index_file = sidecar_path(snapshot, INDEX_SUFFIX)
+    key = snapshot_key(snapshot)
+    index = open_index(index_file, key)
+    if index is None:
+        log.info('Building index %s', index_file)
+        if write_atomic(index_file, _index_chunks(snapshot, key)):
+            index = open_index(index_file, key)
+    return index
+
+
+def find_indexed(snapshot: Path, index: FindIndex, query: FindQuery) -> Iterator[str]:
+    """
+    Matching serialized records, reading only the candidates given by the index
+    """
+    offsets = index.candidates(query)
+    with open(snapshot, 'rb') as f:
+        if offsets is None:  # nothing indexed to narrow it down
+            lines = (line.decode('utf-8') for line in f)
+        else:
+            def lines_at_offsets():
+                for offset in offsets:
+                    f.seek(offset)
+                    yield f.readline().decode('utf-8')
+            lines = lines_at_offsets()
+        for line in lines:
+            if not line.rstrip().endswith(DIRECTORY_MARKER) and query.match_line(line):
+                yield line
@@ -1,18 +1,27 @@
 import logging
+import os
 import re
 import sys
 from argparse import Namespace
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Optional
 
 import hashdiff.logger
-from hashdiff.fileio import InputSource, OutputSink, NullOutputSink, FileOutputSink
+import hashdiff.memory
+import hashdiff.profiling
+from hashdiff.fileio import InputSource, OutputSink, NullOutputSink, FileOutputSink, input_file_type_heuristic, \
+    CompressionType
 from hashdiff.hstool.args import parse_args
 from hashdiff.hstool.pathtree import input_source_to_path_tree, PathFile, PathDir
+from hashdiff.humanizer import humanize_size, humanize_size_dual
+from hashdiff.memory import budget, estimate_records_memory
 from hashdiff.normalize import NormalizePaths
 
 log = logging.getLogger(__package__)
 
+# modules of the commands are imported in the commands, hstool is often run many times from scripts and every
+# invocation would otherwise pay for importing all of them
+
 
 def cli_main():
     args_raw = parse_args()  # argparse
@@ -23,22 +32,37 @@ def cli_main():
     # mapping of cli commands to functions
     func = {
         "filter": cli_filter,
-        "ls": cli_ls
+        "ls": cli_ls,
+        "du": cli_du,
+        "dedup": cli_dedup,
+        "merge": cli_merge,
+        "convert": cli_convert,
+        "verify": cli_verify,
+        "find": cli_find,
+        "shard": cli_shard
     }[args_raw.hst_command]
 
-    func(args_raw)
+    with hashdiff.profiling.profile_from_args(args_raw), hashdiff.memory.budget_from_args(args_raw):
+        func(args_raw)
 
     sys.exit(0)
 
 
-def _cli_input_arg_to_input_source(args: Namespace) -> InputSource:
+def _cli_input_arg_to_file(args: Namespace) -> Optional[Path]:
     if (args.input is not None) and (args.input != "-"):
         try:
-            input_file = Path(args.input).resolve(strict=True)
-            return InputSource(input_file)
+            return Path(args.input).resolve(strict=True)
         except FileNotFoundError as e:
             log.exception('Unable to resolve source file %s', e.filename)
             raise SystemExit(2)
+    else:
+        return None
+
+
+def _cli_input_arg_to_input_source(args: Namespace) -> InputSource:
+    input_file = _cli_input_arg_to_file(args)
+    if input_file is not None:
+        return InputSource(input_file)
     else:
         return InputSource()
 
@@ -46,51 +70,56 @@ def _cli_input_arg_to_input_source(args: Namespace) -> InputSource:
 def cli_filter(args):
     input_source = _cli_input_arg_to_input_source(args)
 
-    matched_sink = NullOutputSink()
-    not_matched_sink = NullOutputSink()
-    if (args.matched is None) and (args.not_matched is None):  # default: output matched to stdout
-        matched_sink = FileOutputSink()
-    else:
-        if args.matched is not None:
-            if args.matched == "-":
-                matched_sink = FileOutputSink()
-            else:
-                matched_sink = FileOutputSink(args.matched)
-        if args.not_matched is not None:
-            if args.matched == "-":
-                not_matched_sink = FileOutputSink()
-            else:
-                not_matched_sink = FileOutputSink(args.not_matched)
+    patterns = args.pattern or []
+    routes = args.route or []
+    if not patterns and not routes:
+        log.error('At least one --pattern or --route required')
+        raise SystemExit(2)
+
+    from hashdiff.hstool.split import split
 
-    for p in args.pattern:
+    for p in patterns + [pattern for _, pattern in routes]:
         try:
             re.compile(p)
         except re.error as e:
             log.exception("Invalid pattern %s", p)
             raise SystemExit(2)
 
-    filter(
+    # one sink per output file name, shared by all patterns writing there
+    sinks = {}
+
+    def sink(file_name: str) -> OutputSink:
+        if file_name not in sinks:
+            sinks[file_name] = FileOutputSink() if file_name == "-" else FileOutputSink(file_name)
+        return sinks[file_name]
+
+    matched_sink = NullOutputSink()
+    not_matched_sink = NullOutputSink()
+    if (args.matched is None) and (args.not_matched is None) and not routes:  # default: output matched to stdout
+        matched_sink = sink("-")
+    else:
+        if args.matched is not None:
+            matched_sink = sink(args.matched)
+        if args.not_matched is not None:
+            not_matched_sink = sink(args.not_matched)
+
+    split(
         input_source=input_source,
-        patterns=args.pattern,
-        matched_sink=matched_sink,
-        not_matched_sink=not_matched_sink
+        patterns=patterns + [pattern for _, pattern in routes],
+        sinks=[matched_sink] * len(patterns) + [sink(file_name) for file_name, _ in routes],
+        not_matched_sink=not_matched_sink,
+        jobs=args.jobs,
+        batch_size=args.batch_size
     )
 
 
 def filter(input_source: InputSource,
            patterns: Iterable[str],
-           matched_sink: OutputSink, not_matched_sink: OutputSink):
-    compiled_patterns = [re.compile(p) for p in patterns]
+           matched_sink: OutputSink, not_matched_sink: OutputSink, jobs: int = 1):
+    from hashdiff.hstool.split import split
 
-    with input_source as records:
-        with matched_sink as matched:
-            with not_matched_sink as not_matched:
-                for h_record in records:
-                    matches = [p.match(h_record.path) for p in compiled_patterns]
-                    if any(matches):
-                        matched.write(h_record)
-                    else:
-                        not_matched.write(h_record)
+    patterns = list(patterns)
+    split(input_source, patterns, [matched_sink] * len(patterns), not_matched_sink, jobs=jobs)
 
 
 def cli_ls(args):
@@ -99,7 +128,21 @@ def cli_ls(args):
     if args.normalize_paths:
         input_source.normalize_paths = NormalizePaths.NATIVE
 
-    tree = input_source_to_path_tree(input_source)
+    input_file = _cli_input_arg_to_file(args)
+    estimate = estimate_records_memory(input_file) if input_file is not None else 0
+    if input_file is not None and not budget.fits(estimate):
+        # building the tree would not fit, use the index only if it is already there
+        from hashdiff.hstool.lsindex import existing_path_tree
+        tree = existing_path_tree(input_file, normalized=args.normalize_paths)
+        if tree is None:
+            budget.require(estimate, 'Directory tree', ', run ls --index once without --max-memory to build the index')
+    elif args.index and input_file is not None:
+        from hashdiff.hstool.lsindex import cached_path_tree
+        tree = cached_path_tree(input_file, input_source, normalized=args.normalize_paths)
+    else:
+        if args.index:
+            log.warning('Index not available for stdin input')
+        tree = input_source_to_path_tree(input_source)
 
     queries = args.FILE
 
@@ -162,3 +205,223 @@ def _cli_ls_print_output(matched_dirs, matched_files, not_matched):
                 print()
             is_first = False
             print_dir(matched_dirs[dir], dir)
+
+
+def cli_du(args):
+    from hashdiff.hstool.du import input_source_to_du_tree, du
+
+    input_source = _cli_input_arg_to_input_source(args)
+
+    if args.normalize_paths:
+        input_source.normalize_paths = NormalizePaths.NATIVE
+
+    tree = input_source_to_du_tree(input_source)
+
+    entries, not_matched = du(tree, args.FILE, args.max_depth)
+
+    size_format = humanize_size if args.human_readable else str
+    for n in not_matched:
+        log.warning(f"cannot access '%s': No such file or directory", n)
+    for obj, path_parts in entries:
+        full_path = str(Path(*path_parts))
+        if isinstance(obj, PathFile):
+            print(f'{size_format(obj.size)}\t1\t{size_format(obj.size)}\t{full_path}')
+        else:
+            print(f'{size_format(obj.size)}\t{obj.count}\t{size_format(obj.unique_size)}\t{full_path}')
+
+    if len(not_matched) > 0:
+        raise SystemExit(2)
+    else:
+        raise SystemExit(0)
+
+
+def cli_dedup(args):
+    import tempfile
+    from hashdiff.hstool.dedup import duplicate_groups, spool
+
+    input_file = _cli_input_arg_to_file(args)
+
+    with tempfile.TemporaryDirectory(dir=args.temp_dir, prefix='hstool-') as tmp:
+        if input_file is None:  # two passes needed
+            input_file = Path(tmp) / 'stdin.hsn'
+            spool(InputSource(), input_file)
+
+        memory_budget = args.memory_budget * 1024 * 1024
+        if budget.enabled:
+            memory_budget = min(memory_budget, budget.available())
+        groups = duplicate_groups(input_file, min_size=args.min_size, memory_budget=memory_budget,
+                                  temp_dir=args.temp_dir)
+
+        total, n_groups = 0, 0
+        for group in groups:
+            if args.limit is None or n_groups < args.limit:
+                print(f'{humanize_size(group.reclaimable)} reclaimable, {len(group.paths)} copies of '
+                      f'{humanize_size(group.size)}, digest {group.digest.hex()[:16]}')
+                for path in group.paths:
+                    print(f'\t{path}')
+            total += group.reclaimable
+            n_groups += 1
+
+    print(f'Total reclaimable: {humanize_size_dual(total)} in {n_groups} groups')
+
+
+def cli_merge(args):
+    from hashdiff.hstool.merge import merge, MergeConflict, UnsortedInput
+
+    if args.INPUT.count("-") > 1:
+        log.error('Stdin can be used only once')
+        raise SystemExit(2)
+
+    inputs = []
+    for name in args.INPUT:
+        if name == "-":
+            inputs.append(("stdin", InputSource()))
+        else:
+            try:
+                inputs.append((name, InputSource(Path(name))))
+            except FileNotFoundError as e:
+                log.error('Unable to resolve source file %s', e.filename)
+                raise SystemExit(2)
+
+    temp_file = None
+    if args.output is None or args.output == "-":
+        output_sink = FileOutputSink()
+    else:
+        output_file = Path(args.output)
+        binary_pickle, compression = input_file_type_heuristic(output_file)
+        # written via a temporary file moved into place on success, a failed merge leaves no partial output
+        temp_file = output_file.with_name(f'.{output_file.name}.{os.getpid()}.tmp')
+        output_sink = FileOutputSink(temp_file, binary_pickle=binary_pickle, compression=compression)
+
+    try:
+        conflicts = merge(inputs, output_sink, sort_inputs=args.sort_inputs, strict=args.strict)
+        if temp_file is not None:
+            os.replace(temp_file, output_file)
+    except MergeConflict as e:
+        log.error('%s', e)
+        raise SystemExit(2)
+    except UnsortedInput as e:
+        log.error('%s, use --sort-inputs', e)
+        raise SystemExit(2)
+    finally:
+        if temp_file is not None and temp_file.exists():
+            temp_file.unlink()
+
+    if conflicts > 0:
+        log.warning('%d conflicting records', conflicts)
+
+
+def cli_convert(args):
+    from hashdiff.hstool.convert import convert
+
+    input_file = None if args.INPUT == "-" else Path(args.INPUT)
+    output_file = None if args.OUTPUT == "-" else Path(args.OUTPUT)
+
+    if output_file is not None:
+        binary_pickle, compression = input_file_type_heuristic(output_file)
+    else:
+        binary_pickle, compression = False, CompressionType.none
+    if args.binary_pickle is not None:
+        binary_pickle = args.binary_pickle
+    if args.compression is not None:
+        compression = args.compression
+    if output_file is None and compression != CompressionType.none:
+        log.error('Compressed output into stdout not supported')
+        raise SystemExit(2)
+    if input_file is not None and output_file is not None and input_file.resolve() == output_file.resolve():
+        log.error('Input and output are the same file %s', input_file)
+        raise SystemExit(2)
+
+    try:
+        input_source = InputSource(input_file)
+    except FileNotFoundError as e:
+        log.error('Unable to resolve source file %s', e.filename)
+        raise SystemExit(2)
+
+    convert(input_source, output_file, binary_pickle, compression, input_file=input_file)
+
+
+def cli_verify(args):
+    from hashdiff.hstool.verify import verify, Throttle, Status
+
+    input_source = _cli_input_arg_to_input_source(args)
+
+    if args.normalize_paths:
+        input_source.normalize_paths = NormalizePaths.NATIVE
+
+    if not 0 <= args.sample <= 1:
+        log.error('Sample rate has to be between 0 and 1')
+        raise SystemExit(2)
+
+    root = Path(args.ROOT)
+    if not root.is_dir():
+        log.error('%s is not a directory', root)
+        raise SystemExit(2)
+
+    throttle = Throttle(args.bandwidth_limit) if args.bandwidth_limit else None
+
+    counts = {status: 0 for status in Status}
+    with input_source as records:
+        for status, h_record in verify(records, root, jobs=args.jobs, sample=args.sample, seed=args.seed,
+                                       throttle=throttle):
+            counts[status] += 1
+            if status != Status.OK or args.all:
+                print(f'{status.value}\t{h_record.path}', flush=True)
+
+    log.info('Verified %d files: %s', sum(counts.values()),
+             ', '.join(f'{n} {status.value.lower()}' for status, n in counts.items() if n > 0) or 'none')
+
+    if any(n > 0 for status, n in counts.items() if status != Status.OK):
+        raise SystemExit(1)
+
+
+def cli_find(args):
+    from hashdiff.hstool.find import FindQuery, find
+    from hashdiff.hstool.findindex import cached_index, find_indexed
+
+    try:
+        query = FindQuery(digest=args.digest, min_size=args.min_size, max_size=args.max_size, newer=args.newer,
+                          older=args.older)
+    except ValueError as e:
+        log.error('%s', e)
+        raise SystemExit(2)
+
+    input_file = _cli_input_arg_to_file(args)
+    index = None
+    if args.index:
+        if input_file is not None:
+            index = cached_index(input_file)
+        else:
+            log.warning('Index not available for stdin input')
+
+    if index is not None:
+        sys.stdout.writelines(find_indexed(input_file, index, query))
+    else:
+        with _cli_input_arg_to_input_source(args) as input_source:
+            sys.stdout.writelines(find(input_source.text_lines(), query))
+
+
+def cli_shard(args):
+    from hashdiff.hstool.shard import shard
+
+    input_source = _cli_input_arg_to_input_source(args)
+
+    if args.shards < 1:
+        log.error('Number of shards has to be positive')
+        raise SystemExit(2)
+
+    try:
+        output_files = [Path(args.output.format(shard=i)) for i in range(args.shards)]
+    except (KeyError, IndexError, ValueError) as e:
+        log.error('Invalid output template %s: %s', args.output, e)
+        raise SystemExit(2)
+    if len(set(output_files)) != len(output_files):
+        log.error('Output template %s has to contain {shard}', args.output)
+        raise SystemExit(2)
+
+    sinks = []
+    for output_file in output_files:
+        binary_pickle, compression = input_file_type_heuristic(output_file)
+        sinks.append(FileOutputSink(output_file, binary_pickle=binary_pickle, compression=compression))
+
+    shard(input_source, sinks, by=args.by)
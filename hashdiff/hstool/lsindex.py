@@ -0,0 +1,194 @@
+import logging
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Optional, Tuple, Dict
+
+from hashdiff.fileio import InputSource
+from hashdiff.hstool.pathtree import PathDir, PathFile, input_source_to_path_tree
+from hashdiff.hstool.sidecar import sidecar_path, snapshot_key, write_atomic
+
+log = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.lsidx'
+
+# Index file layout, tables are arrays of native unsigned 64bit integers:
+#   header
+#   directory table - 6 integers per directory: name offset, name length, first child directory, number of child
+#                     directories, first file, number of files; children of a directory are stored consecutively,
+#                     sorted by name, the root directory is the first one
+#   file table      - 2 integers per file: name offset, name length
+#   names           - utf-8 encoded names
+_MAGIC = b'HSLSIDX1'
+_HEADER = struct.Struct('<8sQqBcxxxxxxQQQ')  # magic, snapshot size, mtime, normalized, byte order, counts, names len
+_DIR_FIELDS = 6
+_FILE_FIELDS = 2
+_BYTE_ORDER = sys.byteorder[0].encode('ascii')
+
+
+def _key(snapshot: Path, normalized: bool) -> Tuple[int, int, bool]:
+    return snapshot_key(snapshot) + (normalized,)
+
+
+def _index_chunks(tree: PathDir, key: Tuple[int, int, bool]):
+    names = bytearray()
+    name_refs: Dict[str, Tuple[int, int]] = {}
+
+    def name_ref(name: str) -> Tuple[int, int]:
+        try:
+            return name_refs[name]
+        except KeyError:
+            encoded = name.encode('utf-8', 'surrogateescape')
+            ref = name_refs[name] = (len(names), len(encoded))
+            names.extend(encoded)
+            return ref
+
+    dirs = array('Q', name_ref(tree.name) + (0, 0, 0, 0))
+    files = array('Q')
+    order = [tree]  # breadth first, grows as we go
+    i = 0
+    while i < len(order):
+        node = order[i]
+        first_dir = len(order)
+        for name in sorted(node.dirs):
+            order.append(node.dirs[name])
+            dirs.extend(name_ref(name) + (0, 0, 0, 0))
+        first_file = len(files) // _FILE_FIELDS
+        for name in sorted(node.files):
+            files.extend(name_ref(name))
+        dirs[i * _DIR_FIELDS + 2:i * _DIR_FIELDS + 6] = array('Q', [first_dir, len(node.dirs),
+                                                                      first_file, len(node.files)])
+        i = i + 1
+
+    size, mtime_ns, normalized = key
+    yield _HEADER.pack(_MAGIC, size, mtime_ns, normalized, _BYTE_ORDER,
+                       len(dirs) // _DIR_FIELDS, len(files) // _FILE_FIELDS, len(names))
+    yield dirs.tobytes()
+    yield files.tobytes()
+    yield bytes(names)
+
+
+class _PathIndex:
+    """
+    Memory mapped index file
+    """
+
+    def __init__(self, index_file: Path):
+        with open(index_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        (self.magic, size, mtime_ns, normalized, byte_order,
+         n_dirs, n_files, names_len) = _HEADER.unpack_from(buffer)
+        self.key = (size, mtime_ns, bool(normalized))
+        self.byte_order = byte_order
+        offset = _HEADER.size
+        self.dirs = buffer[offset:offset + n_dirs * _DIR_FIELDS * 8].cast('Q')
+        offset = offset + n_dirs * _DIR_FIELDS * 8
+        self.files = buffer[offset:offset + n_files * _FILE_FIELDS * 8].cast('Q')
+        offset = offset + n_files * _FILE_FIELDS * 8
+        self.names = buffer[offset:offset + names_len]
+
+    def name(self, offset: int, length: int) -> str:
+        return bytes(self.names[offset:offset + length]).decode('utf-8', 'surrogateescape')
+
+    def dir_name(self, i: int) -> str:
+        return self.name(self.dirs[i * _DIR_FIELDS], self.dirs[i * _DIR_FIELDS + 1])
+
+    def file_name(self, i: int) -> str:
+        return self.name(self.files[i * _FILE_FIELDS], self.files[i * _FILE_FIELDS + 1])
+
+
+class _IndexedChildren(Mapping):
+    """
+    Read only name -> node mapping over a sorted range of the directory or file table
+    """
+
+    def __init__(self, index: _PathIndex, first: int, count: int, is_dir: bool):
+        self._index = index
+        self._first = first
+        self._count = count
+        self._is_dir = is_dir
+
+    def _name(self, i: int) -> str:
+        return self._index.dir_name(i) if self._is_dir else self._index.file_name(i)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._first, self._first + self._count):
+            yield self._name(i)
+
+    def __getitem__(self, name: str):
+        lo, hi = self._first, self._first + self._count
+        while lo < hi:  # binary search on names
+            mid = (lo + hi) // 2
+            mid_name = self._name(mid)
+            if mid_name < name:
+                lo = mid + 1
+            elif mid_name > name:
+                hi = mid
+            else:
+                return IndexedPathDir(self._index, mid) if self._is_dir else PathFile(mid_name)
+        raise KeyError(name)
+
+
+class IndexedPathDir(PathDir):
+    """
+    PathDir backed by a memory mapped index, read only
+    """
+    __slots__ = ('_index',)
+
+    def __init__(self, index: _PathIndex, i: int = 0):
+        self._index = index
+        first_dir, n_dirs, first_file, n_files = index.dirs[i * _DIR_FIELDS + 2:i * _DIR_FIELDS + 6]
+        self.name = index.dir_name(i)
+        self.dirs = _IndexedChildren(index, first_dir, n_dirs, is_dir=True)
+        self.files = _IndexedChildren(index, first_file, n_files, is_dir=False)
+
+    def add(self, child):
+        raise TypeError('Indexed tree is read only')
+
+
+def open_index(index_file: Path, key: Tuple[int, int, bool]) -> Optional[IndexedPathDir]:
+    """
+    Root of the indexed tree, None if there is no index or it is stale
+    """
+    try:
+        index = _PathIndex(index_file)
+    except (OSError, ValueError, struct.error):
+        return None
+    if index.magic != _MAGIC or index.byte_order != _BYTE_ORDER or index.key != key:
+        log.info('Index %s is stale', index_file)
+        return None
+    return IndexedPathDir(index)
+
+
+def existing_path_tree(snapshot: Path, normalized: bool) -> Optional[PathDir]:
+    """
+    Path tree of the snapshot from the index stored next to it, None if there is no up to date index
+    """
+    index_file = sidecar_path(snapshot, INDEX_SUFFIX)
+    tree = open_index(index_file, _key(snapshot, normalized))
+    if tree is not None:
+        log.debug('Using index %s', index_file)
+    return tree
+
+
+def cached_path_tree(snapshot: Path, input_source: InputSource, normalized: bool) -> PathDir:
+    """
+    Path tree of the snapshot from the index stored next to it, the index is (re)built first if needed
+    """
+    tree = existing_path_tree(snapshot, normalized)
+    if tree is not None:
+        return tree
+
+    index_file = sidecar_path(snapshot, INDEX_SUFFIX)
+    key = _key(snapshot, normalized)
+    log.info('Building index %s', index_file)
+    tree = input_source_to_path_tree(input_source)
+    write_atomic(index_file, _index_chunks(tree, key))
+    return tree
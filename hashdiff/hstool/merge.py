@@ -0,0 +1,79 @@
+import heapq
+import logging
+from contextlib import ExitStack
+from operator import itemgetter
+from typing import Iterator, List, Tuple
+
+from hashdiff.fileio import InputSource, OutputSink
+from hashdiff.memory import budget
+
+log = logging.getLogger(__name__)
+
+
+class MergeConflict(ValueError):
+    pass
+
+
+class UnsortedInput(ValueError):
+    pass
+
+
+def _record_path(line: str) -> str:
+    return line.rstrip('\n').split('\t', 3)[3]
+
+
+def _path_sorted(name: str, lines: Iterator[str], sort: bool) -> Iterator[Tuple[str, str]]:
+    """
+    (path, line) of an input sorted by path, checks the order unless asked to sort the input (in memory)
+    """
+    if sort:
+        lines = budget.checked_iter(f'sorting {name}', lines)
+        yield from sorted(((_record_path(line), line) for line in lines), key=itemgetter(0))
+        return
+    previous = None
+    for line in lines:
+        path = _record_path(line)
+        if previous is not None and path < previous:
+            raise UnsortedInput(f'Input {name} is not sorted by path, {previous} is followed by {path}')
+        previous = path
+        yield path, line
+
+
+def _tagged(i: int, stream: Iterator[Tuple[str, str]]) -> Iterator[Tuple[str, int, str]]:
+    for path, line in stream:
+        yield path, i, line
+
+
+def merge(inputs: List[Tuple[str, InputSource]], output_sink: OutputSink, sort_inputs: bool = False,
+          strict: bool = False) -> int:
+    """
+    Merges snapshots sorted by path into one sorted snapshot, streaming. Records with the same path in more inputs are
+    written once; if they differ, it is a conflict and the record from the first of the inputs is kept.
+    :param inputs: (name for messages, input source) for each input
+    :param sort_inputs: sort the inputs in memory first, instead of requiring them sorted
+    :param strict: raise MergeConflict on the first conflict
+    :raises UnsortedInput: an input is not sorted by path and sort_inputs is not set
+    :return: number of conflicts
+    """
+    conflicts = 0
+    with ExitStack() as stack:
+        streams = []
+        for i, (name, input_source) in enumerate(inputs):
+            records = stack.enter_context(input_source)
+            streams.append(_tagged(i, _path_sorted(name, records.text_lines(), sort_inputs)))
+        stack.enter_context(output_sink)
+
+        kept_path, kept_input, kept_record = None, None, None
+        for path, i, line in heapq.merge(*streams, key=itemgetter(0)):  # stable, ties come in order of inputs
+            record = line.rstrip('\n')
+            if path == kept_path:
+                if record != kept_record:
+                    conflicts = conflicts + 1
+                    message = f'Conflicting records of {path} in {inputs[kept_input][0]} and {inputs[i][0]}'
+                    if strict:
+                        raise MergeConflict(message)
+                    log.warning('%s, keeping the first one', message)
+                continue
+            kept_path, kept_input, kept_record = path, i, record
+            output_sink.write_line(line)
+    return conflicts
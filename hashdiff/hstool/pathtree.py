@@ -1,31 +1,53 @@
+import os
+import sys
 from collections import namedtuple, deque
 from contextlib import suppress
 from fnmatch import fnmatch
-from pathlib import Path
-from typing import Dict, Deque, Iterable
+from pathlib import Path, PurePath
+from typing import Dict, Deque, Iterable, Sequence
 
 from hashdiff.fileio import InputSource
+from hashdiff.memory import budget
 
 
-def input_source_to_path_tree(input_source: InputSource):
-    tree = PathDir(".")
+def path_parts(path: str) -> Sequence[str]:
+    """
+    Same as Path(path).parts, with a fast path for plain relative paths
+    """
+    if os.altsep:
+        path = path.replace(os.altsep, os.sep)
+    parts = path.split(os.sep)
+    if os.name == 'nt' or '' in parts or '.' in parts:  # drives, roots, redundant separators - leave it to pathlib
+        return PurePath(path).parts
+    return parts
+
+
+def input_source_to_path_tree(input_source: InputSource, tree=None):
+    if tree is None:
+        tree = PathDir(".")
+
+    # records usually come grouped by directory, reuse the directory of the previous record if possible
+    last_dir_parts, last_dir = [], tree
 
     with input_source as records:
-        for h_record in records:
-            path = Path(h_record.path)
-            parts = path.parts
-            tree.add(parts)
+        for h_record in budget.checked_iter('directory tree', records):
+            *dir_parts, name = path_parts(h_record.path)
+            if dir_parts != last_dir_parts:
+                last_dir_parts, last_dir = dir_parts, tree.get_dir(dir_parts)
+            last_dir.add_file(name, h_record)
 
     return tree
 
 
 class PathFile:
+    __slots__ = ('name',)
 
     def __init__(self, name):
         self.name = name
 
 
 class PathDir:
+    __slots__ = ('name', 'dirs', 'files')
 
     def __init__(self, name, contents=None):
         self.name = name
@@ -44,18 +66,38 @@ class PathDir:
         elif isinstance(child, list) or isinstance(child, tuple):  # components
             if len(child) == 0:
                 raise ValueError
-            if len(child) == 1:
-                name = child[0]
-                self.files[name] = PathFile(name)
-            else:
-                (directory, *rest) = child
-                if directory in self.dirs:
-                    self.dirs[directory].add(rest)
-                else:
-                    self.dirs[directory] = PathDir(directory, [rest])
+            self.add_parts(child)
         else:
             raise ValueError
 
+    def add_parts(self, parts: Sequence[str]) -> PathFile:
+        """
+        Adds file given by path components, creating directories on the way as needed
+        """
+        *dir_parts, name = parts
+        return self.get_dir(dir_parts).add_file(name)
+
+    def get_dir(self, parts: Iterable[str]) -> 'PathDir':
+        """
+        Subdirectory given by path components, created if not there yet
+        """
+        node = self
+        for directory in parts:
+            try:
+                node = node.dirs[directory]
+            except KeyError:
+                directory = sys.intern(directory)
+                node.dirs[directory] = node = type(self)(directory)
+        return node
+
+    def add_file(self, name: str, h_record=None) -> PathFile:
+        """
+        :param h_record: record of the file, unused here, for subclasses keeping file attributes
+        """
+        name = sys.intern(name)
+        path_file = self.files[name] = PathFile(name)
+        return path_file
+
     def query(self, path):
         if isinstance(path, Path):
             return self.query_parts(path.parts)
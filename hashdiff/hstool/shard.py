@@ -0,0 +1,47 @@
+from contextlib import ExitStack
+from typing import List, Callable
+
+from hashdiff.fileio import InputSource, OutputSink
+
+
+def _digest_shard(line: str, n: int) -> int:
+    # digests are uniformly distributed already, the first 16 hex digits are enough - or less of a short digest
+    digest_hex = line[:min(line.index('\t'), 16)]
+    return int(digest_hex, 16) % n if digest_hex else 0
+
+
+def _path_shard_function() -> Callable[[str, int], int]:
+    from hashlib import blake2b  # not needed for the other commands, imported only here for fast startup
+
+    def path_shard(line: str, n: int) -> int:
+        path = line.rstrip('\n').split('\t', 3)[3]
+        key = blake2b(path.encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+        return int.from_bytes(key, 'big') % n
+
+    return path_shard
+
+
+def shard_function(by: str) -> Callable[[str, int], int]:
+    """
+    Stable mapping of a serialized record to its shard, the same across runs, machines and input files
+    """
+    if by == 'digest':
+        return _digest_shard
+    elif by == 'path':
+        return _path_shard_function()
+    raise ValueError(f'Unknown shard key {by}')
+
+
+def shard(input_source: InputSource, sinks: List[OutputSink], by: str = 'digest'):
+    """
+    Partitions the records into the sinks, in one pass, records with the same key go into the same sink
+    :param by: partitioning key, digest or path
+    """
+    shard_of = shard_function(by)
+    n = len(sinks)
+    with ExitStack() as stack:
+        records = stack.enter_context(input_source)
+        for sink in sinks:
+            stack.enter_context(sink)
+        for line in records.text_lines():
+            sinks[shard_of(line, n)].write_line(line)
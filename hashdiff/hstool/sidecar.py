@@ -0,0 +1,42 @@
+import logging
+import os
+from pathlib import Path
+from typing import Tuple, Iterable
+
+log = logging.getLogger(__name__)
+
+
+def sidecar_path(snapshot: Path, suffix: str) -> Path:
+    """
+    Path of a file stored next to the snapshot, e.g. an index
+    """
+    return snapshot.with_name(snapshot.name + suffix)
+
+
+def snapshot_key(snapshot: Path) -> Tuple[int, int]:
+    """
+    (size, mtime in ns) of the snapshot, sidecar files built from a different key are stale
+    """
+    stat = snapshot.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_atomic(path: Path, chunks: Iterable[bytes]) -> bool:
+    """
+    Writes the file via a temporary one, so that readers never see it half written
+    :return: False if the file could not be written (e.g. read only directory)
+    """
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        log.warning('Unable to write %s: %s', path, e.strerror)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,91 @@
+import logging
+from collections import deque
+from contextlib import ExitStack
+from itertools import islice
+from typing import List, Iterable, Iterator
+
+from hashdiff.fileio import InputSource, OutputSink
+from hashdiff.hstool.defaults import DEFAULT_BATCH_SIZE
+from hashdiff.matcher import PathMatcher
+from hashdiff.serialize import deserialize
+
+log = logging.getLogger(__name__)
+
+_matcher = None  # per process matcher, see _init_matcher
+
+
+def _init_matcher(patterns: List[str]):
+    global _matcher
+    _matcher = PathMatcher(patterns)
+
+
+def _match_batch(lines: List[str]) -> List[int]:
+    """
+    Deserializes the lines and returns index of the first matching pattern for each of them, -1 for no match
+    """
+    match_index = _matcher.match_index
+    indices = []
+    for line in lines:
+        index = match_index(deserialize(line).path)
+        indices.append(-1 if index is None else index)
+    return indices
+
+
+def _batches(lines: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    iterator = iter(lines)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _matched_batches(batches: Iterator[List[str]], patterns: List[str], jobs: int):
+    """
+    Yields (batch, indices) in input order, with matching done by a pool of jobs worker processes
+    """
+    if jobs <= 1:
+        _init_matcher(patterns)
+        for batch in batches:
+            yield batch, _match_batch(batch)
+        return
+
+    from multiprocessing import Pool  # slow to import, needed only with more jobs
+
+    with Pool(jobs, initializer=_init_matcher, initargs=(patterns,)) as pool:
+        in_flight = deque()  # bounded, so that we do not read the whole input ahead of the output
+        for batch in batches:
+            in_flight.append((batch, pool.apply_async(_match_batch, (batch,))))
+            if len(in_flight) >= 2 * jobs:
+                batch, result = in_flight.popleft()
+                yield batch, result.get()
+        while in_flight:
+            batch, result = in_flight.popleft()
+            yield batch, result.get()
+
+
+def split(input_source: InputSource, patterns: List[str], sinks: List[OutputSink], not_matched_sink: OutputSink,
+          jobs: int = 1, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Writes every record into the sink of the first pattern it matches, or into the not_matched_sink.
+    Records are processed in batches, by a pool of worker processes if jobs > 1, output order is preserved.
+    :param patterns: path regexps, re.match semantics
+    :param sinks: sink for each of the patterns, the same sink can be given for more patterns
+    """
+    if len(patterns) != len(sinks):
+        raise ValueError('Number of sinks does not match number of patterns')
+
+    routes = list(sinks) + [not_matched_sink]  # index -1 for not matched
+
+    with ExitStack() as stack:
+        records = stack.enter_context(input_source)
+        opened = set()
+        for sink in routes:
+            if id(sink) not in opened:
+                opened.add(id(sink))
+                stack.enter_context(sink)
+
+        batches = _batches(records.text_lines(), batch_size)
+        for batch, indices in _matched_batches(batches, patterns, jobs):
+            for line, index in zip(batch, indices):
+                routes[index].write_line(line)
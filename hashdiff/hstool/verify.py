@@ -0,0 +1,105 @@
+import logging
+import os
+import random
+import stat
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from hashdiff.common import HsnapRecord
+from hashdiff.hsnap.hash import file_sha512
+
+log = logging.getLogger(__name__)
+
+
+class Status(Enum):
+    OK = 'OK'
+    CHANGED = 'CHANGED'  # different digest
+    SIZE = 'SIZE'  # different size, not hashed
+    MISSING = 'MISSING'
+    ERROR = 'ERROR'  # unable to read
+
+
+class Throttle:
+    """
+    Token bucket limiting the rate of reading, shared by all the hashing threads
+    """
+
+    def __init__(self, bytes_per_second: int, burst: Optional[int] = None):
+        self.rate = bytes_per_second
+        self.burst = burst if burst is not None else max(bytes_per_second, 2 ** 20)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n: int):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:  # the debt is paid by waiting, other threads wait for it too
+            time.sleep(wait)
+
+
+def _check_stat(path: Path, h_record: HsnapRecord) -> Optional[Status]:
+    """
+    Status found without hashing the file, None if it needs to be hashed
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return Status.MISSING
+    except OSError as e:
+        log.warning('Unable to stat %s: %s', path, e.strerror)
+        return Status.ERROR
+    if not stat.S_ISREG(st.st_mode):
+        return Status.MISSING
+    if st.st_size != h_record.size:
+        return Status.SIZE
+    return None
+
+
+def _check_digest(path: Path, h_record: HsnapRecord, throttle: Optional[Throttle]) -> Status:
+    try:
+        digest = file_sha512(path, throttle.consume if throttle is not None else None)
+    except OSError as e:
+        log.warning('Unable to read %s: %s', path, e.strerror)
+        return Status.ERROR
+    return Status.OK if digest == h_record.digest else Status.CHANGED
+
+
+def verify(records: Iterable[HsnapRecord], root: Path, jobs: int = 1, sample: float = 1.0, seed: Optional[int] = None,
+           throttle: Optional[Throttle] = None) -> Iterator[Tuple[Status, HsnapRecord]]:
+    """
+    Checks files under the root against their snapshot records.
+    Files are stat-ed as they come and failures found that way are yielded right away, the others are hashed by a pool
+    of threads with a bounded number of files in flight, their results are yielded in input order.
+    :param sample: fraction of the records to check, chosen at random
+    :param seed: seed of the sampling, for repeatable runs
+    :param throttle: limit of the total reading rate
+    """
+    rng = random.Random(seed)
+
+    with ThreadPoolExecutor(max(1, jobs), thread_name_prefix='verify') as executor:
+        in_flight = deque()
+        for h_record in records:
+            if sample < 1.0 and rng.random() >= sample:
+                continue
+            path = root / h_record.path
+            status = _check_stat(path, h_record)
+            if status is not None:
+                yield status, h_record
+                continue
+            in_flight.append((h_record, executor.submit(_check_digest, path, h_record, throttle)))
+            if len(in_flight) >= 2 * jobs:
+                h_record, future = in_flight.popleft()
+                yield future.result(), h_record
+        while in_flight:
+            h_record, future = in_flight.popleft()
+            yield future.result(), h_record
@@ -16,6 +16,26 @@ def humanize_size(size_bytes: int) -> str:
     return f'{value} {suffixes[order]}'
 
 
+def parse_size(size: str) -> int:
+    """
+    Inverse of humanize_size, accepts also short forms like 10M or 1.5GiB, suffixes are powers of 1024
+    """
+    units = {'': 0, 'b': 0, 'byte': 0, 'bytes': 0}
+    for order, prefix in enumerate('kmgtpezy', start=1):
+        units.update({prefix: order, f'{prefix}b': order, f'{prefix}ib': order})
+
+    number = size.strip().rstrip('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    unit = size.strip()[len(number):].lower()
+    try:
+        value = float(number)
+        order = units[unit]
+    except (ValueError, KeyError):
+        raise ValueError(f'Invalid size {size}')
+    if value < 0:
+        raise ValueError(f'Invalid size {size}')
+    return int(round(value * (1 << (order * 10))))
+
+
 def humanize_size_dual(size_bytes: int) -> str:
     if size_bytes < 1024:
         return humanize_size(size_bytes)
@@ -0,0 +1,127 @@
+import re
+from typing import Iterable, List, Optional, Dict
+
+_REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+_QUANTIFIERS = set('*+?{')
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')  # e.g. (?i), applies to the whole regex - unlike scoped (?i:...)
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    Literal text every re.match of the pattern has to start with, '' if there is none or it is not obvious
+    """
+    if '|' in pattern:  # possibly top level alternation, not worth parsing
+        return ''
+    prefix = []
+    i = 1 if pattern.startswith('^') else 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            if i + 1 < len(pattern) and not pattern[i + 1].isalnum():  # escaped special character
+                literal, step = pattern[i + 1], 2
+            else:  # character classes (\d, \w, ...), anchors, escape sequences
+                break
+        elif c in _REGEX_SPECIAL:
+            break
+        else:
+            literal, step = c, 1
+        if pattern[i + step:i + step + 1] in _QUANTIFIERS:
+            break  # the character may be repeated zero times
+        prefix.append(literal)
+        i = i + step
+    return ''.join(prefix)
+
+
+class PathMatcher:
+    """
+    Matches paths against a large set of regex patterns at once, with re.match semantics (anchored at path start).
+
+    Patterns starting with a literal text are stored in a character trie by that text, so only patterns whose prefix
+    the path starts with are tried. The rest is combined into a single alternation regex. Matching stops at the first
+    pattern hit.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(patterns)
+        self._compiled = [re.compile(p) for p in self.patterns]
+
+        self._trie: Dict = {}  # nested dicts char -> node, key None holds indices of patterns ending there
+        unprefixed = []
+        for i, pattern in enumerate(self.patterns):
+            prefix = literal_prefix(pattern)
+            if prefix:
+                node = self._trie
+                for c in prefix:
+                    node = node.setdefault(c, {})
+                node.setdefault(None, []).append(i)
+            else:
+                unprefixed.append(i)
+
+        self._combined, self._combined_groups, self._standalone = self._combine(unprefixed)
+
+    def _combine(self, indices: List[int]):
+        """
+        :return: combined regex (or None), mapping of its group numbers to pattern indices, patterns not combined
+        """
+        # group numbers would shift with backreferences, global flags would apply to all the alternatives (an error
+        # only since Python 3.11)
+        standalone = [i for i in indices if _BACKREFERENCE.search(self.patterns[i]) or
+                      _GLOBAL_FLAGS.search(self.patterns[i])]
+        combinable = [i for i in indices if i not in standalone]
+        if len(combinable) < 2:
+            return None, {}, sorted(standalone + combinable)
+
+        groups = {}
+        group_number = 1
+        for i in combinable:
+            groups[group_number] = i
+            group_number = group_number + 1 + self._compiled[i].groups
+        try:
+            combined = re.compile('|'.join(f'({self.patterns[i]})' for i in combinable))
+        except re.error:  # e.g. duplicate group names
+            return None, {}, sorted(indices)
+        return combined, groups, standalone
+
+    def _candidates(self, path: str) -> List[int]:
+        found = []
+        node = self._trie
+        for c in path:
+            node = node.get(c)
+            if node is None:
+                break
+            hits = node.get(None)
+            if hits:
+                found.extend(hits)
+        return found
+
+    def match(self, path: str) -> bool:
+        """
+        True if any of the patterns matches
+        """
+        if self._combined is not None and self._combined.match(path):
+            return True
+        for i in self._standalone:
+            if self._compiled[i].match(path):
+                return True
+        for i in self._candidates(path):
+            if self._compiled[i].match(path):
+                return True
+        return False
+
+    def match_index(self, path: str) -> Optional[int]:
+        """
+        Index of the first pattern matching, None if there is not any
+        """
+        best = None
+        if self._combined is not None:
+            m = self._combined.match(path)
+            if m:
+                best = self._combined_groups[m.lastindex]  # alternatives are tried in order, first one wins
+        for i in sorted(self._standalone + self._candidates(path)):
+            if best is not None and i > best:
+                break
+            if self._compiled[i].match(path):
+                best = i
+                break
+        return best
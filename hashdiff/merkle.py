@@ -0,0 +1,152 @@
+import os.path
+from typing import Dict, List, Tuple, Iterable, Set, Any
+
+from hashdiff.common import HsnapRecord
+from hashdiff.normalize import NormalizePaths, normalize_path_string_heuristic
+
+# Directory records are stored in hsnap files alongside file records, their path is the directory path with this
+# suffix. No file path can end with it, so readers not asking for directory records can tell them apart and skip them.
+DIRECTORY_MARKER = '/'
+
+
+def is_directory_record(h_record: HsnapRecord) -> bool:
+    return h_record.path.endswith(DIRECTORY_MARKER)
+
+
+def directory_path(h_record: HsnapRecord) -> str:
+    return h_record.path[:-len(DIRECTORY_MARKER)]
+
+
+def normalize_directory_record(path_style: NormalizePaths, h_record: HsnapRecord) -> HsnapRecord:
+    normalized_path = normalize_path_string_heuristic(path_style, directory_path(h_record))
+    return HsnapRecord(
+        path=normalized_path + DIRECTORY_MARKER,
+        size=h_record.size,
+        mtime=h_record.mtime,
+        digest=h_record.digest
+    )
+
+
+class DirectoryDigests:
+    """
+    Accumulates file records and computes aggregate (Merkle tree) digests of all the directories containing them.
+
+    Digest of a directory is a sha512 over its children sorted by name, each child contributing its name, type and
+    digest. Two directories thus have the same digest iff they contain the same paths with the same contents.
+    """
+
+    def __init__(self):
+        # directory path parts -> list of (name, is_dir, digest, size)
+        self._children: Dict[Tuple[str, ...], List[Tuple[str, bool, Any, int]]] = {}
+
+    def _dir_entries(self, dir_parts: Tuple[str, ...]) -> list:
+        try:
+            return self._children[dir_parts]
+        except KeyError:
+            entries = self._children[dir_parts] = []
+            if dir_parts:
+                self._dir_entries(dir_parts[:-1])  # make sure all the ancestors are there
+            return entries
+
+    def add(self, path_parts: Tuple[str, ...], size: int, digest):
+        *dir_parts, name = path_parts
+        self._dir_entries(tuple(dir_parts)).append((name, False, digest, size))
+
+    @staticmethod
+    def _digest(entries) -> bytes:
+        import hashlib  # imported by fileio, but needed only when computing the digests
+
+        h_sha512 = hashlib.sha512()
+        for name, is_dir, digest, size in sorted(entries, key=lambda e: e[0]):
+            h_sha512.update(name.encode('utf-8', 'surrogateescape'))
+            h_sha512.update(b'\0D' if is_dir else b'\0F')
+            h_sha512.update(digest)
+        return h_sha512.digest()
+
+    def records(self) -> List[HsnapRecord]:
+        """
+        Directory records, deepest directories first
+        """
+        output = []
+        for dir_parts in sorted(self._children, key=len, reverse=True):
+            entries = self._children[dir_parts]
+            digest = self._digest(entries)
+            size = sum(e[3] for e in entries)
+            path = os.path.join(*dir_parts) if dir_parts else '.'
+            output.append(HsnapRecord(path=path + DIRECTORY_MARKER, size=size, mtime=0., digest=digest))
+            if dir_parts:
+                self._children[dir_parts[:-1]].append((dir_parts[-1], True, digest, size))
+        return output
+
+
+def unchanged_subtrees(previous: Iterable[HsnapRecord], current: Iterable[HsnapRecord]) -> Set[str]:
+    """
+    Paths of directories having the same aggregate digest in both snapshots
+    """
+    previous_digests = dict((directory_path(d), d.digest) for d in previous)
+    return set(directory_path(d) for d in current if previous_digests.get(directory_path(d)) == d.digest)
+
+
+def _separators(path_style: NormalizePaths) -> str:
+    if path_style == NormalizePaths.POSIX:
+        return '/'
+    elif path_style == NormalizePaths.WINDOWS:
+        return '\\'
+    elif path_style == NormalizePaths.NATIVE:
+        return os.sep + (os.altsep or '')
+    else:
+        return '/\\'
+
+
+def in_subtrees(path: str, subtrees: Set[str], path_style: NormalizePaths) -> bool:
+    if '.' in subtrees:
+        return True
+    separator, *alternative_separators = _separators(path_style)
+    path_search = path
+    for alternative in alternative_separators:
+        path_search = path_search.replace(alternative, separator)  # same length, so indices stay valid for path
+    i = path_search.find(separator)
+    while i >= 0:
+        if path[:i] in subtrees or path[:i + 1] in subtrees:  # path[:i + 1] for roots, i.e. '/' or 'C:\\'
+            return True
+        i = path_search.find(separator, i + 1)
+    return False
+
+
+class SubtreeMatcher:
+    """
+    in_subtrees for paths of many records, cached by the directory part of the path - the result depends only on it, and
+    records of one directory are usually adjacent in a snapshot, so most paths are matched by a single dict lookup
+    """
+
+    MAX_CACHED = 100000  # directories
+
+    def __init__(self, subtrees: Set[str], path_style: NormalizePaths):
+        self.subtrees = subtrees
+        self.path_style = path_style
+        self._separators = _separators(path_style)
+        self._directories: Dict[str, bool] = {}
+
+    def __bool__(self):
+        return bool(self.subtrees)
+
+    def __call__(self, path: str) -> bool:
+        directory = path[:max(path.rfind(s) for s in self._separators) + 1]  # including the separator
+        try:
+            return self._directories[directory]
+        except KeyError:
+            if len(self._directories) >= self.MAX_CACHED:
+                self._directories.clear()
+            result = self._directories[directory] = in_subtrees(path, self.subtrees, self.path_style)
+            return result
+
+
+def split_subtrees(records: Iterable[HsnapRecord], matcher: SubtreeMatcher
+                   ) -> Tuple[List[HsnapRecord], List[HsnapRecord]]:
+    """
+    Records in the subtrees and the rest, in one pass
+    """
+    inside, outside = [], []
+    for h_record in records:
+        (inside if matcher(h_record.path) else outside).append(h_record)
+    return inside, outside
@@ -1,5 +1,9 @@
+import os
+import re
+import string
 from enum import Enum
 from pathlib import PurePosixPath, PureWindowsPath, PurePath, Path
+from typing import Dict
 
 from hashdiff.common import HsnapRecord
 
@@ -38,6 +42,102 @@ def normalize_path_string_heuristic(style: NormalizePaths, path: str) -> str:
     raise NotImplemented()
 
 
+_windows_path_forbidden = re.compile('[' + re.escape(''.join(sorted(_windows_path_forbidden_chars))) + ']')
+
+
+def _posix_parts_string(path: str, separator: str) -> str:
+    """
+    Path parsed as PurePosixPath, joined by the separator - '//' root is kept, other repeated slashes and '.' dropped
+    """
+    if path.startswith('/'):
+        root = '//' if path.startswith('//') and not path.startswith('///') else '/'
+        if separator != '/':
+            root = separator * len(root)
+    else:
+        root = ''
+    return root + separator.join(p for p in path.split('/') if p and p != '.') or '.'
+
+
+def _windows_relative_string(path: str, separator: str) -> str:
+    """
+    Relative path without drive parsed as PureWindowsPath, joined by the separator
+    """
+    return separator.join(p for p in path.split('\\') if p and p != '.') or '.'
+
+
+class PathNormalizer:
+    """
+    Fast equivalent of normalize_path_string_heuristic, working on strings. Common paths are normalized by splitting
+    and joining, paths already normalized are returned as they are. Windows paths with a drive or root are normalized
+    per directory - the directory through PurePath once, cached, and the file name appended. Anything unusual goes
+    through the PurePath heuristic itself, so the results are always the same.
+    """
+
+    MAX_CACHED = 100000  # directories
+
+    def __init__(self, style: NormalizePaths):
+        if style == NormalizePaths.NATIVE:
+            style = NormalizePaths.WINDOWS if os.name == 'nt' else NormalizePaths.POSIX
+        self.style = style
+        self._separator = '\\' if style == NormalizePaths.WINDOWS else '/'
+        self._directories: Dict[str, str] = {}  # directory with trailing separator -> normalized directory
+
+    def __call__(self, path: str) -> str:
+        if self.style == NormalizePaths.NONE:
+            return path
+
+        if '\\' not in path:  # POSIX (the heuristic decides so also for paths with forbidden characters below)
+            if self.style == NormalizePaths.POSIX:
+                if path and '//' not in path and '/.' not in path and not path.startswith('./') \
+                        and not path.endswith('/'):
+                    return path  # already normalized
+                return _posix_parts_string(path, '/')
+            elif ':' not in path and not path.startswith('//'):  # no drive in any part for Windows
+                return _posix_parts_string(path, '\\')
+        elif _windows_path_forbidden.search(path):  # POSIX, backslashes are part of the names
+            if self.style == NormalizePaths.POSIX:
+                return _posix_parts_string(path, '/')
+        elif ':' not in path and not path.startswith('\\'):  # Windows, relative without a drive
+            return _windows_relative_string(path, self._separator)
+        elif not path.startswith('\\\\'):  # Windows with a drive or root, not UNC
+            return self._windows_per_directory(path)
+
+        return normalize_path_string_heuristic(self.style, path)
+
+    def _windows_per_directory(self, path: str) -> str:
+        i = path.rfind('\\') + 1
+        directory, name = path[:i], path[i:]
+        drive = directory[1:2] == ':' and directory[0] in string.ascii_letters
+        if not name or name == '.' or ':' in name or ':' in directory[2 if drive else 0:]:
+            return normalize_path_string_heuristic(self.style, path)  # colon elsewhere than in the drive
+
+        normalized = self._directories.get(directory)
+        if normalized is None:
+            if len(self._directories) >= self.MAX_CACHED:
+                self._directories.clear()
+            normalized = self._directories[directory] = normalize_path_string_heuristic(self.style, directory)
+
+        if normalized == '.':
+            return name
+        elif normalized.endswith(self._separator) or (self._separator == '\\' and normalized.endswith(':')):
+            return normalized + name  # root or drive without root
+        return normalized + self._separator + name
+
+    def record(self, hsnap_record: HsnapRecord) -> HsnapRecord:
+        """
+        Record with normalized path, the record itself if the path is normalized already
+        """
+        normalized_path = self(hsnap_record.path)
+        if normalized_path == hsnap_record.path:
+            return hsnap_record
+        return HsnapRecord(
+            path=normalized_path,
+            size=hsnap_record.size,
+            mtime=hsnap_record.mtime,
+            digest=hsnap_record.digest
+        )
+
+
 def normalize_hsnap_record(path_style: NormalizePaths, hsnap_record: HsnapRecord) -> HsnapRecord:
     normalized_path = normalize_path_string_heuristic(path_style, hsnap_record.path)
     return HsnapRecord(
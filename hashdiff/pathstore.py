@@ -0,0 +1,121 @@
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Iterable, Tuple
+
+from hashdiff.common import HsnapRecord
+
+
+class StoredRecord:
+    """
+    Compact in-memory HsnapRecord, see PathStore. The path is split into its directory, shared by all records of the
+    directory, and basename; the path string itself is built only when asked for.
+    """
+    __slots__ = ('directory', 'name', 'size', 'mtime', 'digest')
+
+    def __init__(self, directory: str, name: str, size: int, mtime: float, digest):
+        self.directory = directory
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+
+    @property
+    def path(self) -> str:
+        return self.directory + self.name
+
+    def to_record(self) -> HsnapRecord:
+        return HsnapRecord(path=self.path, size=self.size, mtime=self.mtime, digest=self.digest)
+
+    def __eq__(self, other):
+        if not isinstance(other, StoredRecord):
+            return NotImplemented
+        return (self.directory, self.name, self.size, self.mtime, self.digest) == \
+               (other.directory, other.name, other.size, other.mtime, other.digest)
+
+    def __hash__(self):
+        return hash((self.directory, self.name, self.size, self.mtime, self.digest))
+
+    def __repr__(self):
+        return f'StoredRecord(path={self.path!r}, size={self.size!r}, mtime={self.mtime!r}, digest={self.digest!r})'
+
+
+def split_path(path: str) -> Tuple[str, str]:
+    """
+    (directory including the trailing separator, basename), so that path == directory + basename
+    """
+    i = max(path.rfind('/'), path.rfind('\\')) + 1
+    return path[:i], path[i:]
+
+
+class PathStore:
+    """
+    Table of directories and basenames shared by StoredRecords. Paths in snapshots share long directory prefixes, which
+    are kept once per directory rather than once per record; basenames are interned, so that common names and names
+    in more snapshots sharing the store are kept once too.
+    """
+
+    def __init__(self):
+        self._directories: Dict[str, str] = {}
+        self._names: Dict[str, str] = {}
+
+    @property
+    def directories(self) -> int:
+        return len(self._directories)
+
+    def split(self, path: str) -> Tuple[str, str]:
+        """
+        Interned (directory, basename) of the path
+        """
+        directory, name = split_path(path)
+        directory = self._directories.setdefault(directory, directory)
+        name = self._names.setdefault(name, name)
+        return directory, name
+
+    def store(self, h_record: HsnapRecord) -> StoredRecord:
+        directory, name = self.split(h_record.path)
+        return StoredRecord(directory, name, h_record.size, h_record.mtime, h_record.digest)
+
+    def store_all(self, h_records: Iterable[HsnapRecord]) -> List[StoredRecord]:
+        return [self.store(h_record) for h_record in h_records]
+
+
+def to_hsnap_records(item):
+    """
+    The item (a record, or tuples and lists of records) with StoredRecords converted back to HsnapRecords
+    """
+    if isinstance(item, StoredRecord):
+        return item.to_record()
+    elif isinstance(item, tuple):
+        return tuple(to_hsnap_records(x) for x in item)
+    elif isinstance(item, list):
+        return [to_hsnap_records(x) for x in item]
+    return item
+
+
+class RecordCatalog(Mapping):
+    """
+    Read only mapping of path -> StoredRecord, records grouped by directory so that paths are not kept as strings
+    """
+
+    def __init__(self, h_records: Iterable[HsnapRecord], path_store: Optional[PathStore] = None):
+        path_store = path_store if path_store is not None else PathStore()
+        self._directories: Dict[str, Dict[str, StoredRecord]] = {}
+        self._len = 0
+        for h_record in h_records:
+            stored = path_store.store(h_record)
+            directory = self._directories.setdefault(stored.directory, {})
+            if stored.name not in directory:
+                self._len += 1
+            directory[stored.name] = stored
+
+    def __getitem__(self, path: str) -> StoredRecord:
+        directory, name = split_path(path)
+        try:
+            return self._directories[directory][name]
+        except KeyError:
+            raise KeyError(path)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return (directory + name for directory, records in self._directories.items() for name in records)
@@ -0,0 +1,196 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Iterable, Callable, Optional
+
+from hashdiff.memory import peak_rss
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    """
+    Wall and CPU time of named pipeline stages. Time of a stage excludes stages nested in it (in the same thread),
+    so the stages add up. CPU time is per thread; stages running in more threads sum up over them.
+    Disabled by default, then stage() and timed_iter() cost close to nothing and timed_call() returns the function
+    itself - hot paths should be wrapped once, not per record.
+
+    With memory tracking, peak of memory allocated by Python (tracemalloc) while each stage ran is recorded as well.
+    Tracemalloc is process wide, with stages running in parallel threads the peaks are attributed only roughly.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._stages: Dict[str, List] = {}  # name -> [wall, cpu, calls]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start_wall = 0.
+        self._start_cpu = 0.
+        self.memory = False
+        self._peak = 0
+
+    def enable(self, memory=False):
+        """
+        :param memory: track also peak memory of the stages, makes allocations several times slower
+        """
+        self._stages.clear()
+        self.memory = memory
+        self._peak = 0
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self.memory:
+            import tracemalloc
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    @contextmanager
+    def _stage(self, name: str):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        children = [0., 0., 0]  # wall, cpu of nested stages, peak memory of the stage so far
+        if self.memory:
+            self._checkpoint_peak(stack)
+        stack.append(children)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            if self.memory:
+                self._checkpoint_peak(stack)
+            stack.pop()
+            if stack:
+                stack[-1][0] += wall
+                stack[-1][1] += cpu
+                stack[-1][2] = max(stack[-1][2], children[2])  # peak of a nested stage is a peak of the outer too
+            with self._lock:
+                totals = self._stages.setdefault(name, [0., 0., 0, 0])
+                totals[0] += wall - children[0]
+                totals[1] += cpu - children[1]
+                totals[2] += 1
+                totals[3] = max(totals[3], children[2])
+
+    def _checkpoint_peak(self, stack: List):
+        """
+        Assigns the traced peak since the last checkpoint to the innermost running stage and starts a new period
+        """
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        self._peak = max(self._peak, peak)
+        if stack:
+            stack[-1][2] = max(stack[-1][2], peak)
+        tracemalloc.reset_peak()
+
+    def stage(self, name: str):
+        """
+        Context manager timing the enclosed block as the stage
+        """
+        return self._stage(name) if self.enabled else _DISABLED
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterable:
+        """
+        Iterable timing production of every item as the stage, e.g. reading and parsing of input
+        """
+        return self._timed_iter(name, iterable) if self.enabled else iterable
+
+    def _timed_iter(self, name: str, iterable: Iterable):
+        iterator = iter(iterable)
+        while True:
+            with self._stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def timed_call(self, name: str, func: Callable) -> Callable:
+        """
+        The function timed as the stage on every call
+        """
+        if not self.enabled:
+            return func
+
+        def timed(*args, **kwargs):
+            with self._stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def report(self) -> List[str]:
+        wall = time.perf_counter() - self._start_wall
+        cpu = time.process_time() - self._start_cpu
+        lines = [f'Profile: {wall:.3f} s wall, {cpu:.3f} s CPU (all threads)',
+                 f'{"stage":<20}{"wall s":>10}{"cpu s":>10}{"calls":>12}{"wall %":>8}'
+                 + (f'{"peak MiB":>10}' if self.memory else '')]
+        with self._lock:
+            stages = sorted(self._stages.items(), key=lambda s: -s[1][0])
+        for name, (stage_wall, stage_cpu, calls, stage_peak) in stages:
+            share = 100 * stage_wall / wall if wall > 0 else 0.
+            lines.append(f'{name:<20}{stage_wall:>10.3f}{stage_cpu:>10.3f}{calls:>12}{share:>8.1f}'
+                         + (f'{stage_peak / MiB:>10.1f}' if self.memory else ''))
+        other = wall - sum(s[0] for _, s in stages)
+        if other > 0:  # not in any stage, unless stages ran in parallel threads
+            lines.append(f'{"(other)":<20}{other:>10.3f}{"":>10}{"":>12}{100 * other / wall:>8.1f}')
+        if self.memory:
+            import tracemalloc
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])  # 0 if not tracing any more
+            rss = peak_rss()
+            lines.append(f'Peak memory: {peak / MiB:.1f} MiB allocated by Python'
+                         + (f', {rss / MiB:.1f} MiB peak RSS' if rss is not None else ''))
+        return lines
+
+
+MiB = 1024 * 1024
+
+profiler = Profiler()
+
+stage = profiler.stage
+timed_iter = profiler.timed_iter
+timed_call = profiler.timed_call
+
+
+def add_profiling_args(parser):
+    parser.add_argument('--profile', help='print wall and CPU time of processing stages at exit', action='store_true')
+    parser.add_argument('--cprofile', help='store cProfile statistics into FILE, for pstats or snakeviz',
+                        metavar='FILE')
+    parser.add_argument('--memory-report', help='print peak memory of processing stages at exit (tracemalloc), '
+                                                'slows down processing', action='store_true')
+
+
+@contextmanager
+def profile_from_args(args):
+    """
+    Profiling of the enclosed block as requested by --profile/--cprofile/--memory-report, reports are written also
+    on SystemExit
+    """
+    memory_report = getattr(args, 'memory_report', False)
+    profile = getattr(args, 'profile', False) or memory_report
+    cprofile_file: Optional[str] = getattr(args, 'cprofile', None)
+
+    if profile:
+        profiler.enable(memory=memory_report)
+    cprofile = None
+    if cprofile_file:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        yield
+    finally:
+        if cprofile:
+            cprofile.disable()
+            cprofile.dump_stats(cprofile_file)
+        if profile:
+            profiler.disable()
+            for line in profiler.report():
+                print(line, file=sys.stderr)
@@ -7,7 +7,7 @@ setup(name='hashdiff',
       author='Jakub Velkoborsky',
       author_email='jakub@velkoborsky.eu',
       license='GPLv3',
-      packages=find_packages(exclude=("tests",)),
+      packages=find_packages(exclude=("tests", "benchmarks")),
       entry_points = {
             'console_scripts': [
                   'hsnap = hashdiff.hsnap.__main__:cli_main',
@@ -14,3 +14,39 @@ def build(c):
         cmd = f'pyinstaller pyinstaller/hstool.py --onefile --workpath="{tmpdir}"'
         print(cmd)
         c.run(cmd)
+
+
+@task(help={'output': 'save results into a JSON file', 'baseline': 'compare with results saved before',
+            'records': 'number of records'})
+def bench(c, output=None, baseline=None, records=100000):
+    cmd = f'python -m benchmarks.micro --records {records}'
+    if output:
+        cmd += f' --output "{output}"'
+    if baseline:
+        cmd += f' --baseline "{baseline}"'
+    print(cmd)
+    c.run(cmd)
+
+
+@task(help={'sizes': 'comma separated numbers of records', 'output': 'save results into a JSON file',
+            'baseline': 'compare with results saved before'})
+def bench_scaling(c, sizes='10000,100000,1000000,10000000', output=None, baseline=None):
+    cmd = f'python -m benchmarks.scaling --sizes {sizes}'
+    if output:
+        cmd += f' --output "{output}"'
+    if baseline:
+        cmd += f' --baseline "{baseline}"'
+    print(cmd)
+    c.run(cmd)
+
+
+@task(help={'output': 'save results into a JSON file', 'baseline': 'compare with results saved before',
+            'top': 'print the N slowest imports of each tool'})
+def bench_startup(c, output=None, baseline=None, top=0):
+    cmd = f'python -m benchmarks.startup --top {top}'
+    if output:
+        cmd += f' --output "{output}"'
+    if baseline:
+        cmd += f' --baseline "{baseline}"'
+    print(cmd)
+    c.run(cmd)
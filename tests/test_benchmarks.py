@@ -0,0 +1,73 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.common import save_results, load_results, metadata
+from benchmarks.micro import run
+from benchmarks.scaling import run as run_scaling
+from benchmarks.startup import run as run_startup, import_times
+from benchmarks.synthetic import ChangeRates, synthetic_records, write_snapshot_pair
+from hashdiff.fileio import read_input_file
+from hashdiff.hcmp.compare import changes
+
+
+def test_micro_benchmarks_smoke(tmpdir):
+    results = run(n_records=100, n_files=10, hash_size=1000, repeat=1)
+    assert [r.name for r in results] == ['walk', 'sha512', 'sha512_pipelined', 'serialize', 'deserialize',
+                                         'input_source_text', 'input_source_gzip', 'normalize_posix',
+                                         'normalize_windows', 'changes']
+    assert all(r.seconds > 0 and r.records > 0 for r in results)
+
+    output = Path(tmpdir) / 'results.json'
+    save_results(output, metadata(records=100), results)
+    assert load_results(output)['serialize']['records'] == 100
+
+
+def test_synthetic_snapshot_pair(tmpdir):
+    previous, current = Path(tmpdir) / 'previous.hsn', Path(tmpdir) / 'current.hsn.gz'
+    rates = ChangeRates(add=0.1, delete=0.1, move=0.1, copy=0.1, change=0.1)
+    write_snapshot_pair(previous, current, 1000, rates=rates)
+
+    assert read_input_file(previous) == list(synthetic_records(1000))  # deterministic
+    output = changes(read_input_file(previous), read_input_file(current))
+    counts = {category.name: len(category.files) for category in output}
+    assert all(50 < counts[name] < 150 for name in ['changed', 'moved', 'added'])
+    assert counts['deleted'] + counts['deleted_duplicates'] > 50
+    assert counts['added_duplicates'] > 50
+
+
+def test_scaling_smoke():
+    results = run_scaling([100], only=['hcmp'])
+    assert [r.name for r in results] == ['hcmp@100']
+    assert results[0].peak_rss > 0
+
+
+def test_startup_smoke():
+    results = run_startup(repeat=1, records=10, only=['hstool_ls', 'imports'])
+    assert [r.name for r in results] == ['hstool_ls', 'import hsnap', 'import hcmp', 'import hstool']
+    assert all(r.seconds > 0 for r in results)
+
+
+def test_startup_lazy_imports():
+    # codecs, pickle and the modules of other commands are not needed by small hstool invocations
+    imported = {name for name, _, _ in import_times('hashdiff.hstool.hstool')}
+    assert 'hashdiff.fileio' in imported
+    assert not imported & {'lzma', 'bz2', 'gzip', 'pickle', 'multiprocessing', 'tempfile', 'cProfile', 'tracemalloc',
+                           'hashdiff.hstool.verify', 'hashdiff.hstool.merge', 'hashdiff.hstool.lsindex'}
+
+    # nor by parsing the arguments of the commands
+    commands = [['shard', '-i', 'x.hsn', '-n', '4', '--by', 'path', '-o', 'part-{shard}.hsn'],
+                ['dedup', '-i', 'x.hsn', '-n', '10'],
+                ['find', '-i', 'x.hsn', '--min-size', '10G'],
+                ['merge', 'a.hsn', 'b.hsn', '--sort-inputs']]
+    code = ('import sys, argparse, hashdiff.hstool.hstool, hashdiff.hstool.args as args\n'
+            f'for command in {commands!r}:\n'
+            '    parser = argparse.ArgumentParser()\n'
+            '    args.construct_parser(parser)\n'
+            '    assert parser.parse_args(command).hst_command == command[0]\n'
+            'print(" ".join(m for m in sys.modules if m.startswith("hashdiff.hstool.")))')
+    process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, text=True, check=True)
+    loaded = set(process.stdout.split())
+    assert 'hashdiff.hstool.args' in loaded
+    assert not loaded & {'hashdiff.hstool.dedup', 'hashdiff.hstool.find', 'hashdiff.hstool.shard',
+                         'hashdiff.hstool.merge'}
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from hashdiff.hcmp import SCRIPT_NAME
@@ -36,3 +38,114 @@ def test_hcmp_black_box_run(samples_dir, monkeypatch, capsys):
                    '\n'
                    'Added duplicates (of previously existing): 0\n')
 
+
+
+def test_hcmp_black_box_store_result_streamed(samples_dir, monkeypatch, capsys, tmpdir):
+    hcmp_samples_dir = samples_dir / 'hcmp'
+    f1 = hcmp_samples_dir / 'basic.hsn'
+    f2 = hcmp_samples_dir / 'incremental.hsn'
+    jsonl_out = tmpdir / 'result.jsonl'
+    tsv_out = tmpdir / 'result.tsv'
+
+    for out_file in [jsonl_out, tsv_out]:
+        monkeypatch.setattr('sys.argv', [SCRIPT_NAME, str(f1), str(f2), '--store-result', str(out_file)])
+        with pytest.raises(SystemExit) as e:
+            cli_main()
+        capsys.readouterr()
+
+    results = [json.loads(line) for line in jsonl_out.read_text(encoding='utf-8').splitlines()]
+    assert sorted((r['category'], (r['curr'] or r['prev'])['path']) for r in results) == [
+        ('added', 'def.txt'), ('changed', 'hello')]
+    changed, = [r for r in results if r['category'] == 'changed']
+    assert changed['prev']['size'] == 16 and changed['prev']['digest'] != changed['curr']['digest']
+
+    tsv_lines = tsv_out.read_text(encoding='utf-8').splitlines()
+    assert tsv_lines[0] == 'category\tsize\tdigest\tcopies\tprev_path\tcurr_path'
+    assert sorted(line.split('\t')[0] for line in tsv_lines[1:]) == ['added', 'changed']
+
+
+def test_hcmp_black_box_history(samples_dir, monkeypatch, capsys):
+    hcmp_samples_dir = samples_dir / 'hcmp'
+    f1 = hcmp_samples_dir / 'basic.hsn'
+    f2 = hcmp_samples_dir / 'incremental.hsn'
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, str(f1), str(f2), str(f1)])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert (err == "")
+    assert out == ('Files with changes across 3 snapshots: 2\n'
+                   f'def.txt\tfirst seen: {f2}\tdeleted: {f1}\n'
+                   f'hello\tfirst seen: {f1}\tlast changed: {f1}\n')
+
+
+def test_hcmp_black_box_exclude(samples_dir, monkeypatch, capsys):
+    hcmp_samples_dir = samples_dir / 'hcmp'
+    f1 = hcmp_samples_dir / 'basic.hsn'
+    f2 = hcmp_samples_dir / 'incremental.hsn'
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, str(f1), str(f2), '--exclude', 'hel+o', '-e', '.*\\.txt'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert (err == "")
+    assert 'Changed (same path, different file): 0\n' in out
+    assert 'Added (new files): 0\n' in out
+
+
+def test_hcmp_black_box_summary_largest(samples_dir, monkeypatch, capsys):
+    hcmp_samples_dir = samples_dir / 'hcmp'
+    f1 = hcmp_samples_dir / 'basic.hsn'
+    f2 = hcmp_samples_dir / 'incremental.hsn'
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, str(f2), str(f1), '--summary', 'largest'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert (err == "")
+    assert out == ('Deleted (no copy left): 1 files, 3 bytes\n'
+                   '3 bytes\tdef.txt\n'
+                   '\n'
+                   'Deleted duplicates (some copies left): 0 files, 0 bytes\n'
+                   '\n'
+                   'Changed (same path, different file): 1 files, 16 bytes\n'
+                   '16 bytes\thello\n'
+                   '\n'
+                   'Moved (same file, different path): 0 files, 0 bytes\n'
+                   '\n'
+                   'Added (new files): 0 files, 0 bytes\n'
+                   '\n'
+                   'Added duplicates (of previously existing): 0 files, 0 bytes\n')
+
+
+def test_hcmp_black_box_profile(samples_dir, monkeypatch, capsys, tmpdir):
+    hcmp_samples_dir = samples_dir / 'hcmp'
+    cprofile_file = tmpdir / 'hcmp.prof'
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, str(hcmp_samples_dir / 'basic.hsn'),
+                                     str(hcmp_samples_dir / 'incremental.hsn'), '--profile',
+                                     '--cprofile', str(cprofile_file)])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert e.value.code == 0
+    assert out.startswith('Deleted (no copy left): 0\n')
+    err_lines = err.split('\n')
+    assert err_lines[0].startswith('Profile: ')
+    assert {line.split()[0] for line in err_lines[2:] if line} >= {'parse', 'read', 'compare', 'compare.sort'}
+    assert cprofile_file.exists()
+
+
+def test_hcmp_black_box_memory(samples_dir, monkeypatch, capsys):
+    hcmp_samples_dir = samples_dir / 'hcmp'
+    args = [SCRIPT_NAME, str(hcmp_samples_dir / 'basic.hsn'), str(hcmp_samples_dir / 'incremental.hsn')]
+
+    monkeypatch.setattr('sys.argv', args + ['--memory-report', '--max-memory', '1T'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert e.value.code == 0
+    assert 'peak MiB' in err and 'Peak memory: ' in err
+
+    monkeypatch.setattr('sys.argv', args + ['--max-memory', '1M'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert e.value.code == 3
+    assert out == ''
@@ -1,7 +1,10 @@
 import pytest
+import json
 import pickle
+from pathlib import Path
 
 from hashdiff.common import HsnapRecord
+from hashdiff.fileio import read_input_file
 from hashdiff.hsnap import SCRIPT_NAME
 from hashdiff.hsnap.hsnap import cli_main
 from hashdiff.serialize import hex2bin
@@ -79,3 +82,86 @@ def test_hsnap_black_box_pickle(monkeypatch, samples_dir, tmpdir, capsys, sample
     records = set((results))
     expected = set((samples_references[sample_name]))
     assert (records == expected)
+
+
+def test_hsnap_black_box_dir_digests(monkeypatch, samples_dir, tmpdir, capsys, samples_references):
+    out_file = Path(tmpdir) / 'out.hsn'
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '-f', str(out_file), '--dir-digests', str(samples_dir / 'basic')])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert (err == "")
+
+    assert set(read_input_file(out_file)) == set(samples_references['basic'])
+    directories = [r for r in read_input_file(out_file, directories=True) if r.path.endswith('/')]
+    assert [(d.path, d.size) for d in directories] == [('./', 15)]
+
+
+def test_hsnap_black_box_metrics(monkeypatch, samples_dir, tmpdir, capsys):
+    out_file = Path(tmpdir) / 'out.hsn'
+    metrics_file = Path(tmpdir) / 'metrics.json'
+    status_file = Path(tmpdir) / 'status.json'
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '-f', str(out_file), '--metrics', str(metrics_file),
+                                     '--status-file', str(status_file), str(samples_dir / 'basic')])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert (err == "")
+
+    metrics = json.loads(metrics_file.read_text())
+    assert metrics['state'] == 'complete'
+    assert metrics['files_processed'] == metrics['files_hashed'] == 3
+    assert metrics['bytes_processed'] == metrics['total_bytes'] == 15
+    assert metrics['progress'] == 1.
+    assert not metrics['incremental']['enabled']
+    assert sum(d['files'] for d in metrics['devices'].values()) == 3
+    assert metrics['walk_seconds'] >= 0 and metrics['hash_seconds'] >= 0
+    assert json.loads(status_file.read_text())['state'] == 'complete'
+
+
+def test_hsnap_black_box_status_while_hashing(monkeypatch, samples_dir, tmpdir):
+    written = []
+    monkeypatch.setattr('hashdiff.hsnap.hsnap.write_metrics', lambda file, metrics: written.append(metrics))
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '-f', str(Path(tmpdir) / 'out.hsn'), '--status-file',
+                                     str(Path(tmpdir) / 'status.json'), '--status-interval', '0',
+                                     str(samples_dir / 'basic')])
+    with pytest.raises(SystemExit):
+        cli_main()
+    assert any(m['bytes_hashing'] > 0 and m['state'] == 'running' for m in written)  # updated during hashing
+    assert (written[-1]['state'], written[-1]['bytes_hashing']) == ('complete', 0)
+
+
+def test_hsnap_black_box_metrics_failed(monkeypatch, samples_dir, tmpdir):
+    metrics_file = Path(tmpdir) / 'metrics.json'
+
+    def failing_hash(*args, **kwargs):
+        raise RuntimeError('disk gone')
+
+    monkeypatch.setattr('hashdiff.hsnap.hsnap.file_sha512', failing_hash)
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '-f', str(Path(tmpdir) / 'out.hsn'), '--metrics',
+                                     str(metrics_file), str(samples_dir / 'basic')])
+    with pytest.raises(RuntimeError):
+        cli_main()
+    metrics = json.loads(metrics_file.read_text())
+    assert (metrics['state'], metrics['files_processed']) == ('failed', 0)
+
+
+def test_hsnap_black_box_workers(monkeypatch, samples_dir, capsys, samples_references):
+    basic = samples_dir / 'basic'
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '-f', '-', str(basic), '--workers', '2', '--device-workers',
+                                     f'{basic}=3', '--read-buffers', '0'])
+    with pytest.raises(SystemExit):
+        cli_main()
+    out, err = capsys.readouterr()
+
+    assert err == ''
+    output = set(HsnapRecord(path, int(size), float(mtime), hex2bin(digest))
+                 for digest, size, mtime, path in (line.split('\t') for line in out.split('\n') if line))
+    assert output == set(samples_references['basic'])
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '-f', '-', str(basic), '--device-workers', '3'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert 'PATH=N' in str(e.value)
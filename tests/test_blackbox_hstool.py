@@ -3,6 +3,8 @@ from pathlib import Path
 import pytest
 
 import hashdiff.fileio
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import FileOutputSink
 from hashdiff.hstool import SCRIPT_NAME
 from hashdiff.hstool.hstool import cli_main
 
@@ -111,3 +113,204 @@ def test_hstool_black_box_ls_paths(samples_dir, monkeypatch, capsys):
                 "hsnap.py\n"
                 "walk.py\n").split('\n')
     assert out_lines == expected
+
+
+def test_hstool_black_box_filter_routes_parallel(samples_dir, monkeypatch, capsys, tmpdir):
+    in_file = samples_dir / 'hstool' / 'hashdiff.hsn'
+    hsnap_out = Path(tmpdir) / 'hsnap.hsn'
+    hcmp_out = Path(tmpdir) / 'hcmp.hsn'
+    rest_out = Path(tmpdir) / 'rest.hsn'
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'filter',
+                                     '--input', str(in_file),
+                                     '--route', str(hsnap_out), 'hsnap',
+                                     '--route', str(hcmp_out), 'hcmp',
+                                     '--route', str(hsnap_out), '.*__init__',
+                                     '--not-matched', str(rest_out),
+                                     '--jobs', '2', '--batch-size', '3'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+
+    assert out == ""
+    assert err == ""
+
+    records = hashdiff.fileio.read_input_file(in_file)
+    expected_hsnap = [r for r in records if r.path.startswith('hsnap')
+                      or (not r.path.startswith('hcmp') and '__init__' in r.path)]
+    expected_hcmp = [r for r in records if r.path.startswith('hcmp')]
+
+    assert hashdiff.fileio.read_input_file(hsnap_out) == expected_hsnap
+    assert hashdiff.fileio.read_input_file(hcmp_out) == expected_hcmp
+    assert len(hashdiff.fileio.read_input_file(rest_out)) == len(records) - len(expected_hsnap) - len(expected_hcmp)
+
+
+def test_hstool_black_box_ls_index(samples_dir, monkeypatch, capsys, tmpdir):
+    in_file = Path(tmpdir) / 'hashdiff.hsn'
+    in_file.write_bytes((samples_dir / 'hstool' / 'hashdiff.hsn').read_bytes())
+    index_file = Path(tmpdir) / 'hashdiff.hsn.lsidx'
+    queries = ['hsnap', 'hc*', '**/__main__.py']
+
+    outputs = []
+    for args in [[], ['--index'], ['--index']]:
+        monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'ls', '--normalize-paths', '-i', str(in_file)] + args + queries)
+        with pytest.raises(SystemExit) as e:
+            cli_main()
+        assert e.value.code == 0
+        outputs.append(capsys.readouterr().out)
+        if args:
+            assert index_file.exists()
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert '__main__.py' in outputs[0]
+
+    # outdated index gets rebuilt
+    index_mtime = index_file.stat().st_mtime_ns
+    with in_file.open('at') as f:
+        f.write('00\t1\t1.0\tnew_file\n')
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'ls', '-i', str(in_file), '--index'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert 'new_file' in out.split('\n')
+    assert index_file.stat().st_mtime_ns != index_mtime
+
+
+def test_hstool_black_box_dedup(monkeypatch, capsys, tmpdir):
+    in_file = Path(tmpdir) / 'in.hsn'
+    with FileOutputSink(in_file) as sink:
+        for path, size, digest in [('a', 10, b'\x01'), ('b/a', 10, b'\x01'), ('c', 10, b'\x02'), ('d', 5, b'\x03'),
+                                   ('e', 5, b'\x03'), ('f', 5, b'\x03')]:
+            sink.write(HsnapRecord(path=path, size=size, mtime=0., digest=digest))
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'dedup'])
+    with in_file.open('rt') as in_stream:
+        monkeypatch.setattr('sys.stdin', in_stream)
+        with pytest.raises(SystemExit) as e:
+            cli_main()
+        out, err = capsys.readouterr()
+
+    assert e.value.code == 0
+    assert out.split('\n') == ['10 bytes reclaimable, 2 copies of 10 bytes, digest 01',
+                               '\ta',
+                               '\tb/a',
+                               '10 bytes reclaimable, 3 copies of 5 bytes, digest 03',
+                               '\td',
+                               '\te',
+                               '\tf',
+                               'Total reclaimable: 20 bytes in 2 groups',
+                               '']
+
+
+def test_hstool_black_box_merge(monkeypatch, capsys, tmpdir):
+    first, second, merged = Path(tmpdir) / 'first.hsn', Path(tmpdir) / 'second.hsn.gz', Path(tmpdir) / 'merged.hsn'
+    for file, records in [(first, [('a', b'\x01'), ('c', b'\x02')]),
+                          (second, [('a', b'\x01'), ('b', b'\x03'), ('c', b'\x04')])]:
+        with FileOutputSink(file, compression=hashdiff.fileio.CompressionType.GZIP if file == second else None) as s:
+            for path, digest in records:
+                s.write(HsnapRecord(path=path, size=1, mtime=0., digest=digest))
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'merge', str(first), str(second), '-o', str(merged)])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+
+    assert e.value.code == 0
+    assert 'Conflicting records of c' in err
+    assert [(r.path, r.digest) for r in hashdiff.fileio.read_input_file(merged)] == [('a', b'\x01'), ('b', b'\x03'),
+                                                                                    ('c', b'\x02')]
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'merge', str(first), str(second), '--strict'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert e.value.code == 2
+
+    # failed merge leaves neither a partial output nor a temporary file
+    failed = Path(tmpdir) / 'failed.hsn'
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'merge', str(first), str(second), '--strict', '-o', str(failed)])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert e.value.code == 2
+    assert 'use --sort-inputs' not in capsys.readouterr().err
+    assert sorted(p.name for p in Path(tmpdir).iterdir()) == ['first.hsn', 'merged.hsn', 'second.hsn.gz']
+
+
+def test_hstool_black_box_verify(samples_dir, monkeypatch, capsys, tmpdir):
+    in_file = samples_dir / 'input_source' / 'basic.hsn.xz'
+    root = Path(tmpdir) / 'basic'
+    root.mkdir()
+    (root / 'abc.txt').write_bytes(b'abd')  # same size, different contents
+    (root / 'hello').write_bytes(b'hello')
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'verify', '-i', str(in_file), str(samples_dir / 'basic'), '--all'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert e.value.code == 0
+    assert sorted(out.split('\n')) == ['', 'OK\tabc.txt', 'OK\tempty', 'OK\thello']
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'verify', '-i', str(in_file), str(root), '-j', '2'])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    out, err = capsys.readouterr()
+    assert e.value.code == 1
+    assert sorted(out.split('\n')) == ['', 'CHANGED\tabc.txt', 'MISSING\tempty', 'SIZE\thello']
+
+
+@pytest.mark.parametrize('by', ['digest', 'path'])
+def test_hstool_black_box_shard(samples_dir, monkeypatch, capsys, tmpdir, by):
+    in_file = samples_dir / 'hstool' / 'hashdiff.hsn'
+    template = str(Path(tmpdir) / 'part{shard}.hsn.gz')
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'shard', '-i', str(in_file), '-n', '4', '--by', by, '-o', template])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert e.value.code == 0
+
+    shards = [hashdiff.fileio.read_input_file(Path(template.format(shard=i))) for i in range(4)]
+    assert sorted(r.path for s in shards for r in s) == sorted(r.path for r in hashdiff.fileio.read_input_file(in_file))
+    assert sum(1 for s in shards if s) > 1
+    for i, s in enumerate(shards):
+        for j, other in enumerate(shards):
+            if i != j:
+                assert not {getattr(r, by) for r in s}.intersection(getattr(r, by) for r in other)
+
+
+def test_hstool_black_box_ls_memory_budget(samples_dir, monkeypatch, capsys, tmpdir):
+    in_file = Path(tmpdir) / 'hashdiff.hsn'
+    in_file.write_bytes((samples_dir / 'hstool' / 'hashdiff.hsn').read_bytes())
+    index_file = Path(tmpdir) / 'hashdiff.hsn.lsidx'
+
+    # no index, the budget is too low for the tree - fails without writing anything next to the snapshot
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '--max-memory', '1', 'ls', '-i', str(in_file)])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert e.value.code == 3
+    assert 'ls --index' in capsys.readouterr().err
+    assert not index_file.exists()
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'ls', '-i', str(in_file), '--index'])
+    with pytest.raises(SystemExit):
+        cli_main()
+    expected = capsys.readouterr().out
+    assert index_file.exists()
+
+    # an up to date index is used within the budget
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, '--max-memory', '1', 'ls', '-i', str(in_file)])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert e.value.code == 0
+    assert capsys.readouterr().out == expected
+
+
+def test_hstool_black_box_convert_same_file(samples_dir, monkeypatch, capsys, tmpdir):
+    snapshot = Path(tmpdir) / 'basic.hsn.xz'
+    snapshot.write_bytes((samples_dir / 'input_source' / 'basic.hsn.xz').read_bytes())
+    contents = snapshot.read_bytes()
+
+    monkeypatch.setattr('sys.argv', [SCRIPT_NAME, 'convert', str(snapshot), str(Path(tmpdir) / '.' / 'basic.hsn.xz')])
+    with pytest.raises(SystemExit) as e:
+        cli_main()
+    assert e.value.code == 2
+    assert 'same file' in capsys.readouterr().err
+    assert snapshot.read_bytes() == contents
@@ -0,0 +1,19 @@
+from pathlib import Path
+
+import pytest
+
+from hashdiff.fileio import InputSource, input_file_type_heuristic
+from hashdiff.hstool.convert import convert
+
+
+@pytest.mark.parametrize('output_name', ['out.hsn', 'out.hsn.xz', 'out.hsb', 'out.hsb.gz', 'out.hsn.bz2'])
+def test_convert(samples_dir, samples_references, tmpdir, output_name):
+    output_file = Path(tmpdir) / output_name
+    binary_pickle, compression = input_file_type_heuristic(output_file)
+
+    for input_file in (samples_dir / 'input_source').glob('*'):
+        convert(InputSource(input_file), output_file, binary_pickle, compression, input_file=input_file)
+
+        with InputSource(output_file) as output:
+            assert (output.binary_pickle, output.compression) == (binary_pickle, compression)
+            assert set(output) == set(samples_references['basic'])
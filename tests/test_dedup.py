@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import FileOutputSink
+from hashdiff.hstool.dedup import duplicate_groups
+
+
+@pytest.fixture
+def snapshot(tmpdir):
+    snapshot = Path(tmpdir) / 'snapshot.hsn'
+    with FileOutputSink(snapshot) as sink:
+        for i in range(100):
+            # 10 groups of 3 copies, sizes 10, 20, ..., 100, plus unique files of the same sizes
+            size = 10 * (i % 10 + 1)
+            digest = bytes([i % 10]) * 64 if i < 30 else bytes([i]) * 64
+            sink.write(HsnapRecord(path=f'dir{i % 3}/file{i}', size=size, mtime=0., digest=digest))
+        sink.write(HsnapRecord(path='empty1', size=0, mtime=0., digest=b'\xff' * 64))
+        sink.write(HsnapRecord(path='empty2', size=0, mtime=0., digest=b'\xff' * 64))
+    return snapshot
+
+
+@pytest.mark.parametrize('memory_budget', [1, 10 ** 9])
+def test_duplicate_groups(snapshot, tmpdir, memory_budget):
+    groups = list(duplicate_groups(snapshot, memory_budget=memory_budget, temp_dir=Path(tmpdir)))
+
+    assert [(g.size, g.reclaimable) for g in groups] == [(size, 2 * size) for size in range(100, 0, -10)]
+    assert groups[0].paths == ['dir0/file9', 'dir1/file19', 'dir2/file29']
+    assert groups[-1].digest == b'\x00' * 64
+
+
+def test_duplicate_groups_min_size(snapshot):
+    assert len(list(duplicate_groups(snapshot, min_size=0))) == 11
+    assert len(list(duplicate_groups(snapshot, min_size=95))) == 1
+
+
+def test_duplicate_groups_bucket_cap(snapshot, tmpdir, monkeypatch, caplog):
+    # buckets capped - partitioned further by digest, merged in rounds, with a warning about the budget
+    monkeypatch.setattr('hashdiff.hstool.dedup.MAX_BUCKETS', 3)
+    groups = list(duplicate_groups(snapshot, memory_budget=1, temp_dir=Path(tmpdir)))
+
+    assert [(g.size, g.reclaimable) for g in groups] == [(size, 2 * size) for size in range(100, 0, -10)]
+    assert 'budget will be exceeded' in caplog.text
+    assert not list(Path(tmpdir).glob('hstool-dedup-*'))  # temporary files removed
+
+
+def test_duplicate_groups_many_sizes(snapshot, monkeypatch):
+    # sizes not counted along with the records, they would not fit into the budget
+    monkeypatch.setattr('hashdiff.hstool.dedup._SIZE_OVERHEAD', 10 ** 9)
+    groups = list(duplicate_groups(snapshot, memory_budget=10 ** 9))
+    assert [(g.size, g.reclaimable) for g in groups] == [(size, 2 * size) for size in range(100, 0, -10)]
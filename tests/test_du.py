@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import FileOutputSink, InputSource
+from hashdiff.hstool.du import input_source_to_du_tree, du
+
+
+def test_du_aggregates(tmpdir):
+    snapshot = Path(tmpdir) / 'snapshot.hsn'
+    with FileOutputSink(snapshot) as sink:
+        for path, size, digest in [('a/x', 10, b'\x01'), ('a/b/y', 10, b'\x01'), ('a/b/z', 5, b'\x02'),
+                                   ('c/x', 10, b'\x01'), ('c/w', 7, b'\x03'), ('top', 1, b'\x04')]:
+            sink.write(HsnapRecord(path=path, size=size, mtime=0., digest=digest))
+
+    tree = input_source_to_du_tree(InputSource(snapshot))
+
+    assert (tree.size, tree.count, tree.unique_size) == (43, 6, 23)
+    a = tree.dirs['a']
+    assert (a.size, a.count, a.unique_size) == (25, 3, 15)
+    b = a.dirs['b']
+    assert (b.size, b.count, b.unique_size) == (15, 2, 15)
+
+    entries, not_matched = du(tree, [], max_depth=1)
+    assert [('/'.join(parts), obj.size) for obj, parts in entries] == [('a', 25), ('c', 17), ('.', 43)]
+    assert not_matched == []
+
+    entries, not_matched = du(tree, ['a', 'top', 'nonexistent'])
+    assert [('/'.join(parts), obj.size) for obj, parts in entries] == [('a/b', 15), ('a', 25), ('top', 1)]
+    assert not_matched == ['nonexistent']
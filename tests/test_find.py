@@ -0,0 +1,52 @@
+import shutil
+import time
+from array import array
+from pathlib import Path
+
+import pytest
+
+from hashdiff.fileio import InputSource
+from hashdiff.hstool.find import FindQuery, find, parse_time
+from hashdiff.hstool.findindex import cached_index, find_indexed, INDEX_SUFFIX, _sorted_column
+
+
+def test_parse_time():
+    assert parse_time('1587139668.5') == 1587139668.5
+    assert parse_time('1970-01-02T00:00:00+00:00') == 86400
+    assert abs(parse_time('7d') - (time.time() - 7 * 86400)) < 10
+    with pytest.raises(ValueError):
+        parse_time('yesterday')
+
+
+@pytest.mark.parametrize('query', [
+    FindQuery(digest='4'),
+    FindQuery(digest='FF', max_size=10000),
+    FindQuery(min_size=1024, max_size=2048),
+    FindQuery(min_size=5000),
+    FindQuery(newer=parse_time('2020-04-20'), older=parse_time('2020-04-22')),
+    FindQuery(digest='0' * 128),
+    FindQuery(),
+])
+def test_find_indexed(samples_dir, tmpdir, query):
+    snapshot = Path(tmpdir) / 'hashdiff.hsn'
+    shutil.copy(samples_dir / 'hstool' / 'hashdiff.hsn', snapshot)
+
+    with InputSource(snapshot) as input_source:
+        expected = list(find(input_source.text_lines(), query))
+
+    index = cached_index(snapshot)
+    assert (Path(tmpdir) / ('hashdiff.hsn' + INDEX_SUFFIX)).exists()
+    assert list(find_indexed(snapshot, index, query)) == expected
+
+
+def test_find_index_compressed(samples_dir):
+    assert cached_index(samples_dir / 'input_source' / 'basic.hsn.xz') is None
+
+
+@pytest.mark.parametrize('chunk', [1, 3, 4, 100])
+def test_sorted_column(chunk):
+    keys = [5., 1., 3., 1., 2., 5., 0., 4., 1., 2.]
+    offsets = [10 * i for i in range(len(keys))]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    expected = array('d', (keys[i] for i in order)).tobytes() + array('Q', (offsets[i] for i in order)).tobytes()
+    assert b''.join(_sorted_column(array('d', keys), array('Q', offsets), chunk)) == expected
@@ -0,0 +1,55 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+
+from hashdiff.hsnap.hash import file_sha512, Prefetcher, read_ahead, PIPELINE_MIN_SIZE, READ_BUFFER_SIZE
+
+
+@pytest.mark.parametrize('size', [0, 1000, PIPELINE_MIN_SIZE, PIPELINE_MIN_SIZE + 1, 5 * READ_BUFFER_SIZE + 7])
+@pytest.mark.parametrize('buffers', [0, 1, 4])
+def test_file_sha512(tmpdir, size, buffers):
+    file = Path(tmpdir) / 'file'
+    content = os.urandom(size)
+    file.write_bytes(content)
+
+    chunks = []
+    assert file_sha512(file, chunks.append, buffers=buffers) == hashlib.sha512(content).digest()
+    assert sum(chunks) == size
+
+
+def test_file_sha512_pipelined_error(tmpdir):
+    file = Path(tmpdir) / 'file'
+    file.write_bytes(bytes(PIPELINE_MIN_SIZE))
+
+    def on_chunk(_):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):  # reader thread stopped, nothing left hanging
+        file_sha512(file, on_chunk)
+
+
+def test_read_ahead(tmpdir):
+    files = []
+    for i in range(10):
+        files.append(Path(tmpdir) / str(i))
+        files[-1].write_bytes(b'x')
+
+    seen = []
+
+    def path(f):
+        seen.append(f)
+        return f if f.name != '3' else None
+
+    with Prefetcher() as prefetcher:
+        for f in read_ahead(iter(files), path, prefetcher, depth=2):
+            # at least 2 more items to be read prefetched before it is yielded
+            to_read = [g for g in files[files.index(f) + 1:] if g.name != '3']
+            assert set(to_read[:2]) <= set(seen)
+            assert f.exists()
+
+    with Prefetcher() as prefetcher:
+        assert list(read_ahead(files, path, prefetcher, depth=2, max_items=1)) == files
+    with Prefetcher() as prefetcher:
+        assert list(read_ahead(files, lambda f: None, prefetcher)) == files
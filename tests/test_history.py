@@ -0,0 +1,51 @@
+from hashdiff.common import HsnapRecord
+from hashdiff.hcmp.history import history
+
+
+def _snapshot(*files):
+    return [HsnapRecord(path=path, size=len(content), mtime=0., digest=content) for path, content in files]
+
+
+def test_history_events():
+    snapshots = [
+        _snapshot(('a', b'1'), ('b', b'2'), ('c', b'3')),
+        _snapshot(('a', b'1'), ('b', b'22'), ('d', b'3')),
+        _snapshot(('a', b'1'), ('b', b'22'), ('d', b'3'), ('e', b'5')),
+        _snapshot(('b', b'222'), ('d', b'3'), ('e', b'5')),
+    ]
+    h = history(snapshots)
+
+    assert h['a'].has_events()
+    assert (h['a'].first_seen, h['a'].last_changed, h['a'].deleted) == (0, 0, 3)
+    assert (h['b'].first_seen, h['b'].last_changed, h['b'].deleted) == (0, 3, None)
+    assert (h['c'].deleted, h['c'].moved_to) == (1, 'd')
+    assert (h['d'].first_seen, h['d'].moved_from, h['d'].last_seen) == (1, 'c', 3)
+    assert (h['e'].first_seen, h['e'].moved_from) == (2, None)
+
+
+def test_history_unchanged_and_reappeared():
+    snapshots = [
+        _snapshot(('a', b'1'), ('b', b'2')),
+        _snapshot(('a', b'1')),
+        _snapshot(('a', b'1'), ('b', b'2')),
+    ]
+    h = history(snapshots)
+    assert not h['a'].has_events()
+    assert (h['b'].deleted, h['b'].last_changed, h['b'].last_seen) == (None, 2, 2)
+
+
+def test_history_moved_from_reset():
+    snapshots = [
+        _snapshot(('a', b'1'), ('b', b'2')),
+        _snapshot(('b', b'2'), ('c', b'1')),
+        _snapshot(('b', b'2'), ('c', b'11')),
+        _snapshot(('b', b'2')),
+        _snapshot(('b', b'2'), ('c', b'3')),
+    ]
+    h = history(snapshots[:2])
+    assert h['c'].moved_from == 'a'
+    h = history(snapshots[:3])
+    assert (h['c'].moved_from, h['c'].last_changed) == (None, 2)
+    h = history(snapshots)
+    assert (h['c'].moved_from, h['c'].first_seen, h['c'].last_changed, h['c'].deleted) == (None, 1, 4, None)
+    assert h['a'].deleted == 1 and not h['b'].has_events()
@@ -1,6 +1,6 @@
 import pytest
 
-from hashdiff.humanizer import humanize_size, humanize_size_dual, humanize_time
+from hashdiff.humanizer import humanize_size, humanize_size_dual, humanize_time, parse_size
 
 
 def test_humanize_size():
@@ -53,3 +53,22 @@ def test_humanize_time():
     for x, exp in cases:
         y = humanize_time(x)
         assert (y == exp)
+
+
+def test_parse_size():
+    cases = [
+        ('0', 0),
+        ('1 byte', 1),
+        ('1023 bytes', 1023),
+        ('1 KiB', 1024),
+        ('1.5k', 1536),
+        ('10M', 10 * 1024 ** 2),
+        ('3 GB', 3 * 1024 ** 3),
+        ('2tib', 2 * 1024 ** 4),
+    ]
+    for arg, res in cases:
+        assert parse_size(arg) == res
+
+    for invalid in ['', 'M', '-1', '10 Q']:
+        with pytest.raises(ValueError):
+            parse_size(invalid)
@@ -0,0 +1,49 @@
+import re
+
+import pytest
+
+from hashdiff.matcher import PathMatcher, literal_prefix
+
+
+@pytest.mark.parametrize(('pattern', 'expected'), [
+    ('hsnap', 'hsnap'),
+    ('^hsnap/.*', 'hsnap/'),
+    ('hcmp\\\\args\\.py', 'hcmp\\args.py'),
+    ('abc?', 'ab'),
+    ('ab{2}', 'a'),
+    ('a|b', ''),
+    ('.*\\.py', ''),
+    ('\\d+', ''),
+    ('(?i)abc', ''),
+])
+def test_literal_prefix(pattern, expected):
+    assert literal_prefix(pattern) == expected
+
+
+_patterns = ['hsnap', '.*__main__\\.py', 'hcmp[\\\\/]', '(a)(b)?\\2', 'tests/(?P<x>.*)', '.*(?P<x>foo)',
+             '.*\\.txt$', 'hsnap/args', '(?P<x>x)/foo']
+_paths = ['hsnap/args.py', 'hsnap/__main__.py', 'hcmp/__main__.py', 'hcmp\\args.py', 'ab', 'abb', 'tests/x',
+          'foo', 'x/foo', 'a.txt', 'a.txt.bak', '', 'hsna']
+
+
+@pytest.mark.parametrize('path', _paths)
+def test_path_matcher_same_as_re(path):
+    matcher = PathMatcher(_patterns)
+    matches = [i for i, p in enumerate(_patterns) if re.match(p, path)]
+    assert matcher.match(path) == bool(matches)
+    assert matcher.match_index(path) == (matches[0] if matches else None)
+
+
+def test_path_matcher_empty():
+    matcher = PathMatcher([])
+    assert not matcher.match('abc')
+    assert matcher.match_index('abc') is None
+
+
+def test_path_matcher_inline_flags_not_combined():
+    patterns = ['.*a', '(?i).*b', '.*(?i:c)', '(?s).*d']
+    matcher = PathMatcher(patterns)
+    assert not matcher.match('A')
+    assert matcher.match('B') and matcher.match('C') and matcher.match('x\nd')
+    assert matcher.match_index('xB') == 1
+    assert sorted(matcher._standalone) == [1, 3]
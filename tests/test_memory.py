@@ -0,0 +1,41 @@
+import gzip
+
+import pytest
+
+from hashdiff.memory import MemoryBudget, MemoryBudgetExceeded, current_rss, estimate_records_memory, peak_rss
+
+
+def test_rss():
+    assert 0 < current_rss() <= peak_rss()
+
+
+def test_estimate_records_memory(tmp_path):
+    text = tmp_path / 'snapshot.hsn'
+    text.write_bytes(b'x' * 1000)
+    compressed = tmp_path / 'snapshot.hsn.gz'
+    compressed.write_bytes(gzip.compress(b'x' * 1000))
+    assert estimate_records_memory(text) == 2000
+    assert estimate_records_memory(compressed) == 4 * compressed.stat().st_size
+
+
+def test_budget_disabled():
+    budget = MemoryBudget()
+    items = [1, 2, 3]
+    assert budget.checked_iter('items', items) is items
+    assert budget.fits(1 << 60)
+    budget.require(1 << 60, 'everything')
+    budget.check('everything')
+
+
+def test_budget_enforced():
+    budget = MemoryBudget()
+    budget.limit = current_rss() + (1 << 30)
+    assert budget.fits(1 << 20)
+    assert not budget.fits(1 << 31)
+    with pytest.raises(MemoryBudgetExceeded, match='Comparison needs about 2 GiB'):
+        budget.require(1 << 31, 'Comparison')
+    assert list(budget.checked_iter('items', range(3))) == [0, 1, 2]
+
+    budget.limit = 1
+    with pytest.raises(MemoryBudgetExceeded, match='exceeded .* by items'):
+        list(budget.checked_iter('items', range(3)))
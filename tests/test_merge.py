@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import pytest
+
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import FileOutputSink, InputSource, read_input_file
+from hashdiff.hstool.merge import merge, UnsortedInput
+
+
+def write_snapshot(file: Path, paths):
+    with FileOutputSink(file) as sink:
+        for path in paths:
+            sink.write(HsnapRecord(path=path, size=1, mtime=0., digest=b'\x00'))
+
+
+def test_merge_unsorted(tmpdir):
+    first, second, merged = Path(tmpdir) / 'first.hsn', Path(tmpdir) / 'second.hsn', Path(tmpdir) / 'merged.hsn'
+    write_snapshot(first, ['b', 'd', 'e'])
+    write_snapshot(second, ['c', 'a', 'd'])
+
+    with pytest.raises(UnsortedInput, match='second is not sorted'):
+        merge([('first', InputSource(first)), ('second', InputSource(second))], FileOutputSink(merged))
+
+    conflicts = merge([('first', InputSource(first)), ('second', InputSource(second))], FileOutputSink(merged),
+                      sort_inputs=True)
+    assert conflicts == 0
+    assert [r.path for r in read_input_file(merged)] == ['a', 'b', 'c', 'd', 'e']
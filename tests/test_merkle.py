@@ -0,0 +1,82 @@
+from pathlib import Path
+
+from hashdiff.common import HsnapRecord
+from hashdiff.fileio import FileOutputSink, read_input_file, read_directory_records
+from hashdiff.hcmp.compare import changes
+from hashdiff.hcmp.hcmp import main
+from hashdiff.merkle import DirectoryDigests, unchanged_subtrees, in_subtrees, is_directory_record, directory_path, \
+    SubtreeMatcher, split_subtrees
+from hashdiff.normalize import NormalizePaths
+
+
+def _snapshot(*files):
+    digests = DirectoryDigests()
+    records = []
+    for path, content in files:
+        records.append(HsnapRecord(path=path, size=len(content), mtime=0., digest=content))
+        digests.add(tuple(path.split('/')), len(content), content)
+    return records, digests.records()
+
+
+def test_directory_digests():
+    _, dirs = _snapshot(('a/x', b'1'), ('a/b/y', b'2'), ('c/z', b'3'))
+    assert all(is_directory_record(d) for d in dirs)
+    by_path = dict((directory_path(d), d) for d in dirs)
+    assert set(by_path) == {'.', 'a', 'a/b', 'c'}
+    assert by_path['.'].size == 3
+    assert by_path['a'].size == 2
+
+    _, dirs_other = _snapshot(('c/z', b'3'), ('a/b/y', b'2'), ('a/x', b'1'))
+    assert set(dirs) == set(dirs_other)
+
+
+def test_unchanged_subtrees():
+    prev, prev_dirs = _snapshot(('a/x', b'1'), ('a/b/y', b'2'), ('c/z', b'3'), ('d/w', b'4'))
+    curr, curr_dirs = _snapshot(('a/x', b'1'), ('a/b/y', b'2'), ('c/z', b'33'), ('e/w', b'4'), ('f/v', b'1'))
+
+    subtrees = unchanged_subtrees(prev_dirs, curr_dirs)
+    assert subtrees == {'a', 'a/b'}
+    assert in_subtrees('a/b/y', subtrees, NormalizePaths.POSIX)
+    assert not in_subtrees('ab/y', subtrees, NormalizePaths.POSIX)
+    assert in_subtrees('a\\b\\y', subtrees, NormalizePaths.NONE)
+
+    unchanged = [r for r in prev if in_subtrees(r.path, subtrees, NormalizePaths.POSIX)]
+    pruned = changes([r for r in prev if r not in unchanged], [r for r in curr if r not in unchanged],
+                     known_unchanged=unchanged)
+    full = changes(prev, curr)
+    assert pruned == full
+    assert dict((c.name, len(c.files)) for c in pruned)['added_duplicates'] == 1
+
+
+def test_subtree_matcher():
+    subtrees = {'a', 'a/b', 'c\\d'}
+    matcher = SubtreeMatcher(subtrees, NormalizePaths.NONE)
+    paths = ['a/x', 'a/b/y', 'ab/y', 'c\\d\\z', 'c/z', 'x', 'a/x', 'ab/z']
+    assert [matcher(p) for p in paths] == [in_subtrees(p, subtrees, NormalizePaths.NONE) for p in paths]
+    assert not SubtreeMatcher(set(), NormalizePaths.POSIX)
+    assert SubtreeMatcher({'.'}, NormalizePaths.POSIX)('x')
+
+    records = [HsnapRecord(path=p, size=0, mtime=0., digest=b'') for p in paths]
+    inside, outside = split_subtrees(records, matcher)
+    assert [r.path for r in inside] == ['a/x', 'a/b/y', 'c\\d\\z', 'a/x']
+    assert [r.path for r in outside] == ['ab/y', 'c/z', 'x', 'ab/z']
+
+
+def _write(file: Path, records):
+    with FileOutputSink(file) as sink:
+        for r in records:
+            sink.write(r)
+
+
+def test_unchanged_subtrees_skipped_while_reading(tmp_path):
+    prev, prev_dirs = _snapshot(('a/x', b'1'), ('a/b/y', b'2'), ('c/z', b'3'), ('d/w', b'4'))
+    curr, curr_dirs = _snapshot(('a/x', b'1'), ('a/b/y', b'2'), ('c/z', b'33'), ('e/w', b'4'), ('f/v', b'1'))
+    _write(tmp_path / 'prev.hsn', prev + prev_dirs)
+    _write(tmp_path / 'curr.hsn', curr + curr_dirs)
+
+    assert read_directory_records(tmp_path / 'curr.hsn') == curr_dirs
+    matcher = SubtreeMatcher(unchanged_subtrees(prev_dirs, curr_dirs), NormalizePaths.POSIX)
+    kept = read_input_file(tmp_path / 'curr.hsn', skip=matcher)
+    assert [r.path for r in kept] == ['c/z', 'e/w', 'f/v']
+
+    assert main(tmp_path / 'prev.hsn', tmp_path / 'curr.hsn', NormalizePaths.POSIX) == changes(prev, curr)
@@ -1,6 +1,9 @@
+import itertools
+
 import pytest
 
-from hashdiff.normalize import normalize_path_string_heuristic, NormalizePaths
+from hashdiff.common import HsnapRecord
+from hashdiff.normalize import normalize_path_string_heuristic, NormalizePaths, PathNormalizer
 
 
 @pytest.mark.parametrize(('input'), [
@@ -33,3 +36,33 @@ def test_normalize_path_string_posix(input, expected):
 ])
 def test_normalize_path_string_windows(input, expected):
     assert normalize_path_string_heuristic(NormalizePaths.WINDOWS, input) == expected
+
+
+_TRICKY_PATHS = ['', '.', '..', 'dir/file', './dir//file/', '/root/./file', '//host/file', '///root', 'a/.hidden',
+                 'dir\\subdir\\file.bin', '.\\dir\\\\file', 'C:\\dir\\file', 'C:dir\\file', 'C:.\\file', 'C:\\',
+                 '\\dir\\file', '\\\\server\\share\\file', '\\\\?\\C:\\file', 'dir\\fi*le', 'dir\\fi\x01le',
+                 'dir/sub\\file', 'C:/dir/file', 'x\\C:\\file', 'x\\C:file', ':\\file', '1:\\file', 'dir\\a:b']
+
+
+@pytest.mark.parametrize('style', list(NormalizePaths))
+@pytest.mark.parametrize('path', _TRICKY_PATHS)
+def test_path_normalizer_same_as_heuristic(style, path):
+    normalizer = PathNormalizer(style)
+    assert normalizer(path) == normalize_path_string_heuristic(style, path)
+    assert normalizer(path) == normalize_path_string_heuristic(style, path)  # cached directory
+
+
+@pytest.mark.parametrize('style', list(NormalizePaths))
+def test_path_normalizer_exhaustive(style):
+    normalizer = PathNormalizer(style)
+    for length in range(5):
+        for chars in itertools.product(['a', '.', '/', '\\', ':', '*'], repeat=length):
+            for path in [''.join(chars), 'C:\\d\\' + ''.join(chars), '\\d\\' + ''.join(chars)]:
+                assert normalizer(path) == normalize_path_string_heuristic(style, path), path
+
+
+def test_path_normalizer_record():
+    normalizer = PathNormalizer(NormalizePaths.POSIX)
+    normalized = HsnapRecord('dir/file', 1, 2., b'digest')
+    assert normalizer.record(normalized) is normalized
+    assert normalizer.record(HsnapRecord('dir\\file', 1, 2., b'digest')) == normalized
@@ -0,0 +1,78 @@
+import pytest
+
+from hashdiff.common import HsnapRecord
+from hashdiff.hcmp.compare import changes
+from hashdiff.pathstore import PathStore, RecordCatalog, split_path, to_hsnap_records
+
+
+def _records(*files):
+    return [HsnapRecord(path=path, size=len(content), mtime=0., digest=content) for path, content in files]
+
+
+def test_split_path():
+    assert split_path('a/b/c.txt') == ('a/b/', 'c.txt')
+    assert split_path('c.txt') == ('', 'c.txt')
+    assert split_path('/c.txt') == ('/', 'c.txt')
+    assert split_path('C:\\a\\b.txt') == ('C:\\a\\', 'b.txt')
+
+
+def test_store_round_trip():
+    records = _records(('a/b/x', b'1'), ('a/b/y', b'2'), ('a/x', b'3'), ('x', b'4'), ('c\\d\\x', b'5'))
+    path_store = PathStore()
+    stored = path_store.store_all(records)
+    assert [s.to_record() for s in stored] == records
+    assert [s.path for s in stored] == [r.path for r in records]
+    assert path_store.directories == 4
+
+    # directories and names shared, also between records stored separately
+    assert stored[0].directory is stored[1].directory
+    assert stored[0].name is stored[2].name is path_store.store(records[0]).name
+    assert stored[0] == path_store.store(records[0])
+    assert stored[0] != stored[1]
+
+
+def test_to_hsnap_records():
+    records = _records(('a/x', b'1'), ('b/y', b'2'))
+    stored = PathStore().store_all(records)
+    assert to_hsnap_records((stored[0], [stored[1]])) == (records[0], [records[1]])
+    assert to_hsnap_records(records[0]) == records[0]
+
+
+def test_record_catalog():
+    records = _records(('a/b/x', b'1'), ('a/b/y', b'2'), ('a/x', b'3'), ('a/b/x', b'4'))
+    catalog = RecordCatalog(records)
+    assert len(catalog) == 3
+    assert set(catalog) == {'a/b/x', 'a/b/y', 'a/x'}
+    assert catalog['a/b/x'].digest == b'4'  # last one wins, as in a dict
+    assert catalog.get('a/b') is None
+    assert 'b/x' not in catalog
+    with pytest.raises(KeyError):
+        _ = catalog['a/y']
+
+
+def test_changes_with_path_store():
+    prev = _records(('a/b/c', b'1'), ('a/b.c', b'2'), ('a/d', b'3'), ('a/e', b'4'), ('f', b'5'), ('g', b'5'))
+    curr = _records(('a/b/c', b'1'), ('a/b.c', b'22'), ('a/dd', b'3'), ('h', b'6'), ('g', b'5'), ('i', b'1'))
+
+    path_store = PathStore()
+    with_store = changes(path_store.store_all(prev), path_store.store_all(curr), path_store=path_store)
+    without_store = changes(prev, curr)
+
+    assert with_store == without_store  # including the order
+
+
+def test_changes_with_path_store_order():
+    prev = _records(('a/b/c', b'1'), ('a/b0', b'2'), ('a/b-x', b'3'), ('a/b/d', b'4'), ('a/b.e', b'4'))
+    curr = _records(('a/b/c', b'5'), ('a/b0', b'6'), ('a/b-x', b'7'), ('z/d', b'4'), ('z/e', b'4'))
+
+    path_store = PathStore()
+    with_store = changes(path_store.store_all(prev), path_store.store_all(curr), path_store=path_store)
+    assert with_store == changes(prev, curr)
+    assert [c.path for c, _ in dict((c.name, c.files) for c in with_store)['changed']] == ['a/b-x', 'a/b/c', 'a/b0']
+
+
+def test_changes_with_path_store_duplicate():
+    records = _records(('a/b', b'1'), ('a/b', b'2'))
+    path_store = PathStore()
+    with pytest.raises(RuntimeError, match='a/b'):
+        changes(path_store.store_all(records), [], path_store=path_store)
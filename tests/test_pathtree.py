@@ -75,3 +75,14 @@ def test_queries(query, exp, sample_tree):
 def test_query_all(sample_tree):
     matches = sample_tree.query_parts(['**', '*'])
     assert len(matches) == 20
+
+
+def test_deep_tree():
+    depth = 5000
+    tree = Dir(".")
+    tree.add_parts([f'd{n}' for n in range(depth)] + ['file'])
+    tree.add([f'd{n}' for n in range(depth)] + ['other'])
+    matches = tree.query_parts(PurePosixPath('/'.join(f'd{n}' for n in range(depth))).parts)
+    assert len(matches) == 1
+    directory, _ = matches[0]
+    assert set(directory.files) == {'file', 'other'}
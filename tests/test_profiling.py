@@ -0,0 +1,58 @@
+import time
+
+from hashdiff.profiling import Profiler
+
+
+def test_profiler_disabled():
+    profiler = Profiler()
+    items = [1, 2, 3]
+    assert profiler.timed_iter('read', items) is items
+    assert profiler.timed_call('write', len) is len
+    with profiler.stage('compare'):
+        pass
+    assert [line for line in profiler.report()[2:] if not line.startswith('(other)')] == []
+
+
+def test_profiler_nested_stages():
+    profiler = Profiler()
+    profiler.enable()
+
+    def produce():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    start = time.perf_counter()
+    with profiler.stage('outer'):
+        time.sleep(0.02)
+        assert list(profiler.timed_iter('inner', produce())) == [0, 1, 2]
+        assert profiler.timed_call('call', sum)([1, 2]) == 3
+    elapsed = time.perf_counter() - start
+    profiler.disable()
+
+    stages = {line.split()[0]: line.split()[1:] for line in profiler.report()[2:]}
+    outer_wall, _, outer_calls = stages['outer'][:3]
+    inner_wall, _, inner_calls = stages['inner'][:3]
+    assert (outer_calls, inner_calls, stages['call'][2]) == ('1', '4', '1')  # 3 items and the end
+    assert float(outer_wall) >= 0.02
+    assert float(outer_wall) <= elapsed - float(inner_wall) + 0.001  # nested stages excluded, up to report rounding
+    assert float(inner_wall) >= 0.03
+
+
+def test_profiler_memory():
+    profiler = Profiler()
+    profiler.enable(memory=True)
+    with profiler.stage('outer'):
+        with profiler.stage('inner'):
+            data = bytearray(8 * 1024 * 1024)
+            del data
+        data = bytearray(1024 * 1024)
+        del data
+    profiler.disable()
+
+    report = profiler.report()
+    assert report[1].endswith('peak MiB')
+    peaks = {line.split()[0]: float(line.split()[5]) for line in report[2:] if not line.startswith(('(other)', 'Peak'))}
+    assert peaks['inner'] >= 8
+    assert peaks['outer'] >= peaks['inner']  # includes nested stages
+    assert report[-1].startswith('Peak memory: ')
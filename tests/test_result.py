@@ -0,0 +1,19 @@
+import io
+
+from hashdiff.common import HsnapRecord
+from hashdiff.hcmp.result import TsvResultSink, tsv_escape
+
+
+def test_tsv_escape():
+    assert tsv_escape('a/b.txt') == 'a/b.txt'
+    assert tsv_escape('a\tb\nc\rd\\e') == 'a\\tb\\nc\\rd\\\\e'
+
+
+def test_tsv_result_sink_escapes_paths():
+    sink = TsvResultSink()
+    sink._output_stream = io.StringIO()
+    prev = HsnapRecord(path='old\tname', size=1, mtime=0., digest=b'\x01')
+    curr = HsnapRecord(path='new\nname', size=1, mtime=0., digest=b'\x01')
+    sink.write('moved', (prev, curr))
+    line, = sink._output_stream.getvalue().splitlines()
+    assert line.split('\t') == ['moved', '1', '01', '0', 'old\\tname', 'new\\nname']
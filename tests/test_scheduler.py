@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from hashdiff.hsnap.scheduler import DeviceScheduler
+
+
+def test_workers_for():
+    scheduler = DeviceScheduler(2, {7: 1, 8: 0})
+    assert scheduler.workers_for(1) == 2
+    assert scheduler.workers_for(7) == 1
+    assert scheduler.workers_for(8) == 1
+    assert DeviceScheduler().is_sequential([1, 1])
+    assert not DeviceScheduler().is_sequential([1, 2])
+    assert not scheduler.is_sequential([1])
+    assert scheduler.is_sequential([7])
+
+
+def test_map_order_within_device():
+    items = [(i % 3, i) for i in range(30)]
+    results = list(DeviceScheduler(1, {2: 4}).map(lambda item: item[1] * 2, items, lambda item: item[0]))
+    assert sorted(results) == sorted((item, item[1] * 2) for item in items)
+    for device in range(3):
+        assert [item for item, _ in results if item[0] == device] == [item for item in items if item[0] == device]
+
+
+def test_map_devices_in_parallel():
+    barrier = threading.Barrier(2, timeout=10)
+
+    def job(item):
+        barrier.wait()  # passes only with both devices hashing at the same time
+        return item
+
+    items = [(0, 'a'), (0, 'b'), (1, 'c'), (1, 'd')]
+    assert sorted(x for x, _ in DeviceScheduler().map(job, items, lambda item: item[0])) == items
+
+
+def test_map_error():
+    def job(item):
+        if item == 3:
+            raise ValueError(item)
+        return item
+
+    with pytest.raises(ValueError):
+        list(DeviceScheduler().map(job, range(100), lambda item: 0))
+
+
+def test_map_error_cancels_remaining():
+    started = []
+
+    def job(item):
+        started.append(item)
+        if item == (0, 3):
+            raise ValueError(item)
+        return item
+
+    items = [(device, i) for i in range(50) for device in (0, 1)]
+    with pytest.raises(ValueError):
+        list(DeviceScheduler(1, {1: 2}).map(job, items, lambda item: item[0]))
+    done = list(started)
+    # device 0 ran no more than the jobs in flight with the failed one (2 per worker), device 1 did not finish either
+    assert len([item for item in done if item[0] == 0]) <= 5
+    assert len([item for item in done if item[0] == 1]) < 50
+    assert started == done  # no job left running after the error
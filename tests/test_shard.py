@@ -0,0 +1,13 @@
+from hashdiff.hstool.shard import shard_function
+
+
+def test_shard_function_stable():
+    line = 'ff00000000000001' + '0' * 112 + '\t3\t1587151291.541742\tdir/abc.txt\n'
+    assert shard_function('digest')(line, 7) == 0xff00000000000001 % 7
+    # blake2b based, must not change between versions, shards of different runs are combined
+    assert [shard_function('path')(line, n) for n in (2, 3, 10)] == [0, 2, 6]
+
+
+def test_shard_function_short_digest():
+    assert shard_function('digest')('ab\t3\t0.0\tdir/abc.txt\n', 7) == 0xab % 7
+    assert shard_function('digest')('\t0\t0.0\tdir/empty\n', 7) == 0